@@ -0,0 +1,92 @@
+import os
+import sys
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stage_metrics import stage_timer
+
+
+# --------------------------
+# 설정
+# --------------------------
+BATCH_SIZE = int(os.environ.get("FIRE_BATCH_SIZE", "16"))
+DECODE_WORKERS = int(os.environ.get("FIRE_DECODE_WORKERS", str(os.cpu_count() or 4)))
+
+
+def decode_image(img_path):
+    """이미지를 읽어 RGB로 변환 (읽기 실패 시 None)"""
+    with stage_timer("decode"):
+        img = cv2.imread(img_path)
+        if img is None:
+            return None
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def iter_decoded(img_paths, workers=DECODE_WORKERS, prefetch=BATCH_SIZE * 2):
+    """
+    스레드 풀에서 이미지를 미리 디코딩하면서 입력 순서대로 (경로, RGB 이미지)를 반환.
+    cv2.imread/cvtColor는 GIL을 놓기 때문에 추론과 디코딩이 겹쳐서 실행된다.
+    디코딩은 호출한 쪽의 컨텍스트를 복사해 실행하므로 요청별 추적(stage_metrics)에도 decode가 잡힌다.
+    최대 prefetch장까지만 앞서 읽으므로 메모리 사용량은 폴더 크기와 무관하다.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        paths = iter(img_paths)
+        for img_path in paths:
+            pending.append((img_path, pool.submit(contextvars.copy_context().run, decode_image, img_path)))
+            if len(pending) >= prefetch:
+                break
+
+        while pending:
+            img_path, future = pending.popleft()
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append((next_path, pool.submit(contextvars.copy_context().run, decode_image, next_path)))
+
+            img_rgb = future.result()
+            if img_rgb is None:
+                print(f"[Warning] 이미지를 읽을 수 없음: {img_path}")
+                continue
+            yield img_path, img_rgb
+
+
+def iter_batches(img_paths, batch_size=BATCH_SIZE, workers=DECODE_WORKERS):
+    """디코딩된 이미지를 batch_size 단위로 묶어서 반환"""
+    batch = []
+    for item in iter_decoded(img_paths, workers=workers, prefetch=batch_size * 2):
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _run_batched(run, img_paths, batch_size, workers):
+    for batch in iter_batches(img_paths, batch_size=batch_size, workers=workers):
+        paths = [img_path for img_path, _ in batch]
+        images = [img_rgb for _, img_rgb in batch]
+        for img_path, img_rgb, result in zip(paths, images, run(images)):
+            yield img_path, img_rgb, result
+
+
+def predict_batched(model, img_paths, batch_size=BATCH_SIZE, workers=DECODE_WORKERS, **predict_args):
+    """
+    배치 단위로 추론하고 결과를 이미지별로 다시 나눠서 반환 (torch 모델 전용)
+
+    Yields:
+        (img_path, img_rgb, result): result는 해당 이미지의 ultralytics Results
+    """
+    return _run_batched(lambda images: model.predict(images, **predict_args),
+                        img_paths, batch_size, workers)
+
+
+def detect_batched(model, img_paths, batch_size=BATCH_SIZE, workers=DECODE_WORKERS):
+    """
+    predict_batched와 같지만 백엔드와 무관한 Detections(xyxy, conf, cls)를 반환.
+    torch / onnx 모델 모두 사용 가능
+    """
+    return _run_batched(model.detect, img_paths, batch_size, workers)
@@ -1,195 +1,237 @@
 import os
+import sys
 import glob
 import json
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import datetime
 import csv
-from collections import defaultdict
-from pyproj import Transformer
-
-
-
-def run_script(script_name: str = "fire_bbox"):
+from itertools import groupby
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from detection_cache import DetectionCache, weights_hash
+import model_registry
+import batch_inference
+import sliced_inference
+import tracker
+import geo_projection
+import fire_track_store
+import fire_forecast
+
+
+# --------------------------
+# 설정
+# --------------------------
+IMG_FOLDER = "/mnt/external/Samples/images"
+JSON_FOLDER = "/mnt/external/Samples/labels"
+# 고해상도(타워/드론) 이미지를 타일로 나눠 추론 (작은 원거리 연기 탐지용, sliced_inference 참고)
+SLICED_INFERENCE = os.environ.get("FIRE_SLICED_INFERENCE", "0") == "1"
+# 연속 프레임을 추적해 일부 프레임만 탐지하고 연기 덩어리별 궤적을 만듦 (tracker 참고)
+TRACKING = os.environ.get("FIRE_TRACKING", "0") == "1"
+
+
+# --------------------------
+# 파일명 → fire_id
+# --------------------------
+def get_fire_id_from_filename(filename):
+    parts = filename.split("_")
+    if len(parts) >= 3:
+        return "_".join(parts[:-2])
+    return filename
+
+
+def fire_groups(img_paths):
+    """이미지 경로를 fire_id별로 묶어 (fire_id, [경로, ...]) 순서대로 반환"""
+    def fire_id_of(img_path):
+        return get_fire_id_from_filename(os.path.splitext(os.path.basename(img_path))[0])
+
+    keyed = sorted(img_paths, key=lambda p: (fire_id_of(p), os.path.basename(p)))
+    for fire_id, paths in groupby(keyed, key=fire_id_of):
+        yield fire_id, list(paths)
+
+
+def observed_rows(fire_id, data_list):
+    """시간순으로 정렬된 [(시각, bbox), ...]의 관측 데이터 행"""
+    return [{
+        "fire_id": fire_id,
+        "timestamp": t.strftime("%Y-%m-%d %H:%M:%S"),
+        "data_type": "observed",
+        "latitude_min": bbox[1],
+        "latitude_max": bbox[3],
+        "longitude_min": bbox[0],
+        "longitude_max": bbox[2]
+    } for t, bbox in data_list]
+
+
+def frame_context(img_path):
     """
-    화재 이미지 데이터셋에 대해 YOLO 추론 후,
-    WGS84 좌표 → EPSG:5181 변환 및 bbox 기록/예측 결과를 리스트로 반환
+    이미지와 같은 이름의 라벨 JSON에서 (촬영 시각, geo_bbox, gps_center)
+    라벨이 없으면 None
     """
+    base_name = os.path.splitext(os.path.basename(img_path))[0]
+    json_path = os.path.join(JSON_FOLDER, f"{base_name}.json")
+    if not os.path.exists(json_path):
+        return None
+    with open(json_path, "r") as f:
+        format_data = json.load(f)
+    geo_bbox, gps_center = geo_projection.frame_georef(format_data)
+
+    try:
+        img_time = datetime.datetime.strptime(base_name[-12:], "%Y%m%d_%H%M")
+    except:
+        img_time = datetime.datetime.now()
+    return img_time, geo_bbox, gps_center
+
+
+def envelope_frames(group_paths, detections):
+    """프레임마다 모든 박스를 묶은 투영 입력 [(시각, (박스들, 너비, 높이, geo_bbox, gps_center)), ...]"""
+    frames = []
+    for img_path in group_paths:
+        detection = detections.get(img_path)
+        if detection is None:
+            continue
 
-    # --------------------------
-    # 설정
-    # --------------------------
-    model_path = "/home/azureuser/flow/runs/detect/yolov8n_no_augmentation3/weights/best.pt"
-    img_folder = "/mnt/external/Samples/images"
-    json_folder = "/mnt/external/Samples/labels"
-
-    model = YOLO(model_path)
-
-    # 이미지 경로
-    img_paths = glob.glob(os.path.join(img_folder, "*.jpg"))
-    img_paths += glob.glob(os.path.join(img_folder, "*.png"))
-
-    # --------------------------
-    # 좌표 변환 함수
-    # --------------------------
-    transformer = Transformer.from_crs("EPSG:4326", "EPSG:5181", always_xy=True)
-
-    def image_to_geo_tm(x, y, img_width, img_height, geo_bbox=None, gps_center=None):
-        """
-        이미지 픽셀 좌표(x, y)를 위도/경도 좌표로 변환
-        - geo_bbox: [lon_min, lat_min, lon_max, lat_max] (이미지 영역 좌표)
-        - gps_center: [lon_center, lat_center] (이미지 중심 GPS 좌표)
-        """
-        if gps_center is not None:
-            lon_center, lat_center = gps_center
-            # 이미지 크기 기준으로 bbox를 중심 좌표 중심으로 변환
-            # 예: x, y 픽셀 -> lon/lat 오프셋 계산
-            lon_offset = (x - img_width / 2) / img_width * (geo_bbox[2] - geo_bbox[0] if geo_bbox else 0.001)
-            lat_offset = (y - img_height / 2) / img_height * (geo_bbox[3] - geo_bbox[1] if geo_bbox else 0.001)
-            lon = lon_center + lon_offset
-            lat = lat_center + lat_offset
-        else:
-            # 기존 geo_bbox 기준 변환
-            lon_min, lat_min, lon_max, lat_max = geo_bbox
-            lon = lon_min + (x / img_width) * (lon_max - lon_min)
-            lat = lat_min + (y / img_height) * (lat_max - lat_min)
-        return lon, lat
-
-    def get_fire_id_from_filename(filename):
-        parts = filename.split("_")
-        if len(parts) >= 3:
-            return "_".join(parts[:-2])
-        return filename
-
-    # --------------------------
-    # 관측 데이터 처리
-    # --------------------------
-    fire_data = defaultdict(list)
-    output_data = []  # 최종적으로 return할 리스트
-
-    for img_path in img_paths:
-        base_name = os.path.splitext(os.path.basename(img_path))[0]
-        fire_id = get_fire_id_from_filename(base_name)
-        print("[INFO] 처리 중 fire_id:", fire_id)
-
-        img = cv2.imread(img_path)
-        img_height, img_width = img.shape[:2]
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-        results = model.predict(img_rgb, imgsz=640, conf=0.25, iou=0.45)
-        bboxes = []
-        for result in results:
-            bboxes.extend(result.boxes.xyxy.cpu().numpy().tolist())
+        bboxes = [box[:4] for box in detection["boxes"]]
         if len(bboxes) == 0:
             print("없음")
             continue
 
-        json_path = os.path.join(json_folder, f"{base_name}.json")
-        if not os.path.exists(json_path):
+        context = frame_context(img_path)
+        if context is None:
             continue
-        with open(json_path, "r") as f:
-            format_data = json.load(f)
-
-        gps_str = format_data.get("environment", {}).get("gps", None)
-        if gps_str is not None:
-            # gps 문자열 처리
-            lat_str, lon_str = gps_str.split(",")
-            lat_center = float(lat_str.strip())
-            lon_center = float(lon_str.strip())
-
-            # gps 중심 기준으로 작은 bbox 생성 (±0.0005는 약 50m)
-            geo_bbox = [
-                lon_center - 0.0005, lat_center - 0.0005,
-                lon_center + 0.0005, lat_center + 0.0005
-            ]
-        else:
-            # 기존 geo_bbox 사용 (없으면 fallback)
-            geo_bbox = format_data.get("environment", {}).get(
-                "geo_bbox",
-                [127.0, 37.5, 127.1, 37.6]
-            )
-            lon_center = (geo_bbox[0] + geo_bbox[2]) / 2
-            lat_center = (geo_bbox[1] + geo_bbox[3]) / 2
-
-        # ✅ 여기서 gps_center 정의
-        gps_center = (lon_center, lat_center)
-
-
-        lon_min_list, lat_min_list, lon_max_list, lat_max_list = [], [], [], []
-        for bbox in bboxes:
-            x1, y1, x2, y2 = bbox
-            lon1, lat1 = image_to_geo_tm(x1, y1, img_width, img_height, geo_bbox, gps_center)
-            lon2, lat2 = image_to_geo_tm(x2, y2, img_width, img_height, geo_bbox, gps_center)
-            lon_min_list.append(lon1)
-            lat_min_list.append(lat1)
-            lon_max_list.append(lon2)
-            lat_max_list.append(lat2)
-
-        lon_min_bbox = min(lon_min_list)
-        lat_min_bbox = min(lat_min_list)
-        lon_max_bbox = max(lon_max_list)
-        lat_max_bbox = max(lat_max_list)
-
-        try:
-            img_time = datetime.datetime.strptime(base_name[-12:], "%Y%m%d_%H%M")
-        except:
-            img_time = datetime.datetime.now()
-
-        fire_data[fire_id].append((img_time, [lon_min_bbox, lat_min_bbox, lon_max_bbox, lat_max_bbox]))
-
-    # --------------------------
-    # 관측 + 예측 데이터 생성
-    # --------------------------
-    for fire_id, data_list in fire_data.items():
-        data_list.sort(key=lambda x: x[0])
-
-        # 관측 데이터 기록
-        for t, bbox in data_list:
-            output_data.append({
-                "fire_id": fire_id,
-                "timestamp": t.strftime("%Y-%m-%d %H:%M:%S"),
-                "data_type": "observed",
-                "latitude_min": bbox[1],
-                "latitude_max": bbox[3],
-                "longitude_min": bbox[0],
-                "longitude_max": bbox[2]
-            })
-
-        # 예측 데이터 기록
-        if len(data_list) < 2:
-            continue
-        deltas = [(data_list[i+1][0]-data_list[i][0]).total_seconds()
-                  for i in range(len(data_list)-1)]
-        v_lon_min = np.mean([(data_list[i+1][1][0]-data_list[i][1][0])/deltas[i]
-                             for i in range(len(deltas))])
-        v_lon_max = np.mean([(data_list[i+1][1][2]-data_list[i][1][2])/deltas[i]
-                             for i in range(len(deltas))])
-        v_lat_min = np.mean([(data_list[i+1][1][1]-data_list[i][1][1])/deltas[i]
-                             for i in range(len(deltas))])
-        v_lat_max = np.mean([(data_list[i+1][1][3]-data_list[i][1][3])/deltas[i]
-                             for i in range(len(deltas))])
-
-        last_time = data_list[-1][0]
-        last_bbox = data_list[-1][1]
-        for minutes in [10, 20, 30, 40, 50, 60]:
-            t_future = last_time + datetime.timedelta(minutes=minutes)
-            delta_future = (t_future - last_time).total_seconds()
-            lon_min_pred = last_bbox[0] + v_lon_min * delta_future
-            lon_max_pred = last_bbox[2] + v_lon_max * delta_future
-            lat_min_pred = last_bbox[1] + v_lat_min * delta_future
-            lat_max_pred = last_bbox[3] + v_lat_max * delta_future
-            output_data.append({
-                "fire_id": fire_id,
-                "timestamp": t_future.strftime("%Y-%m-%d %H:%M:%S"),
-                "data_type": "predicted",
-                "latitude_min": lat_min_pred,
-                "latitude_max": lat_max_pred,
-                "longitude_min": lon_min_pred,
-                "longitude_max": lon_max_pred
-            })
-
-    return output_data
+        img_time, geo_bbox, gps_center = context
+        frames.append((img_time, (bboxes, detection["width"], detection["height"], geo_bbox, gps_center)))
+    return frames
+
+
+def tracked_frames(fire_id, group_paths, detections, detect_one):
+    """
+    그룹 프레임을 시간 순으로 추적하며 캐시에 없는 프레임은 필요할 때만 탐지 (tracker.track_sequence)
+
+    Returns:
+        {"fire_id_T트랙번호": [(시각, ([박스], 너비, 높이, geo_bbox, gps_center)), ...]}
+    """
+    contexts = {}
+    for img_path in group_paths:
+        context = frame_context(img_path)
+        if context is not None:
+            contexts[img_path] = context
+    ordered = sorted(contexts, key=lambda p: contexts[p][0])
+    sequence = [(p, contexts[p][0], detections.get(p)) for p in ordered]
+
+    stats = {}
+    tracks = {}
+    for img_path, img_time, (img_width, img_height), ids, boxes, _ in tracker.track_sequence(
+            sequence, detect_one, stats=stats):
+        _, geo_bbox, gps_center = contexts[img_path]
+        for track_id, box in zip(ids.tolist(), boxes.tolist()):
+            tracks.setdefault(f"{fire_id}_T{track_id}", []).append(
+                (img_time, ([box], img_width, img_height, geo_bbox, gps_center)))
+    print(f"[INFO] 추적 {fire_id}: 캐시 {stats['cached']}장, 탐지 {stats['detected']}장, "
+          f"건너뜀 {stats['skipped']}장, 트랙 {len(tracks)}개")
+    return tracks
+
+
+def iter_rows(script_name: str = "fire_bbox", forecast_model: str = fire_forecast.DEFAULT_MODEL, horizon_minutes=None,
+              sliced=None, tracking=None):
+    """
+    run_script의 스트리밍 버전.
+    fire_id 그룹 하나의 추론이 끝날 때마다 그 그룹의 관측 행, 바로 이어서 예측 행을 내보낸다.
+    (전체 폴더를 다 처리할 때까지 기다리지 않고, 결과 전체를 메모리에 모으지도 않음)
+    그룹 안의 트랙(추적 시 여러 개)은 forecast_rows 한 번으로 함께 예측한다.
+    끝까지 돌면 결과를 화재 궤적 저장소(fire_track_store)에도 반영한다.
+    예측 모델/시점은 fire_forecast 참고 (기본: 선형, 10~60분 10분 간격)
+    sliced가 True면 타일 추론 (None이면 SLICED_INFERENCE 설정을 따름)
+    tracking이 True면 프레임을 추적하며 일부만 탐지하고, 트랙마다 "fire_id_T번호"로 따로 기록
+    (None이면 TRACKING 설정을 따름)
+    """
+    model_path = model_registry.active_model_path()
+    sliced = SLICED_INFERENCE if sliced is None else sliced
+    tracking = TRACKING if tracking is None else tracking
+    detect = sliced_inference.detect_sliced_batched if sliced else batch_inference.detect_batched
+
+    # 이미지 경로
+    img_paths = glob.glob(os.path.join(IMG_FOLDER, "*.jpg"))
+    img_paths += glob.glob(os.path.join(IMG_FOLDER, "*.png"))
+
+    # 캐시에 없는(새로 추가되었거나 바뀐) 이미지만 추론
+    # 타일 추론 결과는 전체 이미지 추론과 다르므로 캐시를 따로 씀
+    cache = DetectionCache(weights_hash(model_path) + (":sliced" if sliced else ""))
+    try:
+        cached_detections, pending_paths = cache.partition(img_paths)
+        print(f"[INFO] 캐시 적중 {len(cached_detections)}장, 추론 대상 {len(pending_paths)}장")
+        pending_paths = set(pending_paths)
+        track_chunks = []  # 저장소에 넣을 그룹별 열 배열 (행 dict보다 훨씬 작음)
+
+        def detect_one(img_path):
+            """추적 중 탐지가 필요한 프레임 한 장만 추론해 캐시에 저장"""
+            img_rgb = batch_inference.decode_image(img_path)
+            if img_rgb is None:
+                return None
+            model = model_registry.get_predictor(model_path)
+            det = sliced_inference.sliced_detect(model, img_rgb) if sliced else model.detect([img_rgb])[0]
+            img_height, img_width = img_rgb.shape[:2]
+            boxes = np.column_stack([det.xyxy, det.conf, det.cls]).tolist()
+            return cache.store(img_path, img_width, img_height, boxes)
+
+        for fire_id, group_paths in fire_groups(img_paths):
+            print("[INFO] 처리 중 fire_id:", fire_id)
+            if tracking:
+                tracks = tracked_frames(fire_id, group_paths, cached_detections, detect_one)
+            else:
+                pending = [p for p in group_paths if p in pending_paths]
+                if pending:
+                    # 디코딩은 스레드 풀에서 미리 진행하고, 추론은 배치 단위로 실행
+                    model = model_registry.get_predictor(model_path)
+                    for img_path, img_rgb, det in detect(model, pending):
+                        img_height, img_width = img_rgb.shape[:2]
+                        boxes = np.column_stack([det.xyxy, det.conf, det.cls]).tolist()
+                        cached_detections[img_path] = cache.store(img_path, img_width, img_height, boxes)
+                tracks = {fire_id: envelope_frames(group_paths, cached_detections)}
+
+            group_tracks, group_observed = {}, {}  # 트랙별 [(시각, bbox), ...] / 관측 행
+            for track_id, frames in tracks.items():
+                if not frames:
+                    continue
+
+                # 모든 프레임 박스를 한 번에 경위도로 변환하고 프레임별 외곽 영역 계산
+                frame_bboxes = geo_projection.frame_envelopes([frame for _, frame in frames])
+                data_list = [(img_time, bbox) for (img_time, _), bbox in zip(frames, frame_bboxes.tolist())]
+                data_list.sort(key=lambda x: x[0])
+
+                group_tracks[track_id] = data_list
+                group_observed[track_id] = observed_rows(track_id, data_list)
+
+            # --------------------------
+            # 관측 + 예측 데이터 생성 (그룹의 트랙을 (F, T, 4) 배열 한 번으로 예측,
+            # EPSG:5181 좌표는 그룹 단위로 일괄 추가)
+            # --------------------------
+            predicted = {}
+            for row in fire_forecast.forecast_rows(group_tracks, forecast_model, horizon_minutes):
+                predicted.setdefault(row["fire_id"], []).append(row)
+            group_rows = []
+            for track_id in group_tracks:
+                group_rows += group_observed[track_id] + predicted.get(track_id, [])
+            group_rows = geo_projection.project_rows(group_rows)
+            if group_rows:
+                track_chunks.append(fire_track_store.to_columns(group_rows))
+            yield from group_rows
+
+        # 이번에 처리한 fire_id 그룹은 (트랙이 사라졌거나 추적 설정이 바뀌었어도) 이번 결과로 통째로 교체
+        scopes = [fire_id for fire_id, _ in fire_groups(img_paths)]
+        fire_track_store.get_store().upsert(fire_track_store.concat_columns(track_chunks), scopes)
+    finally:
+        cache.close()
+
+
+def run_script(script_name: str = "fire_bbox", forecast_model: str = fire_forecast.DEFAULT_MODEL, horizon_minutes=None,
+               sliced=None, tracking=None):
+    """
+    화재 이미지 데이터셋에 대해 YOLO 추론 후,
+    WGS84 좌표 → EPSG:5181 변환 및 bbox 기록/예측 결과를 리스트로 반환
+    (각 행에 경위도 latitude_*/longitude_*와 EPSG:5181 tm_x_*/tm_y_*가 함께 들어감)
+    """
+    return list(iter_rows(script_name, forecast_model, horizon_minutes, sliced, tracking))
 
 if __name__ == "__main__":
     run_script()
@@ -0,0 +1,149 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+
+
+# --------------------------
+# 설정
+# --------------------------
+CACHE_PATH = os.environ.get(
+    "FIRE_DETECTION_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "detection_cache.sqlite3"),
+)
+
+_weights_hash_memo = {}
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """파일 내용의 SHA-1 해시 (대용량 파일도 청크 단위로 읽음)"""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def weights_hash(model_path):
+    """
+    모델 가중치 파일 해시.
+    (경로, mtime, 크기)가 같으면 프로세스 내에서 다시 해시하지 않음
+    """
+    st = os.stat(model_path)
+    memo_key = (os.path.abspath(model_path), st.st_mtime, st.st_size)
+    if memo_key not in _weights_hash_memo:
+        _weights_hash_memo[memo_key] = file_hash(model_path)
+    return _weights_hash_memo[memo_key]
+
+
+class DetectionCache:
+    """
+    이미지별 YOLO 탐지 결과를 저장하는 영구 캐시 (SQLite)
+
+    - 키: 이미지 경로 + 모델 가중치 해시
+    - 경로의 mtime/크기가 같으면 그대로 재사용
+    - mtime이 바뀌었더라도 내용 해시가 같으면 재사용 (touch, 복사 등)
+    - 모델 가중치가 바뀌면 모든 이미지가 새로 추론됨
+    """
+
+    def __init__(self, model_hash, db_path=CACHE_PATH):
+        self.model_hash = model_hash
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS detections (
+                path TEXT NOT NULL,
+                model_hash TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                boxes TEXT NOT NULL,
+                PRIMARY KEY (path, model_hash)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_detections_content "
+            "ON detections (content_hash, model_hash)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _entry(row):
+        width, height, boxes = row
+        return {"width": width, "height": height, "boxes": json.loads(boxes)}
+
+    def partition(self, img_paths):
+        """
+        이미지 경로 목록을 캐시 적중/미적중으로 분리
+
+        Returns:
+            hits (dict): {img_path: {"width", "height", "boxes"}}
+            misses (list): 새로 추론해야 하는 이미지 경로
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, mtime, size, content_hash, width, height, boxes "
+                "FROM detections WHERE model_hash = ?",
+                (self.model_hash,),
+            ).fetchall()
+        known = {row[0]: row[1:] for row in rows}
+        by_content = {row[3]: row[4:] for row in rows}
+
+        hits, misses, touched = {}, [], []
+        for img_path in img_paths:
+            st = os.stat(img_path)
+            row = known.get(img_path)
+            if row is not None and row[0] == st.st_mtime and row[1] == st.st_size:
+                hits[img_path] = self._entry(row[3:])
+                continue
+
+            # mtime/크기가 다르면 내용 해시로 한 번 더 확인
+            content_hash = file_hash(img_path)
+            cached = by_content.get(content_hash)
+            if cached is None:
+                misses.append(img_path)
+                continue
+            hits[img_path] = self._entry(cached)
+            touched.append((img_path, st, content_hash, cached))
+
+        if touched:
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO detections VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (path, self.model_hash, st.st_mtime, st.st_size, content_hash, *cached)
+                        for path, st, content_hash, cached in touched
+                    ],
+                )
+                self._conn.commit()
+        return hits, misses
+
+    def store(self, img_path, width, height, boxes):
+        """
+        추론 결과 저장 후 partition()과 같은 형식의 항목을 반환
+
+        Args:
+            boxes (list): [[x1, y1, x2, y2, conf, cls], ...] (픽셀 좌표)
+        """
+        st = os.stat(img_path)
+        content_hash = file_hash(img_path)
+        boxes = [[float(v) for v in box] for box in boxes]
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO detections VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (img_path, self.model_hash, st.st_mtime, st.st_size, content_hash,
+                 int(width), int(height), json.dumps(boxes)),
+            )
+            self._conn.commit()
+        return {"width": int(width), "height": int(height), "boxes": boxes}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,198 @@
+import os
+import sys
+import datetime
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stage_metrics import stage_timer
+
+
+# --------------------------
+# 설정
+# --------------------------
+DEFAULT_MODEL = os.environ.get("FIRE_FORECAST_MODEL", "linear")
+DEFAULT_STEP_MIN = int(os.environ.get("FIRE_FORECAST_STEP_MIN", 10))
+DEFAULT_HORIZON_MIN = int(os.environ.get("FIRE_FORECAST_HORIZON_MIN", 60))
+
+# 칼만 필터 잡음 (경위도 단위, 초 기준)
+KALMAN_PROCESS_NOISE = 1e-12  # 속도 변화(가속도) 분산 밀도
+KALMAN_MEASUREMENT_NOISE = 1e-8  # 관측 bbox 좌표 분산
+
+
+def horizons(step_min=DEFAULT_STEP_MIN, horizon_min=DEFAULT_HORIZON_MIN):
+    """예측 시점 목록 (분). 기본값은 [10, 20, 30, 40, 50, 60]"""
+    return list(range(step_min, horizon_min + 1, step_min))
+
+
+def pad_tracks(tracks):
+    """
+    fire_id별 [(시각, bbox), ...] 목록을 패딩된 배열로 변환 (시각순 정렬된 상태여야 함)
+
+    Returns:
+        times (F, T): 각 화재의 마지막 관측 시각 기준 경과 초 (마지막 관측 = 0)
+        boxes (F, T, 4): [lon_min, lat_min, lon_max, lat_max]
+        mask (F, T): 실제 관측 위치
+    """
+    T = max((len(track) for track in tracks), default=0)
+    times = np.zeros((len(tracks), T))
+    boxes = np.zeros((len(tracks), T, 4))
+    mask = np.zeros((len(tracks), T), dtype=bool)
+    for f, track in enumerate(tracks):
+        if not track:
+            continue
+        last_time = track[-1][0]
+        times[f, :len(track)] = [(t - last_time).total_seconds() for t, _ in track]
+        boxes[f, :len(track)] = [bbox for _, bbox in track]
+        mask[f, :len(track)] = True
+    return times, boxes, mask
+
+
+def _last(values, mask):
+    """패딩 배열에서 화재별 마지막 관측값"""
+    idx = np.maximum(mask.sum(axis=1) - 1, 0)
+    return values[np.arange(len(values)), idx]
+
+
+def linear_velocity(times, boxes, mask):
+    """
+    관측 구간별 속도의 평균 (F, 4). 기존 run_script 예측과 같은 값.
+    시각이 같은 구간(0초)은 속도를 정의할 수 없어 제외한다.
+    """
+    dt = np.diff(times, axis=1)
+    valid = mask[:, 1:] & mask[:, :-1] & (dt > 0)
+    safe_dt = np.where(valid, dt, 1.0)
+    v = np.diff(boxes, axis=1) / safe_dt[..., None]
+    count = valid.sum(axis=1)
+    return (v * valid[..., None]).sum(axis=1) / np.maximum(count, 1)[:, None]
+
+
+def forecast_linear(times, boxes, mask, h):
+    v = linear_velocity(times, boxes, mask)
+    return _last(boxes, mask)[:, None, :] + v[:, None, :] * h[None, :, None]
+
+
+def forecast_acceleration(times, boxes, mask, h):
+    """
+    b(t) = c0 + c1*t + c2*t^2 를 화재별로 최소제곱 적합 (t=0이 마지막 관측)
+    마지막 관측 bbox에서 c1*h + c2*h^2 만큼 이동. 관측 3개 미만이면 선형 모델 사용
+    """
+    w = mask.astype(np.float64)
+    # 시간 스케일을 맞춰 정규방정식의 조건수를 줄임
+    scale = np.maximum(np.abs(times).max(axis=1, keepdims=True), 1.0)
+    t = times / scale
+    # 마지막 bbox 기준 변위로 적합 (경위도 절댓값이 커서 그대로 풀면 정밀도가 떨어짐)
+    last = _last(boxes, mask)
+    A = np.stack([np.ones_like(t), t, t ** 2], axis=-1) * w[..., None]  # (F, T, 3)
+    AtA = np.einsum("fti,ftj->fij", A, A) + np.eye(3) * 1e-12
+    Atb = np.einsum("fti,ftk->fik", A, (boxes - last[:, None, :]) * w[..., None])  # (F, 3, 4)
+    coef = np.linalg.solve(AtA, Atb)
+
+    hs = h[None, :] / scale  # (F, H)
+    shift = coef[:, 1, None, :] * hs[..., None] + coef[:, 2, None, :] * (hs ** 2)[..., None]
+    pred = last[:, None, :] + shift
+
+    enough = mask.sum(axis=1) >= 3
+    return np.where(enough[:, None, None], pred, forecast_linear(times, boxes, mask, h))
+
+
+def forecast_kalman(times, boxes, mask, h,
+                    process_noise=KALMAN_PROCESS_NOISE, measurement_noise=KALMAN_MEASUREMENT_NOISE):
+    """
+    등속 칼만 필터 (상태: 좌표, 속도). 모든 화재 x 4개 좌표를 한 번에 갱신하고
+    마지막 상태에서 좌표 + 속도 * h로 외삽
+    """
+    F, T = mask.shape
+    x = boxes[:, 0, :].copy()  # 좌표 (F, 4)
+    v = np.zeros((F, 4))
+    # 공분산 [[Pxx, Pxv], [Pxv, Pvv]] (좌표마다 같으므로 (F,)로 관리)
+    Pxx = np.full(F, measurement_noise)
+    Pxv = np.zeros(F)
+    Pvv = np.full(F, 1e-6)
+
+    for k in range(1, T):
+        m = mask[:, k]
+        dt = np.where(m, times[:, k] - times[:, k - 1], 0.0)
+
+        # 예측
+        x_pred = x + v * dt[:, None]
+        q = process_noise
+        Pxx_p = Pxx + 2 * dt * Pxv + dt ** 2 * Pvv + q * dt ** 3 / 3
+        Pxv_p = Pxv + dt * Pvv + q * dt ** 2 / 2
+        Pvv_p = Pvv + q * dt
+
+        # 갱신
+        S = Pxx_p + measurement_noise
+        Kx, Kv = Pxx_p / S, Pxv_p / S
+        resid = boxes[:, k, :] - x_pred
+        x_new = x_pred + Kx[:, None] * resid
+        v_new = v + Kv[:, None] * resid
+
+        # 패딩 위치는 그대로 둠
+        x = np.where(m[:, None], x_new, x)
+        v = np.where(m[:, None], v_new, v)
+        Pxx = np.where(m, (1 - Kx) * Pxx_p, Pxx)
+        Pxv = np.where(m, (1 - Kx) * Pxv_p, Pxv)
+        Pvv = np.where(m, Pvv_p - Kv * Pxv_p, Pvv)
+
+    return x[:, None, :] + v[:, None, :] * h[None, :, None]
+
+
+MODELS = {
+    "linear": forecast_linear,
+    "acceleration": forecast_acceleration,
+    "kalman": forecast_kalman,
+}
+
+
+def forecast(times, boxes, mask, model=DEFAULT_MODEL, horizon_minutes=None):
+    """
+    여러 화재의 bbox를 한 번에 외삽
+
+    Args:
+        times, boxes, mask: pad_tracks 결과
+        model: "linear" / "acceleration" / "kalman"
+        horizon_minutes: 예측 시점 목록 (분, 기본: horizons())
+    Returns:
+        pred (F, H, 4): 시점별 예측 bbox
+        valid (F,): 관측이 2개 이상이라 예측 가능한 화재
+    """
+    if model not in MODELS:
+        raise ValueError(f"지원하지 않는 예측 모델입니다: {model} (가능: {sorted(MODELS)})")
+    if horizon_minutes is None:
+        horizon_minutes = horizons()
+    h = np.asarray(horizon_minutes, dtype=np.float64) * 60.0
+    valid = mask.sum(axis=1) >= 2
+    if boxes.shape[1] == 0:
+        return np.zeros((len(boxes), len(h), 4)), valid
+    return MODELS[model](times, boxes, mask, h), valid
+
+
+def forecast_rows(fire_tracks, model=DEFAULT_MODEL, horizon_minutes=None):
+    """
+    {fire_id: [(시각, bbox), ...]}의 예측 데이터 행 (run_script 행 형식)
+    관측이 2개 미만인 화재는 건너뜀
+    """
+    if horizon_minutes is None:
+        horizon_minutes = horizons()
+    fire_ids = list(fire_tracks)
+    with stage_timer("forecast", len(fire_ids)):
+        times, boxes, mask = pad_tracks([fire_tracks[fid] for fid in fire_ids])
+        pred, valid = forecast(times, boxes, mask, model, horizon_minutes)
+
+    rows = []
+    for f, fire_id in enumerate(fire_ids):
+        if not valid[f]:
+            continue
+        last_time = fire_tracks[fire_id][-1][0]
+        for minutes, (lon_min, lat_min, lon_max, lat_max) in zip(horizon_minutes, pred[f].tolist()):
+            t_future = last_time + datetime.timedelta(minutes=minutes)
+            rows.append({
+                "fire_id": fire_id,
+                "timestamp": t_future.strftime("%Y-%m-%d %H:%M:%S"),
+                "data_type": "predicted",
+                "latitude_min": lat_min,
+                "latitude_max": lat_max,
+                "longitude_min": lon_min,
+                "longitude_max": lon_max
+            })
+    return rows
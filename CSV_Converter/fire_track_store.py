@@ -0,0 +1,330 @@
+import os
+import re
+import fcntl
+import tempfile
+import threading
+import datetime
+import numpy as np
+
+
+# --------------------------
+# 설정
+# --------------------------
+STORE_PATH = os.environ.get(
+    "FIRE_TRACK_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "fire_tracks.npz"),
+)
+
+# 공간 인덱스 격자 크기 (0.01도는 약 1km)
+CELL_DEG = 0.01
+# 뷰포트가 이보다 많은 격자를 덮으면 격자 대신 시간 구간 전체를 바로 검사
+MAX_QUERY_CELLS = 4096
+# 행 하나가 이보다 많은 격자를 덮으면 격자에 넣지 않고 항상 검사하는 목록에 둠 (거대한 bbox로 메모리가 터지지 않게)
+MAX_ROW_CELLS = 256
+
+DATA_TYPES = ["observed", "predicted"]
+BOX_COLUMNS = [
+    "longitude_min", "latitude_min", "longitude_max", "latitude_max",
+    "tm_x_min", "tm_y_min", "tm_x_max", "tm_y_max",
+]
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_CELL_OFFSET = 1 << 20
+
+
+def to_epoch(value):
+    """'YYYY-mm-dd HH:MM:SS' 문자열/datetime(또는 그 배열)을 초 단위 int64로 변환"""
+    if isinstance(value, datetime.datetime):
+        value = value.strftime(TIME_FORMAT)
+    return np.asarray(value, dtype="datetime64[s]").astype(np.int64)
+
+
+def from_epoch(seconds):
+    """초 단위 int64 배열을 run_script와 같은 timestamp 문자열 목록으로 변환"""
+    text = np.datetime_as_string(np.asarray(seconds, dtype="datetime64[s]"), unit="s")
+    return [t.replace("T", " ") for t in text.tolist()]
+
+
+def to_columns(rows):
+    """
+    run_script 결과 행(dict) 목록을 열 배열로 변환
+
+    Returns:
+        dict: fire_id (N,) str, time (N,) int64, kind (N,) int8, boxes (N, 8) float64
+    """
+    if not rows:
+        return empty_columns()
+    return {
+        "fire_id": np.array([r["fire_id"] for r in rows], dtype=str),
+        "time": to_epoch([r["timestamp"] for r in rows]),
+        "kind": np.array([DATA_TYPES.index(r["data_type"]) for r in rows], dtype=np.int8),
+        "boxes": np.array([[r.get(c, np.nan) for c in BOX_COLUMNS] for r in rows], dtype=np.float64),
+    }
+
+
+def empty_columns():
+    return {
+        "fire_id": np.zeros(0, dtype=str),
+        "time": np.zeros(0, dtype=np.int64),
+        "kind": np.zeros(0, dtype=np.int8),
+        "boxes": np.zeros((0, len(BOX_COLUMNS)), dtype=np.float64),
+    }
+
+
+def concat_columns(chunks):
+    chunks = [c for c in chunks if len(c["time"])]
+    if not chunks:
+        return empty_columns()
+    return {key: np.concatenate([c[key] for c in chunks]) for key in chunks[0]}
+
+
+def base_fire_id(fire_id):
+    """추적 트랙 ID("fire_id_T번호")의 원래 fire_id (트랙이 아니면 그대로)"""
+    return re.sub(r"_T\d+$", "", fire_id)
+
+
+def box_extents(boxes):
+    """
+    bbox (N, 4+) 경위도를 min/max 순서로 정리한 (N, 4) [lon_min, lat_min, lon_max, lat_max]
+    (선형 예측은 한 축으로 줄어드는 화재에서 min > max인 박스를 만들 수 있음)
+    """
+    boxes = np.asarray(boxes, dtype=np.float64)
+    boxes = boxes.reshape(-1, boxes.shape[-1])[:, :4]
+    return np.hstack([np.minimum(boxes[:, :2], boxes[:, 2:4]), np.maximum(boxes[:, :2], boxes[:, 2:4])])
+
+
+def _row_keys(columns):
+    """(fire_id, 시각, 종류)를 하나로 합친 문자열 키 (행 단위 비교용)"""
+    return np.char.add(np.char.add(columns["fire_id"], "|"),
+                       (columns["time"] * len(DATA_TYPES) + columns["kind"]).astype(str))
+
+
+def _cell_keys(ix, iy):
+    return ((ix + _CELL_OFFSET) << 21) | (iy + _CELL_OFFSET)
+
+
+class FireTrackStore:
+    """
+    fire_id/시각별 bbox를 열 배열(.npz)로 저장하는 화재 궤적 저장소
+
+    - 행은 시각 순으로 정렬되어 있어 시간 구간은 이진 탐색으로 자름
+    - 경위도 격자 → 행 번호 인덱스(CSR)로 뷰포트와 겹치는 행만 후보로 뽑음
+    - 다른 프로세스가 파일을 갱신하면 다음 조회 때 다시 읽음
+    """
+
+    def __init__(self, path=STORE_PATH, cell_deg=CELL_DEG):
+        self.path = path
+        self.cell_deg = cell_deg
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._set(empty_columns())
+        self.refresh()
+
+    def __len__(self):
+        return len(self.time)
+
+    # --------------------------
+    # 저장 / 로드
+    # --------------------------
+    def _set(self, columns):
+        # 시각(같으면 fire_id) 순으로 정렬
+        fire_names, fire_code = np.unique(columns["fire_id"], return_inverse=True)
+        order = np.lexsort((columns["kind"], fire_code, columns["time"]))
+        self.fire_names = fire_names
+        self.fire_code = fire_code[order].astype(np.int32)
+        self.time = columns["time"][order]
+        self.kind = columns["kind"][order]
+        self.boxes = columns["boxes"][order]
+        self._build_grid()
+
+    def _columns(self):
+        return {
+            "fire_id": self.fire_names[self.fire_code] if len(self.fire_names) else np.zeros(0, dtype=str),
+            "time": self.time,
+            "kind": self.kind,
+            "boxes": self.boxes,
+        }
+
+    def refresh(self):
+        """파일이 바뀌었으면 다시 읽음"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with np.load(self.path) as data:
+                self.fire_names = data["fire_names"]
+                self.fire_code = data["fire_code"]
+                self.time = data["time"]
+                self.kind = data["kind"]
+                self.boxes = data["boxes"]
+            self._build_grid()
+            self._mtime = mtime
+
+    def _file_lock(self):
+        """여러 프로세스(작업 워커, API 워커)의 읽기-병합-저장을 직렬화하는 파일 잠금"""
+        lock_file = open(self.path + ".lock", "a")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def save(self):
+        # 임시 파일 이름을 프로세스마다 다르게 만들어 서로 덮어쓰지 않게 함
+        # (이름이 "<저장소 파일>."로 시작해야 .gitignore의 fire_tracks.npz* 에 걸림)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                        prefix=os.path.basename(self.path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, fire_names=self.fire_names, fire_code=self.fire_code,
+                         time=self.time, kind=self.kind, boxes=self.boxes)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def upsert(self, columns, scopes=None, replace_kinds=None):
+        """
+        새 열 배열을 반영하고 저장. 새로 들어온 fire_id의 기존 행은 모두 교체된다.
+        (run_script는 fire_id마다 관측/예측을 통째로 다시 계산하므로)
+
+        scopes: 이번 실행이 다시 계산한 원래 fire_id 목록. 주면 그 fire_id와 트랙("fire_id_T번호")의
+            기존 행을 (이번에 만들어지지 않았더라도) 모두 지움 (추적을 켜고/끄고 돌렸거나 트랙이 사라진 경우)
+        replace_kinds: 주면 새로 들어온 fire_id의 기존 행 중 이 종류("observed"/"predicted")만 통째로 교체하고,
+            나머지 종류는 (fire_id, 시각, 종류)가 같은 행만 교체해 새 행을 덧붙임 (스트림은 새 관측만 보내므로)
+        """
+        lock_file = self._file_lock()
+        try:
+            self.refresh()
+            with self._lock:
+                current = self._columns()
+                stale = np.isin(current["fire_id"], np.unique(columns["fire_id"]))
+                if replace_kinds is not None:
+                    kinds = [DATA_TYPES.index(k) for k in replace_kinds]
+                    stale &= np.isin(current["kind"], kinds) | np.isin(_row_keys(current), _row_keys(columns))
+                if scopes is not None and len(current["fire_id"]):
+                    bases = np.array([base_fire_id(f) for f in self.fire_names.tolist()], dtype=str)
+                    stale |= np.isin(bases, np.asarray(list(scopes), dtype=str))[self.fire_code]
+                kept = {key: value[~stale] for key, value in current.items()}
+                self._set(concat_columns([kept, columns]))
+                self.save()
+        finally:
+            lock_file.close()
+
+    def upsert_rows(self, rows, scopes=None, replace_kinds=None):
+        self.upsert(to_columns(rows), scopes, replace_kinds)
+
+    # --------------------------
+    # 공간 인덱스
+    # --------------------------
+    def _cell_range(self, lon_min, lat_min, lon_max, lat_max):
+        ix0 = np.floor(np.asarray(lon_min) / self.cell_deg).astype(np.int64)
+        iy0 = np.floor(np.asarray(lat_min) / self.cell_deg).astype(np.int64)
+        ix1 = np.floor(np.asarray(lon_max) / self.cell_deg).astype(np.int64)
+        iy1 = np.floor(np.asarray(lat_max) / self.cell_deg).astype(np.int64)
+        return ix0, iy0, ix1, iy1
+
+    def _build_grid(self):
+        """
+        각 행의 bbox가 덮는 격자마다 (격자 키, 행 번호) 쌍을 만들고 키 순으로 정렬
+        MAX_ROW_CELLS보다 많은 격자를 덮는 행은 overflow_rows에 따로 두고 뷰포트 조회 때마다 직접 검사
+        """
+        self.extents = box_extents(self.boxes)
+        # 좌표가 없는(NaN) 행은 어느 격자에도 넣지 않음
+        valid = np.isfinite(self.extents).all(axis=1)
+        # 격자 수는 정수로 바꾸기 전에 실수로 계산 (아주 큰 좌표도 넘치지 않게)
+        cells = np.floor(np.where(valid[:, None], self.extents, 0.0) / self.cell_deg)
+        oversized = valid & (cells[:, 2] - cells[:, 0] + 1 > MAX_ROW_CELLS / (cells[:, 3] - cells[:, 1] + 1))
+        self.overflow_rows = np.flatnonzero(oversized)
+        valid &= ~oversized
+        ix0, iy0, ix1, iy1 = self._cell_range(*np.where(valid[:, None], self.extents, 0.0).T)
+        width = ix1 - ix0 + 1
+        counts = np.where(valid, width * (iy1 - iy0 + 1), 0)
+
+        rows = np.repeat(np.arange(len(counts)), counts)
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        local = np.arange(counts.sum()) - starts
+        keys = _cell_keys(ix0[rows] + local % width[rows], iy0[rows] + local // width[rows])
+
+        order = np.argsort(keys, kind="stable")
+        self.cell_keys = keys[order]
+        self.cell_rows = rows[order]
+
+    def _viewport_rows(self, viewport):
+        """뷰포트와 같은 격자에 걸친 행 + overflow 행 번호 (후보, 중복 제거됨). 격자가 너무 많으면 None"""
+        ix0, iy0, ix1, iy1 = (int(v) for v in self._cell_range(*box_extents(viewport)[0]))
+        if (ix1 - ix0 + 1) * (iy1 - iy0 + 1) > MAX_QUERY_CELLS:
+            return None
+        gx, gy = np.meshgrid(np.arange(ix0, ix1 + 1), np.arange(iy0, iy1 + 1))
+        keys = _cell_keys(gx.ravel(), gy.ravel())
+        lo = np.searchsorted(self.cell_keys, keys, side="left")
+        hi = np.searchsorted(self.cell_keys, keys, side="right")
+        hits = [self.cell_rows[a:b] for a, b in zip(lo.tolist(), hi.tolist()) if b > a]
+        return np.unique(np.concatenate(hits + [self.overflow_rows]))
+
+    # --------------------------
+    # 조회
+    # --------------------------
+    def query(self, t0=None, t1=None, viewport=None, data_type=None, fire_id=None):
+        """
+        시간 구간 [t0, t1]과 지도 뷰포트에 걸친 행을 run_script와 같은 dict 형식으로 반환
+
+        Args:
+            t0, t1: 'YYYY-mm-dd HH:MM:SS' 문자열 또는 datetime (None이면 제한 없음)
+            viewport: (lon_min, lat_min, lon_max, lat_max) (None이면 전체)
+            data_type: "observed" / "predicted" (None이면 둘 다)
+            fire_id: 특정 화재만 조회
+        """
+        self.refresh()
+        with self._lock:
+            lo = 0 if t0 is None else int(np.searchsorted(self.time, to_epoch(t0), side="left"))
+            hi = len(self.time) if t1 is None else int(np.searchsorted(self.time, to_epoch(t1), side="right"))
+
+            rows = None
+            if viewport is not None:
+                rows = self._viewport_rows(viewport)
+            if rows is None:
+                rows = np.arange(lo, hi)
+            else:
+                rows = rows[(rows >= lo) & (rows < hi)]
+
+            mask = np.ones(len(rows), dtype=bool)
+            if viewport is not None:
+                lon_min, lat_min, lon_max, lat_max = box_extents(viewport)[0]
+                extents = self.extents[rows]
+                mask &= (extents[:, 0] <= lon_max) & (extents[:, 2] >= lon_min)
+                mask &= (extents[:, 1] <= lat_max) & (extents[:, 3] >= lat_min)
+            if data_type is not None:
+                mask &= self.kind[rows] == DATA_TYPES.index(data_type)
+            if fire_id is not None:
+                code = np.searchsorted(self.fire_names, fire_id)
+                if code >= len(self.fire_names) or self.fire_names[code] != fire_id:
+                    return []
+                mask &= self.fire_code[rows] == code
+            rows = rows[mask]
+
+            fire_ids = self.fire_names[self.fire_code[rows]].tolist()
+            timestamps = from_epoch(self.time[rows])
+            kinds = self.kind[rows].tolist()
+            boxes = self.boxes[rows].tolist()
+
+        result = []
+        for fid, ts, kind, box in zip(fire_ids, timestamps, kinds, boxes):
+            row = {"fire_id": fid, "timestamp": ts, "data_type": DATA_TYPES[kind]}
+            row.update(zip(BOX_COLUMNS, box))
+            result.append(row)
+        return result
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store(path=STORE_PATH):
+    """프로세스 전체에서 공유하는 저장소 (run_script와 서버가 같은 객체를 씀)"""
+    global _store
+    with _store_lock:
+        if _store is None or _store.path != path:
+            _store = FireTrackStore(path)
+        return _store
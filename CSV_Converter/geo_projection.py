@@ -0,0 +1,134 @@
+import os
+import sys
+import numpy as np
+from pyproj import Transformer
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stage_metrics import stage_timer
+
+
+# WGS84 경위도 → EPSG:5181 (중부원점 TM, 단위 m)
+_transformer = None
+
+# gps 중심 기준으로 만드는 작은 영역 (±0.0005는 약 50m)
+GPS_HALF_SPAN = 0.0005
+DEFAULT_GEO_BBOX = [127.0, 37.5, 127.1, 37.6]
+
+
+def get_transformer():
+    global _transformer
+    if _transformer is None:
+        _transformer = Transformer.from_crs("EPSG:4326", "EPSG:5181", always_xy=True)
+    return _transformer
+
+
+def frame_georef(format_data):
+    """
+    라벨 JSON의 environment 정보에서 이미지 영역 좌표를 구함
+
+    Returns:
+        geo_bbox: [lon_min, lat_min, lon_max, lat_max] (이미지 영역 좌표)
+        gps_center: (lon_center, lat_center) (이미지 중심 GPS 좌표)
+    """
+    environment = format_data.get("environment", {})
+    gps_str = environment.get("gps", None)
+    if gps_str is not None:
+        # gps 문자열 처리 ("위도, 경도")
+        lat_str, lon_str = gps_str.split(",")
+        lat_center = float(lat_str.strip())
+        lon_center = float(lon_str.strip())
+        geo_bbox = [
+            lon_center - GPS_HALF_SPAN, lat_center - GPS_HALF_SPAN,
+            lon_center + GPS_HALF_SPAN, lat_center + GPS_HALF_SPAN
+        ]
+    else:
+        # 기존 geo_bbox 사용 (없으면 fallback)
+        geo_bbox = environment.get("geo_bbox", DEFAULT_GEO_BBOX)
+        lon_center = (geo_bbox[0] + geo_bbox[2]) / 2
+        lat_center = (geo_bbox[1] + geo_bbox[3]) / 2
+    return geo_bbox, (lon_center, lat_center)
+
+
+def boxes_to_geo(boxes, img_width, img_height, geo_bbox, gps_center=None):
+    """
+    픽셀 bbox (N, 4) [x1, y1, x2, y2]를 경위도 (N, 4) [lon1, lat1, lon2, lat2]로 한 번에 변환.
+    img_width/img_height/geo_bbox/gps_center는 전체 공통 값이거나 박스별 배열((N,), (N, 4), (N, 2))
+
+    - gps_center가 있으면: 중심 좌표 + (픽셀 - 이미지 중심) 비율 * geo_bbox 크기
+    - 없으면: geo_bbox 안에서 픽셀 위치 비율로 보간
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    width = np.asarray(img_width, dtype=np.float64).reshape(-1, 1)
+    height = np.asarray(img_height, dtype=np.float64).reshape(-1, 1)
+    size = np.concatenate([width, height, width, height], axis=1)
+
+    geo_bbox = np.asarray(geo_bbox, dtype=np.float64).reshape(-1, 4)
+    span = (geo_bbox[:, 2:] - geo_bbox[:, :2])[:, [0, 1, 0, 1]]
+
+    if gps_center is not None:
+        center = np.asarray(gps_center, dtype=np.float64).reshape(-1, 2)[:, [0, 1, 0, 1]]
+        return center + (boxes - size / 2) / size * span
+    return geo_bbox[:, [0, 1, 0, 1]] + boxes / size * span
+
+
+def envelopes(geo_boxes, counts):
+    """
+    프레임별 박스들을 하나로 감싸는 영역 [lon_min, lat_min, lon_max, lat_max]
+
+    Args:
+        geo_boxes (N, 4): 프레임 순서대로 이어 붙인 경위도 박스
+        counts (F,): 프레임별 박스 수 (0보다 커야 함)
+    Returns:
+        (F, 4)
+    """
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.intp)
+    mins = np.minimum.reduceat(geo_boxes[:, :2], offsets, axis=0)
+    maxs = np.maximum.reduceat(geo_boxes[:, 2:], offsets, axis=0)
+    return np.concatenate([mins, maxs], axis=1)
+
+
+def frame_envelopes(frames):
+    """
+    여러 프레임을 한 번에 투영
+
+    Args:
+        frames: [(boxes (n, 4), img_width, img_height, geo_bbox, gps_center), ...]
+    Returns:
+        (F, 4) 프레임별 [lon_min, lat_min, lon_max, lat_max]
+    """
+    if not frames:
+        return np.zeros((0, 4))
+    with stage_timer("geo", len(frames)):
+        counts = np.array([len(f[0]) for f in frames])
+        boxes = np.concatenate([np.asarray(f[0], dtype=np.float64).reshape(-1, 4) for f in frames])
+        geo = boxes_to_geo(
+            boxes,
+            np.repeat([f[1] for f in frames], counts),
+            np.repeat([f[2] for f in frames], counts),
+            np.repeat([f[3] for f in frames], counts, axis=0),
+            np.repeat([f[4] for f in frames], counts, axis=0),
+        )
+        return envelopes(geo, counts)
+
+
+def to_tm(lon, lat):
+    """경위도 배열을 EPSG:5181 (x, y) 배열로 한 번에 변환"""
+    return get_transformer().transform(np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64))
+
+
+def project_rows(rows):
+    """
+    run_script 결과 행들에 EPSG:5181 좌표(tm_x_min, tm_y_min, tm_x_max, tm_y_max)를 추가.
+    모든 행을 한 번의 pyproj 호출로 변환한다.
+    """
+    if not rows:
+        return rows
+    with stage_timer("geo", len(rows)):
+        lon = np.array([[r["longitude_min"], r["longitude_max"]] for r in rows])
+        lat = np.array([[r["latitude_min"], r["latitude_max"]] for r in rows])
+        x, y = to_tm(lon.ravel(), lat.ravel())
+        x, y = x.reshape(-1, 2), y.reshape(-1, 2)
+        for r, (x_min, x_max), (y_min, y_max) in zip(rows, x.tolist(), y.tolist()):
+            r["tm_x_min"], r["tm_x_max"] = x_min, x_max
+            r["tm_y_min"], r["tm_y_max"] = y_min, y_max
+    return rows
@@ -0,0 +1,150 @@
+import os
+import sys
+import threading
+from collections import namedtuple
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from detection_cache import weights_hash
+from stage_metrics import stage_timer
+
+
+# --------------------------
+# 설정
+# --------------------------
+DEFAULT_MODEL_PATH = os.environ.get(
+    "FIRE_MODEL_PATH",
+    "/home/azureuser/flow/runs/detect/yolov8n_no_augmentation3/weights/best.pt",
+)
+PREDICT_ARGS = {"imgsz": 640, "conf": 0.25, "iou": 0.45, "verbose": False}
+
+# 백엔드(torch/onnx)와 무관한 이미지별 탐지 결과 (원본 픽셀 좌표 numpy 배열)
+Detections = namedtuple("Detections", ["xyxy", "conf", "cls"])
+
+
+class Predictor:
+    """
+    프로세스 내에서 공유되는 YOLO 모델 래퍼
+
+    ultralytics 모델은 predict 중 내부 상태를 바꾸므로 호출을 lock으로 직렬화한다.
+    """
+
+    def __init__(self, model_path):
+        from ultralytics import YOLO
+
+        self.model_path = model_path
+        self.weights_hash = weights_hash(model_path)
+        self._model = YOLO(model_path)
+        self._lock = threading.Lock()
+
+    def warmup(self, imgsz=640):
+        """더미 입력으로 한 번 추론해 첫 요청의 지연을 없앰"""
+        self.predict(np.zeros((imgsz, imgsz, 3), dtype=np.uint8))
+
+    def predict(self, source, **kwargs):
+        """model.predict와 동일 (기본 인자: imgsz=640, conf=0.25, iou=0.45)"""
+        args = {**PREDICT_ARGS, **kwargs}
+        with self._lock:
+            return self._model.predict(source, **args)
+
+    def detect(self, images, **kwargs):
+        """predict 결과를 이미지별 Detections로 변환 (전처리가 ultralytics 안에 있어 predict 단계로 함께 측정)"""
+        with stage_timer("predict", len(images) if isinstance(images, list) else 1):
+            return [
+                Detections(
+                    result.boxes.xyxy.cpu().numpy(),
+                    result.boxes.conf.cpu().numpy(),
+                    result.boxes.cls.cpu().numpy(),
+                )
+                for result in self.predict(images, **kwargs)
+            ]
+
+
+def create_predictor(model_path):
+    """
+    가중치 형식에 맞는 탐지기 생성
+    - .onnx: onnxruntime 백엔드 (torch를 import하지 않음)
+      FIRE_SHARED_WEIGHTS=1이면 공유 메모리 가중치를 매핑 (shared_weights 참고)
+    - 그 외(.pt): ultralytics YOLO
+    """
+    if model_path.endswith(".onnx"):
+        from onnx_backend import OnnxDetector
+        import shared_weights
+
+        return OnnxDetector(model_path, shared=shared_weights.ENABLED)
+    return Predictor(model_path)
+
+
+# --------------------------
+# 프로세스 전역 레지스트리
+# --------------------------
+_lock = threading.Lock()
+_load_lock = threading.Lock()
+_predictors = {}
+_active_path = DEFAULT_MODEL_PATH
+
+
+def _current(model_path):
+    with _lock:
+        predictor = _predictors.get(model_path)
+    if predictor is not None and predictor.weights_hash == weights_hash(model_path):
+        return predictor
+    return None
+
+
+def load(model_path=None, warmup=True):
+    """
+    모델을 로드(이미 있으면 재사용)해서 반환.
+    가중치 파일이 같은 경로에서 교체된 경우(재학습 등) 새로 로드한다.
+    """
+    model_path = model_path or _active_path
+    predictor = _current(model_path)
+    if predictor is not None:
+        return predictor
+
+    # 같은 모델을 여러 스레드가 동시에 로드하지 않도록 로드 자체는 별도 lock
+    with _load_lock:
+        predictor = _current(model_path)
+        if predictor is not None:
+            return predictor
+
+        print(f"[INFO] 모델 로드: {model_path}")
+        predictor = create_predictor(model_path)
+        if warmup:
+            predictor.warmup()
+        with _lock:
+            _predictors[model_path] = predictor
+        return predictor
+
+
+def get_predictor(model_path=None):
+    """공유 Predictor 반환 (model_path가 없으면 현재 활성 모델)"""
+    return load(model_path)
+
+
+def active_model_path():
+    return _active_path
+
+
+def set_active(model_path):
+    """모델을 로드하지 않고 활성 경로만 바꿈 (다음 get_predictor에서 로드)"""
+    global _active_path
+    with _lock:
+        _active_path = model_path
+
+
+def swap(model_path):
+    """
+    재시작 없이 활성 모델 교체.
+    새 모델을 먼저 로드/워밍업한 뒤 바꾸므로 교체 중인 요청은 기존 모델을 그대로 사용한다.
+    """
+    global _active_path
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"모델 파일이 없습니다: {model_path}")
+
+    predictor = load(model_path)
+    with _lock:
+        old_path, _active_path = _active_path, model_path
+        if old_path != model_path:
+            _predictors.pop(old_path, None)
+    return predictor
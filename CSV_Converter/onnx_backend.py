@@ -0,0 +1,175 @@
+import os
+import sys
+import numpy as np
+import cv2
+import onnxruntime as ort
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from detection_cache import weights_hash
+from model_registry import Detections
+from stage_metrics import stage_timer
+
+
+# --------------------------
+# 전처리 / 후처리 (NumPy)
+# --------------------------
+def letterbox(img, new_shape=640, color=(114, 114, 114)):
+    """
+    비율을 유지한 채 new_shape 정사각형에 맞추고 남는 부분은 패딩 (ultralytics와 동일한 방식)
+
+    Returns:
+        padded (np.ndarray), ratio (float), (pad_w, pad_h)
+    """
+    h, w = img.shape[:2]
+    ratio = min(new_shape / h, new_shape / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    pad_w, pad_h = (new_shape - new_w) / 2, (new_shape - new_h) / 2
+
+    if (w, h) != (new_w, new_h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_h - 0.1)), int(round(pad_h + 0.1))
+    left, right = int(round(pad_w - 0.1)), int(round(pad_w + 0.1))
+    padded = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return padded, ratio, (pad_w, pad_h)
+
+
+def box_iou(box, boxes):
+    """box(4,) 하나와 boxes(N, 4) 전체의 IoU"""
+    xx1 = np.maximum(box[0], boxes[:, 0])
+    yy1 = np.maximum(box[1], boxes[:, 1])
+    xx2 = np.minimum(box[2], boxes[:, 2])
+    yy2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def nms(boxes, scores, iou_thres=0.45):
+    """
+    점수 순 greedy NMS. 한 번 선택할 때마다 남은 후보 전체와의 IoU를 한 번에 계산한다.
+
+    Returns:
+        keep (np.ndarray): 남길 인덱스 (점수 내림차순)
+    """
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        if order.size == 1:
+            break
+        ious = box_iou(boxes[i], boxes[order[1:]])
+        order = order[1:][ious <= iou_thres]
+    return np.array(keep, dtype=np.int64)
+
+
+def postprocess(output, ratio, pad, orig_shape, conf_thres=0.25, iou_thres=0.45,
+                max_det=300, max_nms=30000):
+    """
+    YOLOv8 ONNX 출력 한 장 분량 (4 + nc, anchors)을 원본 이미지 좌표의 Detections로 변환
+    """
+    preds = output.T  # (anchors, 4 + nc)
+    scores_all = preds[:, 4:]
+    cls = scores_all.argmax(axis=1)
+    conf = scores_all[np.arange(len(cls)), cls]
+
+    mask = conf > conf_thres
+    preds, conf, cls = preds[mask], conf[mask], cls[mask]
+    if len(conf) == 0:
+        empty = np.zeros((0,), dtype=np.float32)
+        return Detections(np.zeros((0, 4), dtype=np.float32), empty, empty)
+    if len(conf) > max_nms:
+        top = conf.argsort()[::-1][:max_nms]
+        preds, conf, cls = preds[top], conf[top], cls[top]
+
+    # cx, cy, w, h -> x1, y1, x2, y2
+    xy, wh = preds[:, :2], preds[:, 2:4]
+    xyxy = np.concatenate([xy - wh / 2, xy + wh / 2], axis=1)
+
+    # 클래스별 NMS: 클래스마다 좌표를 충분히 떨어뜨려 한 번에 처리
+    offsets = cls[:, None].astype(np.float32) * 7680
+    keep = nms(xyxy + offsets, conf, iou_thres)[:max_det]
+    xyxy, conf, cls = xyxy[keep], conf[keep], cls[keep]
+
+    # 패딩 제거 후 원본 크기로 되돌림
+    xyxy[:, [0, 2]] -= pad[0]
+    xyxy[:, [1, 3]] -= pad[1]
+    xyxy /= ratio
+    h, w = orig_shape[:2]
+    xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+    xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+    return Detections(xyxy.astype(np.float32), conf.astype(np.float32), cls.astype(np.float32))
+
+
+# --------------------------
+# ONNX Runtime 탐지기
+# --------------------------
+class OnnxDetector:
+    """
+    convert_to_onnx.py로 내보낸 YOLOv8 .onnx 모델을 onnxruntime으로 실행 (torch 불필요)
+
+    model_registry.Predictor와 같은 detect()/warmup() 인터페이스를 제공한다.
+    shared=True면 shared_weights로 게시한 공유 메모리 가중치를 매핑해서 쓴다 (프로세스마다 복사하지 않음).
+    """
+
+    def __init__(self, model_path, imgsz=640, conf=0.25, iou=0.45, num_threads=None, shared=False):
+        self.model_path = model_path
+        self.weights_hash = weights_hash(model_path)
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        session_path = model_path
+        if shared:
+            import shared_weights
+
+            session_path = shared_weights.publish(model_path)
+            shared_weights.session_options(options)
+        self.session = ort.InferenceSession(session_path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # 기본 export는 batch=1 고정, dynamic=True로 내보낸 모델만 여러 장을 한 번에 실행
+        self.fixed_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+
+    def warmup(self):
+        self.detect(np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8))
+
+    def preprocess(self, images):
+        """RGB 이미지 목록 -> (N, 3, imgsz, imgsz) float32 텐서와 복원 정보"""
+        batch, meta = [], []
+        for img in images:
+            padded, ratio, pad = letterbox(img, self.imgsz)
+            batch.append(padded)
+            meta.append((ratio, pad, img.shape))
+        tensor = np.ascontiguousarray(np.stack(batch).transpose(0, 3, 1, 2), dtype=np.float32) / 255.0
+        return tensor, meta
+
+    def detect(self, images, conf=None):
+        """
+        Args:
+            images: RGB 이미지 한 장 또는 목록
+            conf: 이번 호출의 신뢰도 임계값 (None이면 서빙 기본값 self.conf, mAP 측정은 0.001 등 낮은 값)
+        Returns:
+            list[Detections]: 이미지별 xyxy / conf / cls 배열
+        """
+        if isinstance(images, np.ndarray):
+            images = [images]
+        with stage_timer("preprocess", len(images)):
+            tensor, meta = self.preprocess(images)
+
+        with stage_timer("predict", len(images)):
+            step = self.fixed_batch or len(images)
+            outputs = []
+            for start in range(0, len(images), step):
+                outputs.append(self.session.run(None, {self.input_name: tensor[start:start + step]})[0])
+            outputs = np.concatenate(outputs, axis=0)
+
+            return [
+                postprocess(output, ratio, pad, shape, self.conf if conf is None else conf, self.iou)
+                for output, (ratio, pad, shape) in zip(outputs, meta)
+            ]
@@ -0,0 +1,86 @@
+import os
+import sys
+import mmap
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from detection_cache import weights_hash
+
+
+# --------------------------
+# 설정
+# --------------------------
+# tmpfs(/dev/shm)에 둔 가중치 파일은 모든 프로세스가 같은 물리 메모리 페이지를 mmap으로 공유
+SHARED_DIR = os.environ.get("FIRE_SHARED_WEIGHTS_DIR", "/dev/shm/fire_weights")
+ENABLED = os.environ.get("FIRE_SHARED_WEIGHTS", "0") == "1"
+SIZE_THRESHOLD = 1024  # 이보다 작은 텐서는 모델 파일 안에 그대로 둠
+ALIGNMENT = max(mmap.ALLOCATIONGRANULARITY, 1 << 16)  # onnxruntime이 복사 없이 mmap하려면 오프셋 정렬 필요
+
+
+def shared_paths(model_path, shared_dir=SHARED_DIR):
+    """가중치 해시 기준 공유 (.onnx 그래프, .bin 가중치) 경로"""
+    stem = os.path.join(shared_dir, weights_hash(model_path)[:16])
+    return stem + ".onnx", stem + ".bin"
+
+
+def publish(model_path, shared_dir=SHARED_DIR):
+    """
+    ONNX 모델의 큰 initializer를 공유 메모리 디렉터리의 외부 데이터 파일 하나로 옮겨 저장하고
+    공유용 .onnx 경로를 반환 (이미 있으면 그대로 사용)
+
+    런처가 워커를 띄우기 전에 한 번 호출하면, 각 워커는 session_options()로 세션을 만들 때
+    가중치를 복사하지 않고 같은 페이지를 매핑한다. (onnx 패키지는 새로 만들 때만 필요)
+    """
+    onnx_path, data_path = shared_paths(model_path, shared_dir)
+    if os.path.exists(onnx_path) and os.path.exists(data_path):
+        return onnx_path
+
+    import onnx
+    from onnx import TensorProto
+
+    os.makedirs(shared_dir, exist_ok=True)
+    model = onnx.load(model_path)
+    tmp_data = data_path + f".{os.getpid()}.tmp"
+    offset = 0
+    with open(tmp_data, "wb") as f:
+        for init in model.graph.initializer:
+            data = init.raw_data
+            if len(data) < SIZE_THRESHOLD:
+                continue
+            offset = -(-offset // ALIGNMENT) * ALIGNMENT
+            f.seek(offset)
+            f.write(data)
+            init.ClearField("raw_data")
+            init.data_location = TensorProto.EXTERNAL
+            del init.external_data[:]
+            for key, value in (("location", os.path.basename(data_path)), ("offset", str(offset)), ("length", str(len(data)))):
+                entry = init.external_data.add()
+                entry.key, entry.value = key, value
+            offset += len(data)
+    os.replace(tmp_data, data_path)
+
+    tmp_onnx = onnx_path + f".{os.getpid()}.tmp"
+    onnx.save(model, tmp_onnx)
+    os.replace(tmp_onnx, onnx_path)
+    print(f"[INFO] 공유 가중치 게시: {model_path} -> {onnx_path} ({offset / 1e6:.1f}MB)")
+    return onnx_path
+
+
+def unpublish(model_path, shared_dir=SHARED_DIR):
+    """공유 가중치 파일 삭제 (이미 매핑한 프로세스는 계속 사용 가능)"""
+    for path in shared_paths(model_path, shared_dir):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def session_options(options):
+    """
+    공유 가중치를 복사하지 않도록 세션 옵션 조정
+    - prepacking과 NCHWc 레이아웃 변환(ORT_ENABLE_ALL)은 가중치를 프로세스마다 새로 만들기 때문에 끔
+    """
+    import onnxruntime as ort
+
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.add_session_config_entry("session.disable_prepacking", "1")
+    return options
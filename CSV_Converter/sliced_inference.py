@@ -0,0 +1,167 @@
+import os
+import sys
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from model_registry import Detections
+from batch_inference import iter_decoded, BATCH_SIZE, DECODE_WORKERS
+
+
+# --------------------------
+# 설정
+# --------------------------
+TILE_SIZE = int(os.environ.get("FIRE_TILE_SIZE", 640))
+TILE_OVERLAP = 0.2  # 이웃 타일과 겹치는 비율
+# 균일도 검사: 1/8로 줄인 흑백 이미지의 라플라시안이 EDGE_THRES를 넘는 픽셀이
+# 타일 안에 MIN_EDGE_PIXELS개 미만이면 (하늘/단색 지형) 추론하지 않음
+# (표준편차만 보면 넓은 하늘 속 작은 연기가 묻혀서 건너뛰게 됨)
+EDGE_THRES = 10.0
+MIN_EDGE_PIXELS = 1
+UNIFORM_SCALE = 8
+MERGE_THRES = 0.5  # 타일 간 중복 판정 (작은 박스 기준 겹침 비율)
+CLASS_OFFSET = 1 << 16  # 클래스별 병합을 한 번에 하기 위한 좌표 오프셋
+
+
+def _starts(length, tile, step):
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile + 1, step))
+    if starts[-1] + tile < length:
+        starts.append(length - tile)
+    return starts
+
+
+def tile_grid(height, width, tile=TILE_SIZE, overlap=TILE_OVERLAP):
+    """이미지를 덮는 겹치는 타일 좌표 (N, 4) [x1, y1, x2, y2]"""
+    step = max(1, int(tile * (1 - overlap)))
+    xs, ys = _starts(width, tile, step), _starts(height, tile, step)
+    return np.array([[x, y, min(x + tile, width), min(y + tile, height)] for y in ys for x in xs], dtype=np.int64)
+
+
+def uniform_tiles(img, tiles, edge_thres=EDGE_THRES, min_edges=MIN_EDGE_PIXELS, scale=UNIFORM_SCALE):
+    """
+    타일별 경계 픽셀 수를 적분 영상으로 한 번에 세어 균일한 타일을 골라냄
+
+    Returns:
+        (N,) bool: True면 건너뛸 타일
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    h, w = gray.shape
+    small = cv2.resize(gray, (max(1, w // scale), max(1, h // scale)), interpolation=cv2.INTER_AREA)
+    edges = (np.abs(cv2.Laplacian(small, cv2.CV_32F)) > edge_thres).astype(np.uint8)
+    ii = cv2.integral(edges, sdepth=cv2.CV_32S)
+
+    sh, sw = small.shape
+    x1 = np.clip(tiles[:, 0] // scale, 0, sw - 1)
+    y1 = np.clip(tiles[:, 1] // scale, 0, sh - 1)
+    x2 = np.clip(-(-tiles[:, 2] // scale), x1 + 1, sw)
+    y2 = np.clip(-(-tiles[:, 3] // scale), y1 + 1, sh)
+    counts = ii[y2, x2] - ii[y1, x2] - ii[y2, x1] + ii[y1, x1]
+    return counts < min_edges
+
+
+def pairwise_overlap(box, boxes, metric="ios"):
+    """
+    box(4,) 하나와 boxes(N, 4)의 겹침
+    - iou: 교집합 / 합집합
+    - ios: 교집합 / 작은 박스 넓이 (타일 경계에서 잘린 박스도 원래 박스와 겹친 것으로 봄)
+    """
+    xx1 = np.maximum(box[0], boxes[:, 0])
+    yy1 = np.maximum(box[1], boxes[:, 1])
+    xx2 = np.minimum(box[2], boxes[:, 2])
+    yy2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if metric == "iou":
+        return inter / np.maximum(area + areas - inter, 1e-9)
+    return inter / np.maximum(np.minimum(area, areas), 1e-9)
+
+
+def merge_detections(xyxy, conf, cls, method="nms", thres=MERGE_THRES, metric="ios"):
+    """
+    타일별 결과를 합친 박스들을 클래스별로 병합
+
+    - nms: 겹치는 묶음에서 점수가 가장 높은 박스만 남김
+    - wbf: 겹치는 묶음의 좌표를 점수 가중 평균으로 합침 (점수는 최댓값)
+    """
+    if len(conf) == 0:
+        return Detections(xyxy, conf, cls)
+    shifted = xyxy + cls[:, None] * CLASS_OFFSET
+    order = conf.argsort()[::-1]
+    out_boxes, out_conf, out_cls = [], [], []
+    while order.size > 0:
+        i = order[0]
+        overlap = pairwise_overlap(shifted[i], shifted[order])
+        members = order[overlap > thres]
+        members = members if i in members else np.append(members, i)
+        if method == "wbf":
+            weights = conf[members]
+            out_boxes.append((xyxy[members] * weights[:, None]).sum(axis=0) / weights.sum())
+        else:
+            out_boxes.append(xyxy[i])
+        out_conf.append(conf[i])
+        out_cls.append(cls[i])
+        order = order[overlap <= thres]
+        order = order[order != i]
+    return Detections(
+        np.array(out_boxes, dtype=np.float32).reshape(-1, 4),
+        np.array(out_conf, dtype=np.float32),
+        np.array(out_cls, dtype=np.float32),
+    )
+
+
+def sliced_detect(model, img, tile=TILE_SIZE, overlap=TILE_OVERLAP, edge_thres=EDGE_THRES,
+                  full_frame=True, method="nms", batch_size=BATCH_SIZE, stats=None):
+    """
+    고해상도 이미지를 겹치는 타일로 나눠 배치로 한 번에 추론하고 원본 좌표로 합침
+
+    Args:
+        model: model_registry.Predictor 또는 OnnxDetector (detect(images) 지원)
+        img: RGB 이미지
+        full_frame: 축소한 전체 이미지도 함께 추론 (타일보다 큰 화재를 놓치지 않도록)
+        method: 타일 간 병합 방식 "nms" / "wbf"
+        stats: dict를 주면 tiles / skipped 수를 채움
+    Returns:
+        Detections (원본 이미지 좌표)
+    """
+    h, w = img.shape[:2]
+    if max(h, w) <= tile:
+        return model.detect([img])[0]
+
+    tiles = tile_grid(h, w, tile, overlap)
+    tiles = tiles[~uniform_tiles(img, tiles, edge_thres)]
+    if stats is not None:
+        total = len(tile_grid(h, w, tile, overlap))
+        stats["tiles"] = stats.get("tiles", 0) + total
+        stats["skipped"] = stats.get("skipped", 0) + total - len(tiles)
+
+    crops = [img[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles.tolist()]
+    offsets = [(x1, y1) for x1, y1, _, _ in tiles.tolist()]
+    if full_frame:
+        crops.append(img)
+        offsets.append((0, 0))
+
+    boxes, confs, classes = [], [], []
+    for start in range(0, len(crops), batch_size):
+        dets = model.detect(crops[start:start + batch_size])
+        for (ox, oy), det in zip(offsets[start:start + batch_size], dets):
+            if len(det.conf) == 0:
+                continue
+            boxes.append(np.asarray(det.xyxy, dtype=np.float32) + np.array([ox, oy, ox, oy], dtype=np.float32))
+            confs.append(np.asarray(det.conf, dtype=np.float32))
+            classes.append(np.asarray(det.cls, dtype=np.float32))
+    if not boxes:
+        empty = np.zeros((0,), dtype=np.float32)
+        return Detections(np.zeros((0, 4), dtype=np.float32), empty, empty)
+    return merge_detections(np.concatenate(boxes), np.concatenate(confs), np.concatenate(classes), method)
+
+
+def detect_sliced_batched(model, img_paths, workers=DECODE_WORKERS, **sliced_args):
+    """
+    batch_inference.detect_batched와 같은 (경로, RGB 이미지, Detections) 형식으로
+    이미지마다 타일 추론 결과를 반환 (디코딩은 스레드 풀에서 미리 진행)
+    """
+    for img_path, img in iter_decoded(img_paths, workers=workers):
+        yield img_path, img, sliced_detect(model, img, **sliced_args)
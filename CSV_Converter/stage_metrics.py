@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import atexit
+import shutil
+import tempfile
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+# --------------------------
+# 설정
+# --------------------------
+# 여러 프로세스(API 워커, 추론 워커)의 측정값을 합치기 위한 스냅숏 디렉터리 (없으면 프로세스 안에서만 집계)
+METRICS_DIR = os.environ.get("FIRE_METRICS_DIR")
+FLUSH_INTERVAL = 1.0  # 스냅숏 파일 갱신 최소 간격 (초)
+# 단계별 소요 시간 히스토그램 구간 (초, LLM 호출까지 담을 수 있게 60초까지)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 요청 단위 추적 (단계 -> 누적 초). start_trace를 부른 요청 안에서만 기록
+_trace = contextvars.ContextVar("stage_trace", default=None)
+
+
+class StageRegistry:
+    """
+    단계별 소요 시간 히스토그램 + 처리 건수 카운터 (스레드 안전)
+
+    stage -> [구간별 개수 리스트, 합계(초), 관측 수, 처리 건수]
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._last_flush = 0.0
+        self._flush_timer = None
+
+    def observe(self, stage, seconds, items=1):
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = [[0] * len(self.buckets), 0.0, 0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += seconds
+            entry[2] += 1
+            entry[3] += items
+        self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: [list(e[0]), e[1], e[2], e[3]] for stage, e in self._stages.items()}
+
+    def flush(self, force=False):
+        """METRICS_DIR이 있으면 이 프로세스의 스냅숏을 파일로 저장 (FLUSH_INTERVAL마다)"""
+        if not METRICS_DIR:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < FLUSH_INTERVAL:
+            # 간격 안에 들어온 측정은 잠시 뒤 한 번에 저장 (작업 후 바로 쉬는 워커도 반영되도록)
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(FLUSH_INTERVAL, self.flush, (True,))
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+            return
+        self._last_flush = now
+        self._flush_timer = None
+        path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass  # 측정 실패로 요청 처리를 막지 않음
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+
+registry = StageRegistry()
+atexit.register(registry.flush, True)
+
+
+@contextmanager
+def stage_timer(stage, items=1):
+    """
+    with 블록의 소요 시간을 stage 히스토그램에 기록 (items: 처리한 이미지/행 수)
+    start_trace가 켜진 요청이면 요청별 추적에도 더함
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe(stage, seconds, items)
+        trace = _trace.get()
+        if trace is not None:
+            trace[stage] = trace.get(stage, 0.0) + seconds
+
+
+def start_trace():
+    """현재 요청(컨텍스트)의 단계별 추적 시작. 반환된 dict에 단계별 누적 초가 쌓임"""
+    trace = {}
+    _trace.set(trace)
+    return trace
+
+
+def merge_trace(stages):
+    """다른 프로세스에서 잰 단계별 추적(run_traced 결과)을 현재 요청의 추적에 더함 (추적 중이 아니면 무시)"""
+    trace = _trace.get()
+    if trace is None or not stages:
+        return
+    for stage, seconds in stages.items():
+        trace[stage] = trace.get(stage, 0.0) + seconds
+
+
+def run_traced(fn, *args, **kwargs):
+    """
+    fn을 새 컨텍스트에서 추적을 켜고 실행해 (결과, 단계별 추적 dict)를 반환
+    (작업 워커 프로세스에서 잰 단계를 요청 쪽 merge_trace로 넘길 때)
+    """
+    def run():
+        trace = start_trace()
+        return fn(*args, **kwargs), trace
+
+    return contextvars.copy_context().run(run)
+
+
+def server_timing(trace):
+    """추적 결과를 Server-Timing 헤더 값으로 (밀리초)"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in trace.items())
+
+
+def share_across_processes(metrics_dir=None):
+    """
+    이후 띄우는 자식 프로세스까지 같은 디렉터리에 스냅숏을 쓰도록 설정 (이전 실행 파일은 지움)
+    런처/서버 시작 시 워커를 띄우기 전에 한 번 호출
+    """
+    global METRICS_DIR
+    metrics_dir = metrics_dir or os.path.join(tempfile.gettempdir(), f"fire_metrics_{os.getpid()}")
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+    METRICS_DIR = metrics_dir
+    os.environ["FIRE_METRICS_DIR"] = metrics_dir
+    return metrics_dir
+
+
+def collect():
+    """모든 프로세스의 스냅숏을 합친 단계별 집계 (이 프로세스는 메모리의 최신 값 사용)"""
+    merged = registry.snapshot()
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        own = f"{os.getpid()}.json"
+        for name in os.listdir(METRICS_DIR):
+            if not name.endswith(".json") or name == own:
+                continue
+            try:
+                with open(os.path.join(METRICS_DIR, name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for stage, (counts, total, count, items) in snapshot.items():
+                entry = merged.setdefault(stage, [[0] * len(BUCKETS), 0.0, 0, 0])
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += count
+                entry[3] += items
+    return merged
+
+
+def render_prometheus(extra_lines=()):
+    """Prometheus 텍스트 형식 (/metrics 응답 본문)"""
+    lines = [
+        "# HELP fire_stage_seconds 처리 단계별 소요 시간",
+        "# TYPE fire_stage_seconds histogram",
+    ]
+    stages = collect()
+    for stage in sorted(stages):
+        counts, total, count, _ = stages[stage]
+        cumulative = 0
+        for bound, n in zip(BUCKETS, counts):
+            cumulative += n
+            lines.append(f'fire_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'fire_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+        lines.append(f'fire_stage_seconds_sum{{stage="{stage}"}} {total}')
+        lines.append(f'fire_stage_seconds_count{{stage="{stage}"}} {count}')
+    lines += [
+        "# HELP fire_stage_items_total 처리 단계별 처리 건수 (이미지/행/질문)",
+        "# TYPE fire_stage_items_total counter",
+    ]
+    for stage in sorted(stages):
+        lines.append(f'fire_stage_items_total{{stage="{stage}"}} {stages[stage][3]}')
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,267 @@
+import os
+import sys
+import time
+import datetime
+import threading
+from collections import deque
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import model_registry
+import geo_projection
+import fire_forecast
+import fire_track_store
+from csv_convert import observed_rows
+
+
+# --------------------------
+# 설정
+# --------------------------
+BUFFER_SIZE = 4  # 링 버퍼 크기 (처리가 밀리면 오래된 프레임부터 버림)
+MOTION_THRESHOLD = 0.005  # 바뀐 픽셀 비율이 이보다 작으면 추론하지 않음
+MOTION_PIXEL_DELTA = 12  # 밝기 차이가 이보다 커야 바뀐 픽셀로 봄
+KEYFRAME_INTERVAL = 10.0  # 움직임이 없어도 이 간격(초)마다 한 번은 추론
+HISTORY = 120  # 예측에 쓰는 최근 관측 수
+FLUSH_INTERVAL = 30.0  # 궤적 저장소 갱신/예측 간격 (초)
+LATENCY_WINDOW = 1000  # stats["latencies"]에 남기는 최근 지연 수
+
+
+class FrameReader:
+    """
+    별도 스레드에서 VideoCapture(파일/RTSP/카메라 번호)를 계속 읽어 링 버퍼에 넣음.
+    버퍼가 차면 가장 오래된 프레임이 밀려나므로 소비자가 느려도 지연이 쌓이지 않는다.
+    """
+
+    def __init__(self, source, buffer_size=BUFFER_SIZE, realtime=None):
+        self.source = int(source) if str(source).isdigit() else source
+        self.capture = cv2.VideoCapture(self.source)
+        if not self.capture.isOpened():
+            raise IOError(f"스트림을 열 수 없습니다: {source}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        # 파일은 기본적으로 원래 FPS 속도로 읽어 실제 카메라처럼 흉내 냄
+        if realtime is None:
+            realtime = isinstance(self.source, str) and os.path.exists(self.source)
+        self.realtime = realtime
+        self.frames = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stop = False
+        self.finished = False
+        self.read_count = 0
+        self.dropped = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        start = time.time()
+        while not self._stop:
+            ok, frame = self.capture.read()
+            if not ok:
+                break
+            captured_at = time.time()
+            with self._cond:
+                if len(self.frames) == self.frames.maxlen:
+                    self.dropped += 1
+                self.frames.append((self.read_count, captured_at, frame))
+                self.read_count += 1
+                self._cond.notify()
+            if self.realtime:
+                delay = start + self.read_count / self.fps - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+        with self._cond:
+            self.finished = True
+            self._cond.notify_all()
+        self.capture.release()
+
+    def latest(self, timeout=1.0):
+        """
+        가장 최근 프레임 (번호, 캡처 시각, BGR 이미지). 그보다 오래된 프레임은 버림
+        스트림이 끝났으면 None
+        """
+        with self._cond:
+            if not self.frames and not self.finished:
+                self._cond.wait(timeout)
+            if not self.frames:
+                return None
+            item = self.frames.pop()
+            self.dropped += len(self.frames)
+            self.frames.clear()
+            return item
+
+    def stop(self):
+        self._stop = True
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+class MotionGate:
+    """
+    축소한 흑백 프레임을 이전 기준 프레임과 비교해 움직임이 있을 때만 추론.
+    움직임이 없어도 keyframe_interval마다 한 번은 통과시킴
+    """
+
+    def __init__(self, threshold=MOTION_THRESHOLD, pixel_delta=MOTION_PIXEL_DELTA,
+                 keyframe_interval=KEYFRAME_INTERVAL, size=160):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.keyframe_interval = keyframe_interval
+        self.size = size
+        self.reference = None
+        self.last_pass = 0.0
+
+    def _small(self, frame):
+        h, w = frame.shape[:2]
+        scale = self.size / max(h, w)
+        gray = cv2.cvtColor(cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale)))), cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def check(self, frame, now):
+        small = self._small(frame)
+        if self.reference is None or now - self.last_pass >= self.keyframe_interval:
+            moved = True
+        else:
+            changed = cv2.absdiff(small, self.reference) > self.pixel_delta
+            moved = float(changed.mean()) >= self.threshold
+        if moved:
+            self.reference = small
+            self.last_pass = now
+        return moved
+
+
+class AdaptiveSkipper:
+    """
+    추론 지연에 맞춰 처리 간격을 조절.
+    최근 추론 시간(지수 이동 평균)보다 짧은 간격으로 들어온 프레임은 건너뛴다.
+    """
+
+    def __init__(self, min_interval=0.0, alpha=0.2):
+        self.min_interval = min_interval
+        self.alpha = alpha
+        self.latency = 0.0
+        self.last_time = None
+
+    def ready(self, captured_at):
+        interval = max(self.min_interval, self.latency)
+        return self.last_time is None or captured_at - self.last_time >= interval
+
+    def observe(self, captured_at, latency):
+        self.last_time = captured_at
+        self.latency = latency if self.latency == 0.0 else (1 - self.alpha) * self.latency + self.alpha * latency
+
+
+def run_stream(source, fire_id, format_data=None, model_path=None, buffer_size=BUFFER_SIZE,
+               max_fps=None, realtime=None, motion_threshold=MOTION_THRESHOLD,
+               keyframe_interval=KEYFRAME_INTERVAL, forecast_model=fire_forecast.DEFAULT_MODEL,
+               flush_interval=FLUSH_INTERVAL, stats=None):
+    """
+    영상/RTSP 스트림에서 화재를 탐지해 run_script와 같은 형식의 행을 실시간으로 반환
+
+    - 관측 행은 화재가 탐지된 프레임마다 바로 반환
+    - flush_interval마다 최근 HISTORY개 관측으로 예측 행을 만들어 반환하고,
+      그동안 새로 쌓인 관측 행과 함께 궤적 저장소에 반영 (이전 관측은 그대로 두고 예측 행만 교체)
+
+    Args:
+        source: 영상 파일 경로, RTSP URL 또는 카메라 번호
+        fire_id: 이 카메라의 화재 ID
+        format_data: 카메라 위치 ({"environment": {"gps": "위도, 경도"}} 또는 geo_bbox, 라벨 JSON과 같은 형식)
+        max_fps: 초당 최대 추론 횟수 (None이면 추론 속도에 맞춤)
+        stats: dict를 주면 처리/건너뜀/지연(최근 LATENCY_WINDOW개) 통계를 채움
+    """
+    predictor = model_registry.get_predictor(model_path)
+    geo_bbox, gps_center = geo_projection.frame_georef(format_data or {})
+    reader = FrameReader(source, buffer_size, realtime).start()
+    gate = MotionGate(motion_threshold, keyframe_interval=keyframe_interval)
+    skipper = AdaptiveSkipper(1.0 / max_fps if max_fps else 0.0)
+    track = deque(maxlen=HISTORY)  # 예측 입력으로만 쓰는 최근 관측
+    pending = []  # 아직 저장소에 넣지 않은 관측 행
+    stats = stats if stats is not None else {}
+    stats.update(inferred=0, skipped=0, gated=0, detected=0, latencies=deque(maxlen=LATENCY_WINDOW))
+    last_flush = time.time()
+
+    def flush():
+        predicted = geo_projection.project_rows(
+            fire_forecast.forecast_rows({fire_id: list(track)}, forecast_model))
+        fire_track_store.get_store().upsert_rows(pending + predicted, replace_kinds=["predicted"])
+        pending.clear()
+        return predicted
+
+    try:
+        while True:
+            item = reader.latest()
+            if item is None:
+                if reader.finished:
+                    break
+                continue
+            _, captured_at, frame = item
+
+            if not skipper.ready(captured_at):
+                stats["skipped"] += 1
+                continue
+            if not gate.check(frame, captured_at):
+                stats["gated"] += 1
+                continue
+
+            start = time.perf_counter()
+            det = predictor.detect([cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)])[0]
+            skipper.observe(captured_at, time.perf_counter() - start)
+            stats["inferred"] += 1
+            # 캡처부터 탐지 완료까지의 지연
+            stats["latencies"].append(time.time() - captured_at)
+
+            if len(det.xyxy):
+                stats["detected"] += 1
+                h, w = frame.shape[:2]
+                bbox = geo_projection.frame_envelopes([(det.xyxy, w, h, geo_bbox, gps_center)])[0].tolist()
+                t = datetime.datetime.fromtimestamp(captured_at).replace(microsecond=0)
+                # 같은 초의 관측은 마지막 것만 유지 (예측에서 0초 구간이 되지 않도록)
+                # (이미 저장소에 들어간 같은 초의 관측은 upsert가 (fire_id, 시각, 종류)로 교체)
+                rows = geo_projection.project_rows(observed_rows(fire_id, [(t, bbox)]))
+                if track and track[-1][0] == t:
+                    track.pop()
+                    if pending and pending[-1]["timestamp"] == rows[0]["timestamp"]:
+                        pending.pop()
+                track.append((t, bbox))
+                pending.extend(rows)
+                yield from rows
+
+            if track and time.time() - last_flush >= flush_interval:
+                yield from flush()
+                last_flush = time.time()
+
+        if track:
+            yield from flush()
+    finally:
+        reader.stop()
+        stats["read"] = reader.read_count
+        stats["dropped"] = reader.dropped
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="영상/RTSP 스트림 실시간 화재 탐지")
+    parser.add_argument("source", help="영상 파일, RTSP URL 또는 카메라 번호")
+    parser.add_argument("--fire-id", default="camera")
+    parser.add_argument("--gps", help='카메라 위치 "위도, 경도"')
+    parser.add_argument("--model", default=None, help="모델 경로 (기본: 활성 모델)")
+    parser.add_argument("--max-fps", type=float, default=None)
+    parser.add_argument("--no-realtime", action="store_true", help="파일을 원래 속도가 아닌 최대 속도로 읽음")
+    args = parser.parse_args()
+
+    format_data = {"environment": {"gps": args.gps}} if args.gps else None
+    stats = {}
+    for row in run_stream(args.source, args.fire_id, format_data, args.model, max_fps=args.max_fps,
+                          realtime=False if args.no_realtime else None, stats=stats):
+        print(json.dumps(row, ensure_ascii=False))
+
+    latencies = np.array(stats["latencies"]) * 1000
+    if len(latencies):
+        print(f"[INFO] 지연 p50 {np.percentile(latencies, 50):.1f}ms, p95 {np.percentile(latencies, 95):.1f}ms")
+    print(f"[INFO] 읽음 {stats['read']}, 버림 {stats['dropped']}, 건너뜀 {stats['skipped']}, "
+          f"움직임 없음 {stats['gated']}, 추론 {stats['inferred']}, 탐지 {stats['detected']}")
@@ -1,11 +1,15 @@
 import os
+import sys
 import glob
 import json
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import tifffile
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import model_registry
+import batch_inference
+
 # --------------------------
 # 설정
 # --------------------------
@@ -15,8 +19,8 @@ json_folder = "/home/azureuser/flow/dataset/labels/val/"
 output_folder = "output_tiff"
 os.makedirs(output_folder, exist_ok=True)
 
-# YOLO 모델 로드
-model = YOLO(model_path)
+# YOLO 모델 로드 (프로세스 공유 레지스트리)
+model = model_registry.get_predictor(model_path)
 
 # 이미지 경로
 img_paths = glob.glob(os.path.join(img_folder, "*.jpg"))
@@ -25,24 +29,14 @@ img_paths += glob.glob(os.path.join(img_folder, "*.png"))
 # --------------------------
 # 이미지 루프
 # --------------------------
-for img_path in img_paths:
+# 1. 이미지 읽기 (스레드 풀에서 미리 디코딩)
+# 2. YOLO 추론 (배치 단위, 결과는 이미지별로 반환)
+for img_path, img_rgb, det in batch_inference.detect_batched(model, img_paths):
     base_name = os.path.splitext(os.path.basename(img_path))[0]
 
-    # 1. 이미지 읽기
-    img = cv2.imread(img_path)
-    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-    # 2. YOLO 추론
-    results = model.predict(img_rgb, imgsz=640, conf=0.25, iou=0.45)
-
-    yolo_bboxes = []
-    yolo_classes = []
-    yolo_scores = []
-
-    for result in results:
-        yolo_bboxes.extend(result.boxes.xyxy.cpu().numpy().tolist())
-        yolo_classes.extend(result.boxes.cls.cpu().numpy().tolist())
-        yolo_scores.extend(result.boxes.conf.cpu().numpy().tolist())
+    yolo_bboxes = det.xyxy.tolist()
+    yolo_classes = det.cls.tolist()
+    yolo_scores = det.conf.tolist()
 
     # 3. 포맷 데이터(JSON) 읽기
     json_path = os.path.join(json_folder, f"{base_name}.json")
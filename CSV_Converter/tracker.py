@@ -0,0 +1,228 @@
+import os
+import numpy as np
+
+
+# --------------------------
+# 설정
+# --------------------------
+DETECT_INTERVAL = int(os.environ.get("FIRE_DETECT_INTERVAL", 5))  # 적어도 N프레임마다 한 번은 탐지
+MATCH_IOU = 0.3  # 트랙-탐지 매칭 최소 IoU
+MIN_TRACK_CONF = 0.35  # 트랙 신뢰도가 이보다 낮아지면 다음 프레임은 탐지
+CONF_DECAY = 0.85  # 탐지 없이 예측만 한 프레임마다 신뢰도에 곱함
+MAX_MISSES = 2  # 탐지 프레임에서 연속으로 이만큼 매칭되지 않으면 트랙 종료
+MIN_HITS = 2  # 속도를 알 수 있을 만큼 (이 횟수) 탐지되기 전까지는 매 프레임 탐지
+POSITION_NOISE = 0.05  # 박스 크기 대비 위치 잡음 (프로세스)
+VELOCITY_NOISE = 0.02  # 박스 크기 대비 속도 잡음 (프로세스, 분당)
+MEASURE_NOISE = 0.1  # 박스 크기 대비 측정 잡음
+
+
+def iou_matrix(a, b):
+    """a(M, 4)와 b(N, 4)의 모든 쌍 IoU (M, N)"""
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    xx1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    yy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    xx2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    yy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def greedy_match(iou, thres=MATCH_IOU):
+    """
+    IoU가 큰 쌍부터 하나씩 짝지음 (행/열은 한 번씩만 사용)
+
+    Returns:
+        (행 번호 배열, 열 번호 배열)
+    """
+    rows, cols = np.nonzero(iou >= thres)
+    order = np.argsort(-iou[rows, cols], kind="stable")
+    used_rows, used_cols = set(), set()
+    matched_rows, matched_cols = [], []
+    for r, c in zip(rows[order].tolist(), cols[order].tolist()):
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        matched_rows.append(r)
+        matched_cols.append(c)
+    return np.array(matched_rows, dtype=np.int64), np.array(matched_cols, dtype=np.int64)
+
+
+def _to_measure(xyxy):
+    """[x1, y1, x2, y2] → [cx, cy, w, h]"""
+    xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+    wh = xyxy[:, 2:] - xyxy[:, :2]
+    return np.hstack([xyxy[:, :2] + wh / 2, wh])
+
+
+def _to_xyxy(measure):
+    center, wh = measure[:, :2], np.maximum(measure[:, 2:4], 1.0)
+    return np.hstack([center - wh / 2, center + wh / 2])
+
+
+class MultiTracker:
+    """
+    IoU 매칭 + 등속 칼만 필터 다중 객체 추적기 (모든 트랙을 배열 하나로 한꺼번에 계산)
+
+    상태: [cx, cy, w, h, vx, vy, vw, vh] (속도는 분당 픽셀)
+    - 탐지가 있는 프레임: 예측 → IoU 매칭 → 칼만 갱신, 매칭 안 된 탐지는 새 트랙
+    - 탐지를 건너뛴 프레임: 예측만 하고 신뢰도를 CONF_DECAY만큼 낮춤
+    - 새 트랙은 MIN_HITS번 탐지될 때까지 (속도를 모르므로) 건너뛰지 않음
+    """
+
+    def __init__(self, interval=DETECT_INTERVAL, match_iou=MATCH_IOU, min_conf=MIN_TRACK_CONF,
+                 conf_decay=CONF_DECAY, max_misses=MAX_MISSES, min_hits=MIN_HITS):
+        self.interval = interval
+        self.match_iou = match_iou
+        self.min_conf = min_conf
+        self.conf_decay = conf_decay
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.x = np.zeros((0, 8))
+        self.p = np.zeros((0, 8, 8))
+        self.conf = np.zeros(0)
+        self.misses = np.zeros(0, dtype=np.int64)
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.next_id = 0
+        self.since_detect = None  # 마지막 탐지 후 지난 프레임 수 (아직 탐지 전이면 None)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def boxes(self):
+        """현재 트랙 박스 (N, 4) [x1, y1, x2, y2]"""
+        return _to_xyxy(self.x[:, :4])
+
+    def needs_detection(self):
+        """다음 프레임을 탐지해야 하는지 (트랙이 없거나, 간격이 찼거나, 새 트랙이 있거나, 신뢰도가 떨어짐)"""
+        if self.since_detect is None or len(self.ids) == 0:
+            return True
+        return (self.since_detect + 1 >= self.interval
+                or bool((self.hits < self.min_hits).any())
+                or bool((self.conf < self.min_conf).any()))
+
+    def predict(self, dt=1.0):
+        """dt(분)만큼 모든 트랙을 앞으로 예측"""
+        if len(self.ids) == 0:
+            return
+        F = np.eye(8)
+        F[:4, 4:] = np.eye(4) * dt
+        size = np.maximum(self.x[:, 2:4].max(axis=1), 1.0)
+        std = np.hstack([
+            np.repeat((POSITION_NOISE * size)[:, None], 4, axis=1),
+            np.repeat((VELOCITY_NOISE * size)[:, None], 4, axis=1),
+        ]) * max(dt, 1e-3)
+        self.x = self.x @ F.T
+        self.p = F @ self.p @ F.T + std[:, :, None] ** 2 * np.eye(8)
+
+    def update(self, xyxy, conf):
+        """탐지 결과로 트랙 갱신 (predict 다음에 호출)"""
+        measure = _to_measure(xyxy)
+        conf = np.asarray(conf, dtype=np.float64).reshape(-1)
+        rows, cols = greedy_match(iou_matrix(self.boxes(), _to_xyxy(measure)), self.match_iou)
+
+        if len(rows):
+            # 칼만 갱신 (H = [I 0])
+            size = np.maximum(self.x[rows, 2:4].max(axis=1), 1.0)
+            R = (MEASURE_NOISE * size)[:, None, None] ** 2 * np.eye(4)
+            p = self.p[rows]
+            S = p[:, :4, :4] + R
+            K = np.linalg.solve(S, p[:, :4, :]).transpose(0, 2, 1)
+            innovation = measure[cols] - self.x[rows, :4]
+            self.x[rows] += (K @ innovation[:, :, None])[:, :, 0]
+            self.p[rows] = p - K @ p[:, :4, :]
+            self.conf[rows] = conf[cols]
+            self.misses[rows] = 0
+            self.hits[rows] += 1
+
+        unmatched = np.setdiff1d(np.arange(len(self.ids)), rows)
+        self.misses[unmatched] += 1
+        self.conf[unmatched] *= self.conf_decay
+        keep = self.misses <= self.max_misses
+        self.ids, self.x, self.p = self.ids[keep], self.x[keep], self.p[keep]
+        self.conf, self.misses, self.hits = self.conf[keep], self.misses[keep], self.hits[keep]
+
+        new = np.setdiff1d(np.arange(len(measure)), cols)
+        if len(new):
+            size = np.maximum(measure[new, 2:4].max(axis=1), 1.0)
+            x = np.hstack([measure[new], np.zeros((len(new), 4))])
+            std = np.hstack([
+                np.repeat((2 * MEASURE_NOISE * size)[:, None], 4, axis=1),
+                np.repeat((10 * VELOCITY_NOISE * size)[:, None], 4, axis=1),
+            ])
+            self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + len(new))])
+            self.x = np.vstack([self.x, x])
+            self.p = np.concatenate([self.p, std[:, :, None] ** 2 * np.eye(8)])
+            self.conf = np.concatenate([self.conf, conf[new]])
+            self.misses = np.concatenate([self.misses, np.zeros(len(new), dtype=np.int64)])
+            self.hits = np.concatenate([self.hits, np.ones(len(new), dtype=np.int64)])
+            self.next_id += len(new)
+        self.since_detect = 0
+
+    def coast(self):
+        """탐지를 건너뛴 프레임: 예측 위치를 그대로 쓰고 신뢰도만 낮춤"""
+        self.conf *= self.conf_decay
+        if self.since_detect is not None:
+            self.since_detect += 1
+
+    def step(self, detections=None, dt=1.0):
+        """
+        한 프레임 진행
+
+        Args:
+            detections: (xyxy (n, 4), conf (n,)) 또는 None (탐지를 건너뜀)
+            dt: 이전 프레임과의 시간 차 (분)
+        Returns:
+            (트랙 ID (N,), 박스 (N, 4), 신뢰도 (N,))
+        """
+        self.predict(dt)
+        if detections is None:
+            self.coast()
+        else:
+            self.update(*detections)
+        return self.ids.copy(), self.boxes(), self.conf.copy()
+
+
+def track_sequence(frames, detect, tracker=None, stats=None):
+    """
+    시간 순 프레임에 추적기를 돌리면서 필요한 프레임만 탐지
+
+    Args:
+        frames: [(키, 시각(datetime), 캐시된 탐지 결과 또는 None), ...] 시간 순
+            탐지 결과는 DetectionCache 항목 형식 ({"width", "height", "boxes": [[x1, y1, x2, y2, conf, cls], ...]})
+        detect: 키 -> 탐지 결과 (캐시에 없고 탐지가 필요한 프레임에만 호출, 실패 시 None)
+        stats: dict를 주면 cached / detected / skipped 수를 채움
+    Yields:
+        (키, 시각, (너비, 높이), 트랙 ID (N,), 박스 (N, 4), 신뢰도 (N,))
+        아직 이미지 크기를 모르는 (탐지 전) 프레임은 반환하지 않음
+    """
+    tracker = tracker or MultiTracker()
+    stats = stats if stats is not None else {}
+    for name in ("cached", "detected", "skipped"):
+        stats.setdefault(name, 0)
+
+    size, last_time = None, None
+    for key, img_time, entry in frames:
+        if entry is not None:
+            stats["cached"] += 1
+        elif tracker.needs_detection():
+            entry = detect(key)
+            stats["detected"] += 1
+        else:
+            stats["skipped"] += 1
+
+        dt = 1.0 if last_time is None else (img_time - last_time).total_seconds() / 60.0
+        last_time = img_time
+        if entry is None:
+            ids, boxes, conf = tracker.step(None, dt)
+        else:
+            size = (entry["width"], entry["height"])
+            dets = np.asarray(entry["boxes"], dtype=np.float64).reshape(-1, 6)
+            ids, boxes, conf = tracker.step((dets[:, :4], dets[:, 4]), dt)
+
+        if size is not None:
+            yield key, img_time, size, ids, boxes, conf
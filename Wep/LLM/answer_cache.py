@@ -0,0 +1,129 @@
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+
+# --------------------------
+# 설정
+# --------------------------
+CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", 1024))
+CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 300))  # 초
+# 질문 임베딩의 코사인 유사도가 이 값 이상이면 같은 질문으로 봄
+SIMILARITY_THRESHOLD = float(os.environ.get("LLM_CACHE_SIMILARITY", 0.95))
+
+
+# 위치가 있는 질문은 이 격자(약 500m) 안에서만 답변을 공유
+SCOPE_CELL_DEG = 0.005
+
+
+def location_scope(lat=None, lon=None, cell_deg=SCOPE_CELL_DEG):
+    """질문 위치의 캐시 범위 키 (위치가 없으면 None)"""
+    if lat is None or lon is None:
+        return None
+    return f"{int(lat // cell_deg)}:{int(lon // cell_deg)}"
+
+
+def normalize(question):
+    """정확히 일치 비교용 질문 정규화 (유니코드 정규화, 소문자, 공백/문장부호 정리)"""
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+class AnswerCache:
+    """
+    /llm 답변 캐시 (TTL + LRU)
+
+    - 정규화한 질문 텍스트가 같으면 바로 적중
+    - 아니면 질문 임베딩과 코사인 유사도가 임계값 이상인 항목을 찾음
+    - 인덱스 버전이 바뀌면(문서가 바뀌어 다시 만들어짐) 전부 비움
+    - scope(위치 격자 등)가 다른 항목끼리는 적중하지 않음
+    """
+
+    def __init__(self, max_entries=CACHE_SIZE, ttl=CACHE_TTL, threshold=SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.version = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (scope, 정규화 질문) -> (답변, 단위 벡터 또는 None, 저장 시각)
+        self._matrix = None  # 유사도 검색용 (키 목록, (N, D) 벡터), 항목이 바뀌면 다시 만듦
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set_version(self, version):
+        """인덱스 버전이 바뀌었으면 캐시를 비움"""
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self._matrix = None
+                self.version = version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def _expire(self, now):
+        expired = [k for k, (_, _, t) in self._entries.items() if now - t > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _similar(self, vector, scope):
+        if self._matrix is None:
+            keys = [k for k, (_, v, _) in self._entries.items() if v is not None]
+            if not keys:
+                return None
+            self._matrix = (keys, np.stack([self._entries[k][1] for k in keys]))
+        keys, matrix = self._matrix
+        scores = np.where([k[0] == scope for k in keys], matrix @ vector, -np.inf)
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.threshold else None
+
+    def get(self, question, vector=None, scope=None):
+        """
+        캐시된 답변 (없으면 None)
+
+        Args:
+            question: 사용자 질문
+            vector: 질문 임베딩 (주면 유사 질문까지 검색)
+            scope: 같은 scope로 저장된 항목에서만 찾음 (예: location_scope)
+        """
+        key = (scope, normalize(question))
+        with self._lock:
+            self._expire(time.time())
+            if key not in self._entries and vector is not None:
+                key = self._similar(_unit(vector), scope) or key
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, question, answer, vector=None, scope=None):
+        key = (scope, normalize(question))
+        with self._lock:
+            self._entries[key] = (answer, None if vector is None else _unit(vector), time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "version": self.version}
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
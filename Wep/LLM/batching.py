@@ -0,0 +1,238 @@
+import os
+import time
+import asyncio
+import hashlib
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+# --------------------------
+# 설정
+# --------------------------
+BATCH_MAX = int(os.environ.get("LLM_BATCH_MAX", 64))  # 한 번에 보낼 최대 개수
+BATCH_DELAY = float(os.environ.get("LLM_BATCH_DELAY_MS", 5)) / 1000.0  # 모으는 시간
+
+
+class MicroBatcher:
+    """
+    짧은 시간(max_delay) 동안 들어온 요청을 모아 batch_fn 한 번으로 처리.
+    같은 항목은 배치 안에서 한 번만 보냄.
+
+    batch_fn: async (items: list) -> list (같은 순서의 결과)
+    """
+
+    def __init__(self, batch_fn, max_batch=BATCH_MAX, max_delay=BATCH_DELAY):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = []  # (항목, future)
+        self._timer = None
+        self._tasks = set()
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        unique = list(dict.fromkeys(item for item, _ in batch))
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = dict(zip(unique, await self.batch_fn(unique)))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for item, future in batch:
+            if not future.done():
+                future.set_result(results[item])
+
+
+class Coalescer:
+    """
+    같은 키의 호출이 진행 중이면 새로 호출하지 않고 그 결과를 같이 기다림.
+    한 요청이 취소되어도 공유 중인 호출은 계속 진행됨
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def run(self, key, factory):
+        """factory: 인자 없는 코루틴 함수 (실제 호출)"""
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._inflight.pop(key, None) if self._inflight.get(key) is t else None)
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+
+def query_batch_fn(inner):
+    """
+    질문 여러 개를 질문용(query) 모델로 한 번에 임베딩하는 async 함수 (지원하지 않으면 None)
+
+    - aembed_queries(texts)가 있으면 그대로 사용
+    - UpstageEmbeddings: 질문 모델("<model>-query")에 리스트 입력으로 한 번 요청
+      (aembed_documents는 문서용 passage 모델이라 질문에 쓰면 FAISS 유사도가 조용히 나빠짐)
+    """
+    if hasattr(inner, "aembed_queries"):
+        return inner.aembed_queries
+    if hasattr(inner, "async_client") and hasattr(inner, "_invocation_params"):
+        async def embed_queries(texts):
+            params = inner._invocation_params
+            params["model"] = params["model"] + "-query"
+            response = await inner.async_client.create(input=list(texts), **params)
+            data = sorted(response.data, key=lambda r: getattr(r, "index", 0))
+            return [r.embedding for r in data]
+        return embed_queries
+    return None
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    질문 임베딩(aembed_query)을 마이크로 배치로 모아 질문용 모델에 리스트 입력 한 번으로 보내는 래퍼.
+    문서 임베딩과 동기 호출은 그대로 내부 임베딩에 넘김
+
+    내부 임베딩이 질문 배치 요청을 지원하지 않으면(query_batch_fn이 None) 배치 없이
+    같은 질문의 진행 중 호출만 공유함
+    """
+
+    def __init__(self, inner, max_batch=BATCH_MAX, max_delay=BATCH_DELAY):
+        self.inner = inner
+        batch_fn = query_batch_fn(inner)
+        self.batcher = MicroBatcher(batch_fn, max_batch, max_delay) if batch_fn else None
+        self.coalescer = Coalescer()
+
+    def embed_documents(self, texts):
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.inner.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        return await self.inner.aembed_documents(texts)
+
+    async def aembed_query(self, text):
+        if self.batcher is None:
+            return await self.coalescer.run(text, lambda: self.inner.aembed_query(text))
+        return await self.coalescer.run(text, lambda: self.batcher.submit(text))
+
+
+# --------------------------
+# 오프라인 부하 테스트용 가짜 백엔드
+# --------------------------
+class FakeEmbeddings(Embeddings):
+    """텍스트 해시로 만든 고정 벡터. 호출마다 latency만큼 걸리고 호출 수를 셈"""
+
+    def __init__(self, dim=64, latency=0.05):
+        self.dim = dim
+        self.latency = latency
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha1(text.encode()).digest()[:4], "little")
+        return np.random.default_rng(seed).standard_normal(self.dim).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        time.sleep(self.latency)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        await asyncio.sleep(self.latency)
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_queries([text]))[0]
+
+    async def aembed_queries(self, texts):
+        # 실제 백엔드의 질문용 리스트 입력 요청 흉내 (호출 한 번)
+        return await self.aembed_documents(texts)
+
+
+class FakeChat:
+    """고정 답변을 latency 뒤에 돌려주는 가짜 LLM 체인 (ainvoke만 지원)"""
+
+    def __init__(self, latency=0.5):
+        self.latency = latency
+        self.calls = 0
+
+    async def ainvoke(self, question):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return f"answer:{question}"
+
+
+async def _load_test(requests, unique, batched, embed_latency, chat_latency):
+    embeddings = FakeEmbeddings(latency=embed_latency)
+    chat = FakeChat(latency=chat_latency)
+    embedder = BatchedEmbeddings(embeddings) if batched else embeddings
+    coalescer = Coalescer()
+    questions = [f"질문 {i % unique}" for i in range(requests)]
+
+    async def handle(question):
+        start = time.perf_counter()
+        await embedder.aembed_query(question)
+        if batched:
+            await coalescer.run(question, lambda: chat.ainvoke(question))
+        else:
+            await chat.ainvoke(question)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = np.array(await asyncio.gather(*(handle(q) for q in questions))) * 1000
+    return {
+        "mode": "batched" if batched else "direct",
+        "requests": requests,
+        "embed_calls": embeddings.calls,
+        "chat_calls": chat.calls,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+        "wall_s": round(time.perf_counter() - start, 2),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="임베딩/LLM 호출 배치·병합 부하 테스트 (가짜 백엔드)")
+    parser.add_argument("--requests", type=int, default=1000, help="동시 요청 수")
+    parser.add_argument("--unique", type=int, default=50, help="서로 다른 질문 수")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="임베딩 호출 지연 (초)")
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="LLM 호출 지연 (초)")
+    args = parser.parse_args()
+
+    for batched in (False, True):
+        result = asyncio.run(_load_test(args.requests, args.unique, batched, args.embed_latency, args.chat_latency))
+        print(result)
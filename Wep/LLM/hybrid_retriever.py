@@ -0,0 +1,170 @@
+import re
+import math
+import unicodedata
+from typing import Any, Dict, List
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+
+# --------------------------
+# 설정
+# --------------------------
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60  # Reciprocal Rank Fusion 상수
+RERANK_WEIGHT = 0.5  # 최종 점수에서 재정렬(글자 겹침) 점수 비중
+
+
+def _words(text):
+    return re.findall(r"\w+", unicodedata.normalize("NFKC", text).lower())
+
+
+def tokenize(text):
+    """
+    BM25용 토큰: 단어 자체 + 단어 안의 글자 bigram
+    (한국어 지명은 조사/띄어쓰기가 달라도 bigram이 겹쳐서 잡힘)
+    """
+    tokens = []
+    for word in _words(text):
+        tokens.append(word)
+        tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def _bigrams(words):
+    return {w[i:i + 2] for w in words for i in range(len(w) - 1)} | {w for w in words if len(w) == 1}
+
+
+class BM25Index:
+    """글자 n-gram 역색인 BM25 (프로세스 안에서 동작, 외부 검색엔진 불필요)"""
+
+    def __init__(self, texts, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        postings = {}
+        lengths = np.zeros(len(texts))
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[doc_id] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append((doc_id, tf))
+
+        # 용어별 (문서 번호 배열, tf 배열)
+        self.postings = {
+            token: (np.array([d for d, _ in items], dtype=np.int64), np.array([tf for _, tf in items], dtype=np.float64))
+            for token, items in postings.items()
+        }
+        self.num_docs = len(texts)
+        self.avg_len = float(lengths.mean()) if len(texts) else 0.0
+        self.norm = k1 * (1 - b + b * lengths / max(self.avg_len, 1e-9))
+
+    def scores(self, query):
+        """모든 문서의 BM25 점수 (num_docs,)"""
+        scores = np.zeros(self.num_docs)
+        for token in set(tokenize(query)):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            doc_ids, tf = posting
+            idf = math.log(1 + (self.num_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            scores[doc_ids] += idf * tf * (self.k1 + 1) / (tf + self.norm[doc_ids])
+        return scores
+
+    def search(self, query, k):
+        """[(문서 번호, 점수), ...] 점수 높은 순 (0점 제외)"""
+        scores = self.scores(query)
+        k = min(k, self.num_docs)
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+
+def overlap_score(query, text):
+    """질문 bigram 중 문서에 들어 있는 비율 + 질문 단어가 그대로 들어 있으면 가산점 (0~2)"""
+    query_words, text_words = _words(query), _words(text)
+    q = _bigrams(query_words)
+    if not q:
+        return 0.0
+    coverage = len(q & _bigrams(text_words)) / len(q)
+    joined = " ".join(text_words)
+    words = [w for w in query_words if len(w) >= 2]
+    exact = sum(w in joined for w in words) / len(words) if words else 0.0
+    return coverage + exact
+
+
+def vectorstore_documents(vectorstore):
+    """FAISS 벡터스토어에 들어 있는 전체 문서 (인덱스 순서)"""
+    return [vectorstore.docstore.search(doc_id) for _, doc_id in sorted(vectorstore.index_to_docstore_id.items())]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    BM25 + FAISS 결과를 RRF로 합치고, 글자 겹침 점수로 다시 정렬해 상위 k개만 반환
+    (정확한 지명 일치는 BM25가, 의미가 비슷한 문장은 벡터 검색이 찾음)
+    """
+
+    vectorstore: Any
+    bm25: Any
+    documents: List[Document]
+    positions: Dict[int, int]  # FAISS 인덱스 번호 -> 문서 번호 (내용이 같은 청크도 따로 구분)
+    k: int = 3
+    fetch_k: int = 20
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, **kwargs):
+        documents = vectorstore_documents(vectorstore)
+        bm25 = BM25Index([d.page_content for d in documents])
+        positions = {index_id: i for i, index_id in enumerate(sorted(vectorstore.index_to_docstore_id))}
+        return cls(vectorstore=vectorstore, bm25=bm25, documents=documents, positions=positions, **kwargs)
+
+    def _vector_search(self, vector):
+        """질문 임베딩으로 FAISS 인덱스를 직접 검색해 가까운 순서의 문서 번호 목록을 반환"""
+        query = np.asarray([vector], dtype=np.float32)
+        # 벡터스토어가 정규화해서 저장했으면 질문도 똑같이 정규화 (FAISS.similarity_search와 같은 처리)
+        if getattr(self.vectorstore, "_normalize_L2", False):
+            query /= np.maximum(np.linalg.norm(query, axis=1, keepdims=True), 1e-12)
+        _, indices = self.vectorstore.index.search(query, min(self.fetch_k, len(self.documents)))
+        return [self.positions[i] for i in indices[0].tolist() if i in self.positions]
+
+    def _fuse(self, query, vector_ids):
+        fused = {}
+        for rank, doc_id in enumerate(vector_ids):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+        for rank, (doc_id, _) in enumerate(self.bm25.search(query, self.fetch_k)):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+        if not fused:
+            return []
+
+        # RRF 점수를 0~1로 맞춘 뒤 재정렬 점수와 섞음
+        doc_ids = list(fused)
+        rrf = np.array([fused[i] for i in doc_ids])
+        rrf = rrf / rrf.max()
+        rerank = np.array([overlap_score(query, self.documents[i].page_content) for i in doc_ids]) / 2.0
+        final = (1 - RERANK_WEIGHT) * rrf + RERANK_WEIGHT * rerank
+        order = np.argsort(-final)[:self.k]
+        return [self.documents[doc_ids[i]] for i in order]
+
+    def retrieve(self, query, vector=None):
+        """invoke와 같지만, 이미 계산한 질문 임베딩(vector)이 있으면 다시 임베딩하지 않고 그대로 검색"""
+        if vector is None:
+            return self.invoke(query)
+        return self._fuse(query, self._vector_search(vector))
+
+    async def aretrieve(self, query, vector=None):
+        if vector is None:
+            return await self.ainvoke(query)
+        return self._fuse(query, self._vector_search(vector))
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        vector = self.vectorstore.embeddings.embed_query(query)
+        return self._fuse(query, self._vector_search(vector))
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        vector = await self.vectorstore.embeddings.aembed_query(query)
+        return self._fuse(query, self._vector_search(vector))
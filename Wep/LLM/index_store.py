@@ -0,0 +1,142 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.document_loaders import PyPDFLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+
+
+# 임베딩/인덱스 캐시 위치
+INDEX_DIR = os.environ.get(
+    "RAG_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_cache"),
+)
+
+
+def _sha1_file(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def doc_key(file_path, splitter_settings, embed_model):
+    """문서 내용 해시 + 분할 설정 + 임베딩 모델로 만든 캐시 키 (셋 중 하나라도 바뀌면 다시 임베딩)"""
+    h = hashlib.sha1()
+    h.update(_sha1_file(file_path).encode())
+    h.update(json.dumps(splitter_settings, sort_keys=True).encode())
+    h.update(embed_model.encode())
+    return h.hexdigest()
+
+
+def _save_chunks(key, docs, vectors, index_dir):
+    """청크 텍스트/메타데이터(.json)와 임베딩(.npy, float32)을 원자적으로 저장"""
+    os.makedirs(index_dir, exist_ok=True)
+    base = os.path.join(index_dir, key)
+    np.save(base + ".tmp.npy", np.asarray(vectors, dtype=np.float32))
+    with open(base + ".json.tmp", "w", encoding="utf-8") as f:
+        json.dump([{"page_content": d.page_content, "metadata": d.metadata} for d in docs], f, ensure_ascii=False)
+    os.replace(base + ".tmp.npy", base + ".npy")
+    os.replace(base + ".json.tmp", base + ".json")
+
+
+def _load_chunks(key, index_dir):
+    """캐시된 청크와 임베딩 (임베딩은 메모리 맵으로 읽음). 없으면 None"""
+    base = os.path.join(index_dir, key)
+    if not (os.path.exists(base + ".npy") and os.path.exists(base + ".json")):
+        return None
+    with open(base + ".json", "r", encoding="utf-8") as f:
+        docs = [Document(**item) for item in json.load(f)]
+    vectors = np.load(base + ".npy", mmap_mode="r")
+    if len(docs) != len(vectors):
+        return None
+    return docs, vectors
+
+
+def load_document_chunks(file_path, embeddings, splitter_settings, embed_model, index_dir=INDEX_DIR):
+    """
+    문서 하나의 (청크 목록, 임베딩 배열, 캐시 키).
+    같은 문서/설정으로 임베딩한 적이 있으면 API를 호출하지 않고 디스크에서 읽는다.
+    """
+    key = doc_key(file_path, splitter_settings, embed_model)
+    cached = _load_chunks(key, index_dir)
+    if cached is not None:
+        logging.info(f"임베딩 캐시 사용: {os.path.basename(file_path)}")
+        return cached[0], cached[1], key
+
+    logging.info(f"문서 임베딩: {os.path.basename(file_path)}")
+    docs = PyPDFLoader(file_path).load()
+    splits = RecursiveCharacterTextSplitter(**splitter_settings).split_documents(docs)
+    vectors = embeddings.embed_documents([d.page_content for d in splits])
+    _save_chunks(key, splits, vectors, index_dir)
+    return splits, np.asarray(vectors, dtype=np.float32), key
+
+
+def _save_index(vectorstore, base):
+    """FAISS 인덱스(.faiss)와 문서 저장소(.docstore.json, 인덱스 순서)를 원자적으로 저장 (pickle 없음)"""
+    import faiss
+
+    faiss.write_index(vectorstore.index, base + ".faiss.tmp")
+    entries = []
+    for _, doc_id in sorted(vectorstore.index_to_docstore_id.items()):
+        doc = vectorstore.docstore.search(doc_id)
+        entries.append({"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata})
+    with open(base + ".docstore.json.tmp", "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False)
+    os.replace(base + ".faiss.tmp", base + ".faiss")
+    os.replace(base + ".docstore.json.tmp", base + ".docstore.json")
+
+
+def _load_index(base, embeddings):
+    """
+    저장된 인덱스를 메모리 맵으로 열고 JSON 문서 저장소로 FAISS 벡터스토어를 다시 구성
+    (쓰기 가능한 캐시 디렉터리의 pickle을 풀지 않음, 인덱스는 읽기 전용)
+    """
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+
+    index = faiss.read_index(base + ".faiss", faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0))
+    with open(base + ".docstore.json", "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    if len(entries) != index.ntotal:
+        return None
+    docstore = InMemoryDocstore({
+        e["id"]: Document(page_content=e["page_content"], metadata=e["metadata"]) for e in entries})
+    index_to_docstore_id = {i: e["id"] for i, e in enumerate(entries)}
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def build_vectorstore(file_paths, embeddings, splitter_settings, embed_model, index_dir=INDEX_DIR):
+    """
+    여러 문서로 FAISS 벡터스토어를 만들어 (vectorstore, index_version) 반환
+
+    - 문서별 임베딩은 캐시에서 읽고, 바뀐 문서만 다시 임베딩
+    - 문서 키 조합이 같으면 저장해 둔 FAISS 인덱스를 메모리 맵으로 로드
+    - index_version은 문서 키 조합의 해시 (인덱스가 다시 만들어지면 바뀜)
+    """
+    chunks, keys = [], []
+    for file_path in file_paths:
+        docs, vectors, key = load_document_chunks(file_path, embeddings, splitter_settings, embed_model, index_dir)
+        chunks.append((docs, vectors))
+        keys.append(key)
+
+    index_version = hashlib.sha1("|".join(keys).encode()).hexdigest()
+    base = os.path.join(index_dir, "faiss-" + index_version)
+    if os.path.exists(base + ".faiss") and os.path.exists(base + ".docstore.json"):
+        vectorstore = _load_index(base, embeddings)
+        if vectorstore is not None:
+            logging.info("저장된 FAISS 인덱스 사용")
+            return vectorstore, index_version
+
+    text_embeddings, metadatas = [], []
+    for docs, vectors in chunks:
+        for doc, vector in zip(docs, vectors):
+            text_embeddings.append((doc.page_content, vector))
+            metadatas.append(doc.metadata)
+    vectorstore = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas)
+    _save_index(vectorstore, base)
+    return vectorstore, index_version
@@ -1,24 +1,46 @@
 import sys,os
 import logging
 from langchain_upstage import ChatUpstage, UpstageEmbeddings
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
 sys.path.append(os.path.dirname(__file__))
 from api_key import API_KEY
+from index_store import build_vectorstore
+from shelter_index import build_shelter_index, NEAREST_K
+from batching import BatchedEmbeddings
+from hybrid_retriever import HybridRetriever
+# 단계별 지연 측정은 탐지 파이프라인과 같은 모듈 (CSV_Converter/stage_metrics.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "CSV_Converter"))
+from stage_metrics import stage_timer
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+EMBED_MODEL = "solar-embedding-1-large"
+# 분할 설정 (바뀌면 캐시 키가 달라져 다시 임베딩됨)
+SPLITTER_SETTINGS = {"chunk_size": 500, "chunk_overlap": 50}
+# 최종 컨텍스트 청크 수 / 합치기 전에 BM25·FAISS에서 각각 가져올 후보 수
+RETRIEVER_K = 3
+RETRIEVER_FETCH_K = 20
+
+# 현재 벡터 인덱스 버전 (create_rag_chain이 설정, 문서/설정이 바뀌어 인덱스가 다시 만들어지면 바뀜)
+index_version = None
+# 질문 임베딩용 (답변 캐시의 유사 질문 검색에서 사용)
+embeddings = None
+# 대피소 좌표 인덱스 (safezone.pdf에서 추출, 사용자 위치가 오면 가까운 대피소만 컨텍스트로 사용)
+shelter_index = None
+
 
 def create_rag_chain():
     """
     RAG 체인을 설정하고 생성하여 반환하는 함수
+    체인 입력은 질문 문자열 또는 {"question": ..., "lat": ..., "lon": ..., "vector": ...}
+    (vector: 이미 계산한 질문 임베딩, 주면 검색할 때 다시 임베딩하지 않음)
+    (위치가 있고 대피소 좌표가 확보되어 있으면 벡터 검색 대신 가까운 대피소 k곳을 컨텍스트로 사용)
     """
+    global index_version, embeddings, shelter_index
     logging.info("--- Creating RAG chain... ---")
 
     # 1. API 키 설정
@@ -28,30 +50,37 @@ def create_rag_chain():
 
     # 2. LLM 및 임베딩 모델 초기화
     chat = ChatUpstage(api_key=UPSTAGE_API_KEY, model="solar-pro2")
-    embeddings = UpstageEmbeddings(
-        api_key=UPSTAGE_API_KEY, model="solar-embedding-1-large")
+    # 동시에 들어온 질문 임베딩은 몇 ms 동안 모아 한 번에 요청 (문서 임베딩은 그대로)
+    embeddings = BatchedEmbeddings(UpstageEmbeddings(
+        api_key=UPSTAGE_API_KEY, model=EMBED_MODEL))
 
     # 3. 문서 로드 및 벡터 DB 생성
+    # (문서 해시 + 분할 설정별로 임베딩/인덱스를 디스크에 캐시하고, 바뀐 문서만 다시 임베딩)
     doc_folder_path = "/home/azureuser/flow/Wep/LLM/"
     doc_files = ["data.pdf", "safezone.pdf"]
-    all_docs = []
+    file_paths = []
 
     for file_name in doc_files:
         file_path = os.path.join(doc_folder_path, file_name)
         if os.path.exists(file_path):
-            loader = PyPDFLoader(file_path)
-            all_docs.extend(loader.load())
+            file_paths.append(file_path)
         else:
             logging.warning(f"경고: '{file_path}' 문서를 찾을 수 없습니다.")
 
-    if not all_docs:
+    if not file_paths:
         raise FileNotFoundError("처리할 문서가 없습니다. PDF 파일이 있는지 확인하세요.")
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500, chunk_overlap=50)
-    splits = text_splitter.split_documents(all_docs)
-    vectorstore = FAISS.from_documents(documents=splits, embedding=embeddings)
-    retriever = vectorstore.as_retriever()
+    vectorstore, index_version = build_vectorstore(
+        file_paths, embeddings, SPLITTER_SETTINGS, EMBED_MODEL)
+    # 지명 정확 일치(BM25)와 의미 검색(FAISS)을 합쳐 적은 k로도 맞는 청크를 찾음
+    retriever = HybridRetriever.from_vectorstore(vectorstore, k=RETRIEVER_K, fetch_k=RETRIEVER_FETCH_K)
+
+    safezone_path = os.path.join(doc_folder_path, "safezone.pdf")
+    if os.path.exists(safezone_path):
+        try:
+            shelter_index = build_shelter_index(safezone_path)
+        except Exception as e:
+            logging.warning(f"대피소 인덱스 생성 실패, 벡터 검색만 사용합니다: {e}")
 
     # 4. RAG 체인 설정
     template = """You are an emergency evacuation AI. The user is in an urgent fire situation and needs to know where to evacuate. Your response must be extremely direct. Provide ONLY the name of the safest shelter, landmark, or building. Do not offer any additional advice, instructions, or conversational text. Your answer must be a place name and nothing else. Infer the most appropriate shelter name from the context based on the user's location.
@@ -69,10 +98,46 @@ def create_rag_chain():
     def format_docs(docs):
         return "\n\n".join(doc.page_content for doc in docs)
 
+    def as_query(inputs):
+        return {"question": inputs} if isinstance(inputs, str) else inputs
+
+    def nearby_docs(query):
+        lat, lon = query.get("lat"), query.get("lon")
+        if lat is None or lon is None or not shelter_index:
+            return None
+        return shelter_index.documents_near(lat, lon, NEAREST_K)
+
+    def get_context(inputs):
+        with stage_timer("retrieval"):
+            query = as_query(inputs)
+            docs = nearby_docs(query)
+            if docs is None:
+                docs = retriever.retrieve(query["question"], query.get("vector"))
+            return format_docs(docs)
+
+    async def aget_context(inputs):
+        with stage_timer("retrieval"):
+            query = as_query(inputs)
+            docs = nearby_docs(query)
+            if docs is None:
+                docs = await retriever.aretrieve(query["question"], query.get("vector"))
+            return format_docs(docs)
+
+    def call_llm(prompt_value):
+        with stage_timer("llm"):
+            return chat.invoke(prompt_value)
+
+    async def acall_llm(prompt_value):
+        with stage_timer("llm"):
+            return await chat.ainvoke(prompt_value)
+
     rag_chain = (
-        {"context": retriever | format_docs, "question": RunnablePassthrough()}
+        {
+            "context": RunnableLambda(get_context, afunc=aget_context),
+            "question": RunnableLambda(lambda inputs: as_query(inputs)["question"]),
+        }
         | prompt
-        | chat
+        | RunnableLambda(call_llm, afunc=acall_llm)
         | StrOutputParser()
     )
 
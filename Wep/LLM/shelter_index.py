@@ -0,0 +1,227 @@
+import os
+import re
+import json
+import math
+import logging
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+import numpy as np
+from langchain_core.documents import Document
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+from index_store import INDEX_DIR
+
+
+# --------------------------
+# 설정
+# --------------------------
+GEOCODE_CACHE_PATH = os.path.join(INDEX_DIR, "shelter_geocode.json")
+KAKAO_API_KEY = os.environ.get("KAKAO_REST_API_KEY")
+KAKAO_ADDRESS_URL = "https://dapi.kakao.com/v2/local/search/address.json"
+NEAREST_K = int(os.environ.get("RAG_SHELTER_K", 3))
+
+EARTH_RADIUS_M = 6371000.0
+
+Shelter = namedtuple("Shelter", ["name", "address", "area", "capacity", "amenities", "lon", "lat"])
+
+# safezone.pdf 한 행: "경상북도 포항시 <구> [<읍/면>] <도로명> <번지>[, <상세>] [(<참고>)] <시설명> <규모> <수용인원> <편의시설>"
+ROW_PATTERN = re.compile(
+    r"^(?P<address>경상북도 포항시 [북남]구 (?:\S+[읍면] )?\S+ \d+(?:-\d+)?(?:, \S+)?)"
+    r"(?: \((?P<note>[^)]*)\))? (?P<name>.+?) (?P<area>\d[\d,]*) (?P<capacity>\d[\d,]*) ?(?P<amenities>.*)$"
+)
+
+
+def _pdf_text(pdf_path):
+    """PDF 텍스트를 한 줄로 (pypdf가 글자 조각마다 넣는 줄바꿈 제거)"""
+    from pypdf import PdfReader
+
+    pages = [page.extract_text() or "" for page in PdfReader(pdf_path).pages]
+    text = " ".join(p.replace("\n \n", " ").replace("\n", "") for p in pages)
+    return " ".join(text.split())
+
+
+def parse_shelters(pdf_path):
+    """
+    대피소 현황 PDF에서 대피소 행을 추출 (좌표는 아직 없음)
+
+    Returns:
+        list[Shelter]: lon/lat은 None
+    """
+    shelters = []
+    for record in re.split(r"(?=경상북도 포항시 )", _pdf_text(pdf_path)):
+        m = ROW_PATTERN.match(record.strip())
+        if m is None:
+            continue
+        amenities = m.group("amenities").strip()
+        shelters.append(Shelter(
+            name=m.group("name"),
+            address=m.group("address"),
+            area=int(m.group("area").replace(",", "")),
+            capacity=int(m.group("capacity").replace(",", "")),
+            amenities="" if amenities == "-" else amenities,
+            lon=None,
+            lat=None,
+        ))
+    return shelters
+
+
+# --------------------------
+# 지오코딩
+# --------------------------
+class KakaoGeocoder:
+    """카카오 로컬 주소 검색 API로 도로명주소 → (경도, 위도)"""
+
+    def __init__(self, api_key=KAKAO_API_KEY, timeout=5.0):
+        if not api_key:
+            raise ValueError("KAKAO_REST_API_KEY가 설정되지 않았습니다.")
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def geocode(self, address):
+        url = KAKAO_ADDRESS_URL + "?" + urllib.parse.urlencode({"query": address})
+        request = urllib.request.Request(url, headers={"Authorization": f"KakaoAK {self.api_key}"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            documents = json.load(response).get("documents", [])
+        if not documents:
+            return None
+        return float(documents[0]["x"]), float(documents[0]["y"])
+
+
+class CachedGeocoder:
+    """
+    지오코딩 결과를 JSON 파일에 저장해 두고 재사용 (주소 → [경도, 위도] 또는 null)
+    geocoder가 없으면 캐시에 있는 주소만 좌표를 돌려줌
+    """
+
+    def __init__(self, geocoder=None, cache_path=GEOCODE_CACHE_PATH):
+        self.geocoder = geocoder
+        self.cache_path = cache_path
+        self.cache = {}
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                self.cache = json.load(f)
+        self._dirty = False
+
+    def geocode(self, address):
+        # 주소 끝의 ", 101동" 같은 상세 정보는 검색에 방해가 되므로 뗌
+        query = address.split(",")[0]
+        if query not in self.cache:
+            if self.geocoder is None:
+                return None
+            try:
+                self.cache[query] = self.geocoder.geocode(query)
+            except Exception as e:
+                logging.warning(f"지오코딩 실패 ({query}): {e}")
+                return None
+            self._dirty = True
+        coords = self.cache[query]
+        return tuple(coords) if coords else None
+
+    def save(self):
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.cache, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.cache_path)
+        self._dirty = False
+
+
+def default_geocoder():
+    """API 키가 있으면 카카오 지오코더 + 캐시, 없으면 캐시만"""
+    geocoder = KakaoGeocoder() if KAKAO_API_KEY else None
+    return CachedGeocoder(geocoder)
+
+
+# --------------------------
+# 공간 인덱스
+# --------------------------
+def _to_xyz(lat, lon):
+    """위경도 → 지구 중심 3차원 좌표 (m). 유클리드 거리가 곧 현(chord) 거리"""
+    lat, lon = np.radians(lat), np.radians(lon)
+    return EARTH_RADIUS_M * np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+class ShelterIndex:
+    """
+    좌표가 있는 대피소의 최근접 검색 인덱스
+    scipy가 있으면 KD-tree, 없으면 전체 거리를 한 번에 계산 (대피소 수가 적어 충분히 빠름)
+    """
+
+    def __init__(self, shelters):
+        self.shelters = [s for s in shelters if s.lat is not None and s.lon is not None]
+        lat = np.array([s.lat for s in self.shelters], dtype=np.float64)
+        lon = np.array([s.lon for s in self.shelters], dtype=np.float64)
+        self.points = _to_xyz(lat, lon)
+        self.tree = cKDTree(self.points) if cKDTree is not None and len(self.shelters) else None
+
+    def __len__(self):
+        return len(self.shelters)
+
+    def nearest(self, lat, lon, k=NEAREST_K):
+        """가까운 순서로 [(Shelter, 거리 m), ...]"""
+        k = min(k, len(self.shelters))
+        if k == 0:
+            return []
+        query = _to_xyz(np.array([lat]), np.array([lon]))[0]
+        if self.tree is not None:
+            chord, idx = self.tree.query(query, k=k)
+            chord, idx = np.atleast_1d(chord), np.atleast_1d(idx)
+        else:
+            dist = np.linalg.norm(self.points - query, axis=1)
+            idx = np.argsort(dist)[:k]
+            chord = dist[idx]
+        # 현 거리 → 대원 거리
+        arc = 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(chord / (2 * EARTH_RADIUS_M), 1.0))
+        return [(self.shelters[i], float(d)) for i, d in zip(idx.tolist(), arc.tolist())]
+
+    def documents_near(self, lat, lon, k=NEAREST_K):
+        """가까운 대피소들을 RAG 컨텍스트용 Document로 (가까운 순서)"""
+        docs = []
+        for rank, (s, dist) in enumerate(self.nearest(lat, lon, k), start=1):
+            lines = [
+                f"{rank}. 시설명: {s.name}",
+                f"   위치: {s.address}",
+                f"   거리: 약 {int(math.ceil(dist / 10.0) * 10)}m",
+                f"   최대 수용인원: {s.capacity:,}명 (규모 {s.area:,}㎡)",
+            ]
+            if s.amenities:
+                lines.append(f"   이동약자 편의시설: {s.amenities}")
+            docs.append(Document(page_content="\n".join(lines),
+                                 metadata={"source": "safezone.pdf", "name": s.name, "distance_m": dist}))
+        return docs
+
+
+def build_shelter_index(pdf_path, geocoder=None):
+    """
+    PDF에서 대피소를 추출하고 좌표를 붙여 ShelterIndex를 만듦
+    (지오코딩 결과는 캐시되므로 두 번째 실행부터는 API를 호출하지 않음)
+    """
+    geocoder = geocoder or default_geocoder()
+    shelters = []
+    for s in parse_shelters(pdf_path):
+        coords = geocoder.geocode(s.address)
+        if coords is not None:
+            s = s._replace(lon=coords[0], lat=coords[1])
+        shelters.append(s)
+    if hasattr(geocoder, "save"):
+        geocoder.save()
+
+    index = ShelterIndex(shelters)
+    logging.info(f"대피소 {len(shelters)}곳 중 {len(index)}곳 좌표 확보")
+    return index
+
+
+if __name__ == "__main__":
+    # 지오코딩 캐시 미리 채우기: KAKAO_REST_API_KEY=... python shelter_index.py
+    import sys
+
+    pdf_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "safezone.pdf")
+    index = build_shelter_index(pdf_path)
+    print(f"대피소 좌표 {len(index)}곳")
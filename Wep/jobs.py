@@ -0,0 +1,503 @@
+# jobs.py
+import os
+import sys
+import json
+import time
+import uuid
+import tempfile
+import asyncio
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.managers import BaseManager
+
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+from CSV_Converter import csv_convert as con
+# CSV_Converter 모듈들이 쓰는 것과 같은 모듈 객체가 되도록 최상위 이름으로 임포트
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "CSV_Converter"))
+import shared_weights
+import stage_metrics
+
+
+# --------------------------
+# 설정
+# --------------------------
+JOB_WORKERS = int(os.environ.get("FIRE_JOB_WORKERS", 1))
+MAX_PENDING = int(os.environ.get("FIRE_JOB_MAX_PENDING", 8))  # 대기 + 실행 중인 작업 수 상한
+MAX_FINISHED = 32  # 결과를 들고 있는 완료 작업 수 (오래된 것부터 버림)
+# serve.py가 띄운 공유 추론 서비스 주소 ("host:port"). 있으면 API 워커는 직접 추론하지 않고 여기에 맡김
+INFERENCE_ADDRESS = os.environ.get("FIRE_INFERENCE_ADDRESS")
+INFERENCE_AUTHKEY = os.environ.get("FIRE_INFERENCE_AUTHKEY", "")
+
+# 작업 워커가 결과 행을 그룹마다 바로 써 두는 NDJSON 디렉터리 (/process/stream이 따라 읽음)
+# serve.py의 런처와 API 워커가 같은 호스트에서 같은 경로를 봄
+STREAM_DIR = os.environ.get("FIRE_JOB_STREAM_DIR", os.path.join(tempfile.gettempdir(), "fire_job_streams"))
+STREAM_POLL = 0.1  # 새 행이 없을 때 다시 확인하는 간격 (초)
+
+SCAN_EXTENSIONS = (".jpg", ".png", ".json")
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def scan_key(model_path, forecast_model, horizon_minutes):
+    """
+    스캔 입력 집합의 지문: 이미지/라벨 파일 목록(이름, 크기, mtime) + 모델 가중치 + 예측 설정.
+    입력이 같으면 결과도 같으므로 같은 지문의 요청은 하나의 작업을 공유한다.
+    """
+    h = hashlib.sha1()
+    for folder in (con.IMG_FOLDER, con.JSON_FOLDER):
+        try:
+            entries = sorted(
+                (e for e in os.scandir(folder) if e.name.endswith(SCAN_EXTENSIONS)),
+                key=lambda e: e.name,
+            )
+        except FileNotFoundError:
+            entries = []
+        h.update(f"{folder}:{len(entries)}\n".encode())
+        for e in entries:
+            st = e.stat()
+            h.update(f"{e.name}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    h.update(con.weights_hash(model_path).encode())
+    h.update(f"{forecast_model}|{horizon_minutes}".encode())
+    return h.hexdigest()
+
+
+# --------------------------
+# 워커 프로세스
+# --------------------------
+_worker_ready = False
+
+
+def _init_worker(model_path):
+    # 워커마다 한 번만 모델을 로드/워밍업
+    global _worker_ready
+    try:
+        con.model_registry.swap(model_path)
+        _worker_ready = True
+    except Exception as e:
+        print(f"[WARN] 작업 워커 모델 로드 실패: {e}")
+
+
+def _ping():
+    # 워커가 떠서 모델 워밍업까지 끝났는지 확인용
+    return _worker_ready
+
+
+def _swap_model(model_path):
+    # 워커 하나에서 새 모델을 로드/워밍업해 보고 교체 (나머지 워커는 다음 작업에서 맞춤)
+    predictor = con.model_registry.swap(model_path)
+    return {"model_path": predictor.model_path, "weights_hash": predictor.weights_hash}
+
+
+def _scan(model_path, forecast_model, horizon_minutes, stream_path):
+    # 서버에서 /model로 교체했을 수 있으므로 요청 시점의 모델로 맞춤 (같으면 그대로 사용)
+    con.model_registry.swap(model_path)
+    # fire_id 그룹이 끝날 때마다 행을 파일에 써서 /process/stream이 작업 완료 전에 보낼 수 있게 함
+    rows = []
+    with open(stream_path, "w", encoding="utf-8") as f:
+        for row in con.iter_rows(forecast_model=forecast_model, horizon_minutes=horizon_minutes):
+            rows.append(row)
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            f.flush()
+    return rows
+
+
+def _run_scan(model_path, forecast_model, horizon_minutes, stream_path):
+    # (결과 행, 단계별 추적): 워커에서 잰 decode/predict/geo/forecast 시간을 요청의 Server-Timing에 합치기 위함
+    return stage_metrics.run_traced(_scan, model_path, forecast_model, horizon_minutes, stream_path)
+
+
+def stream_path(job_id):
+    return os.path.join(STREAM_DIR, f"{job_id}.ndjson")
+
+
+def tail_rows(path, finished, poll=STREAM_POLL):
+    """
+    작업 워커가 쓰는 NDJSON 파일을 따라 읽으며 행(dict)을 반환
+
+    Args:
+        finished: 작업이 끝났으면 True (실패했으면 예외를 던짐). 끝난 뒤 남은 행까지 읽고 종료
+    """
+    buffer = ""
+    f = None
+    try:
+        while True:
+            # 먼저 완료 여부를 보고 읽어야 완료 직전에 쓰인 행까지 빠짐없이 읽음
+            done = finished()
+            if f is None and os.path.exists(path):
+                f = open(path, encoding="utf-8")
+            if f is not None:
+                buffer += f.read()
+                *lines, buffer = buffer.split("\n")
+                for line in lines:
+                    if line:
+                        yield json.loads(line)
+            if done:
+                return
+            time.sleep(poll)
+    finally:
+        if f is not None:
+            f.close()
+
+
+class Job:
+    def __init__(self, key, params, future, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.key = key
+        self.params = params
+        self.future = future
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def status(self):
+        if self.future.running():
+            return "running"
+        if not self.future.done():
+            return "queued"
+        if self.future.cancelled():
+            return "cancelled"
+        return "failed" if self.future.exception() is not None else "done"
+
+    def to_dict(self, include_result=False):
+        info = {
+            "job_id": self.id,
+            "status": self.status,
+            "params": self.params,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == "failed":
+            info["error"] = str(self.future.exception())
+        elif include_result and self.status == "done":
+            info["data"] = self.future.result()[0]
+        return info
+
+
+class JobManager:
+    """
+    /process 스캔 작업 관리자
+
+    - 같은 입력 집합(scan_key)의 작업이 진행 중이면 새로 만들지 않고 그 작업에 붙음
+    - 완료된 작업도 입력이 그대로면 결과를 재사용
+    - 추론은 크기가 제한된 프로세스 풀에서 실행되어 이벤트 루프를 막지 않음
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, max_pending=MAX_PENDING):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pool = None
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # job_id -> Job
+        self._by_key = {}  # scan_key -> Job
+        self._warm = []  # 워커 워밍업 확인용 future
+
+    def start(self, model_path=None):
+        model_path = model_path or con.model_registry.active_model_path()
+        # 스레드가 있는 서버 프로세스를 fork하지 않도록 spawn 사용
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_path,),
+        )
+        # 워커를 미리 띄워 모델을 로드해 둠 (첫 요청이 로드를 기다리지 않도록)
+        self._warm = [self._pool.submit(_ping) for _ in range(self.max_workers)]
+
+    def is_ready(self):
+        """모든 워커가 모델 워밍업을 마쳤는지"""
+        if self._pool is None or not self._warm:
+            return False
+        return all(f.done() and not f.cancelled() and f.exception() is None and f.result() for f in self._warm)
+
+    async def ready(self):
+        return self.is_ready()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        with self._lock:
+            for job in self._jobs.values():
+                self._remove_stream(job)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _pending_count(self):
+        return sum(1 for job in self._jobs.values() if not job.future.done())
+
+    def _forget_old(self):
+        finished = [job for job in self._jobs.values() if job.future.done()]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED)]:
+            del self._jobs[job.id]
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+            self._remove_stream(job)
+
+    @staticmethod
+    def _remove_stream(job):
+        try:
+            os.remove(stream_path(job.id))
+        except FileNotFoundError:
+            pass
+
+    def _on_done(self, job):
+        job.finished_at = time.time()
+        with self._lock:
+            # 실패/취소된 작업은 다음 요청이 다시 시도할 수 있도록 지문 연결을 끊음
+            failed = job.future.cancelled() or job.future.exception() is not None
+            if failed and self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+            self._forget_old()
+
+    async def submit(self, forecast_model=con.fire_forecast.DEFAULT_MODEL, horizon_minutes=None, model_path=None):
+        """스캔 작업을 만들거나, 같은 입력의 기존 작업을 반환"""
+        # 폴더 stat은 블로킹이므로 스레드에서
+        return await asyncio.to_thread(self.submit_sync, forecast_model, horizon_minutes, model_path)
+
+    def submit_sync(self, forecast_model=con.fire_forecast.DEFAULT_MODEL, horizon_minutes=None, model_path=None):
+        """submit의 동기 버전 (model_path가 없으면 현재 활성 모델)"""
+        if self._pool is None:
+            raise RuntimeError("작업 관리자가 시작되지 않았습니다.")
+        model_path = model_path or con.model_registry.active_model_path()
+        horizon_minutes = list(horizon_minutes) if horizon_minutes else con.fire_forecast.horizons()
+        key = scan_key(model_path, forecast_model, horizon_minutes)
+
+        with self._lock:
+            job = self._by_key.get(key)
+            if job is not None:
+                return job
+            if self._pending_count() >= self.max_pending:
+                raise JobQueueFull(f"대기 중인 작업이 너무 많습니다 ({self.max_pending}개).")
+
+            job_id = uuid.uuid4().hex
+            os.makedirs(STREAM_DIR, exist_ok=True)
+            future = self._pool.submit(_run_scan, model_path, forecast_model, horizon_minutes, stream_path(job_id))
+            job = Job(key, {"model_path": model_path, "forecast_model": forecast_model,
+                            "horizon_minutes": horizon_minutes}, future, job_id)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+        future.add_done_callback(lambda _: self._on_done(job))
+        return job
+
+    async def wait(self, job):
+        """
+        작업 결과 행을 기다림. 요청이 취소되어도 공유 중인 작업 자체는 취소하지 않음
+        작업 워커에서 잰 단계별 시간은 현재 요청의 추적(X-Trace)에 합침
+        """
+        try:
+            rows, trace = await asyncio.shield(asyncio.wrap_future(job.future))
+        except asyncio.CancelledError:
+            # 요청이 아니라 작업이 취소된 경우(서버 종료 등)는 일반 실패로 알림
+            if job.future.cancelled():
+                raise RuntimeError("작업이 취소되었습니다.")
+            raise
+        stage_metrics.merge_trace(trace)
+        return rows
+
+    def iter_rows(self, job):
+        """작업 결과 행을 fire_id 그룹이 끝날 때마다 반환하는 동기 제너레이터 (작업이 실패하면 예외)"""
+        def finished():
+            if not job.future.done():
+                return False
+            job.future.result()
+            return True
+
+        return tail_rows(stream_path(job.id), finished)
+
+    async def info(self, job_id, include_result=False, wait=False):
+        """작업 상태 dict (없으면 None). wait=True면 끝날 때까지 기다림"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if wait:
+            try:
+                await self.wait(job)
+            except Exception:
+                pass  # 실패 내용은 error에 담아 반환
+        return job.to_dict(include_result=include_result)
+
+    def active_model_path(self):
+        return con.model_registry.active_model_path()
+
+    def load_model(self, model_path):
+        """
+        작업 워커 하나에서 모델을 로드/워밍업해 보고 결과를 반환 (실패하면 예외)
+        공유 가중치를 쓰면 먼저 게시하고, 로드에 실패하면 이번에 게시한 파일은 지움
+        """
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"모델 파일이 없습니다: {model_path}")
+        published = False
+        try:
+            if model_path.endswith(".onnx") and shared_weights.ENABLED:
+                published = not all(os.path.exists(p) for p in shared_weights.shared_paths(model_path))
+                shared_weights.publish(model_path)
+            return self._pool.submit(_swap_model, model_path).result()
+        except BaseException:
+            if published:
+                shared_weights.unpublish(model_path)
+            raise
+
+    async def swap_model(self, model_path):
+        """
+        활성 탐지 모델 교체 (작업 워커는 다음 작업에서 같은 모델로 맞춤)
+        로드 확인도 작업 워커에서 하므로 이 프로세스는 모델을 들고 있지 않음
+        """
+        swapped = await asyncio.to_thread(self.load_model, model_path)
+        con.model_registry.set_active(model_path)
+        return swapped
+
+
+# --------------------------
+# 여러 API 워커가 공유하는 추론 서비스 (serve.py)
+# --------------------------
+class InferenceService:
+    """
+    런처 프로세스에서 JobManager 하나를 multiprocessing 매니저 서버로 노출.
+    API 워커가 여러 개여도 추론 워커 풀, 작업 목록, 중복 제거가 하나로 공유된다.
+    (매니저 서버는 연결마다 스레드에서 메서드를 호출하므로 모두 동기 메서드)
+    """
+
+    def __init__(self, manager, model_path):
+        self.manager = manager
+        self.model_path = model_path
+
+    def submit(self, forecast_model, horizon_minutes=None):
+        return self.manager.submit_sync(forecast_model, horizon_minutes, self.model_path).to_dict()
+
+    def info(self, job_id, include_result=False, wait=False):
+        job = self.manager.get(job_id)
+        if job is None:
+            return None
+        if wait:
+            try:
+                job.future.result()
+            except Exception:
+                pass
+        return job.to_dict(include_result=include_result)
+
+    def result(self, job_id):
+        """(결과 행, 단계별 추적)"""
+        job = self.manager.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job.future.result()
+
+    def ready(self):
+        return self.manager.is_ready()
+
+    def active_model_path(self):
+        return self.model_path
+
+    def swap_model(self, model_path):
+        # 추론 워커에서 로드/워밍업에 성공해야 새 작업에 쓰는 모델을 바꿈 (실패하면 예외가 API 워커로 전달됨)
+        swapped = self.manager.load_model(model_path)
+        self.model_path = model_path
+        return swapped
+
+
+class _InferenceManager(BaseManager):
+    pass
+
+
+def serve_inference(service, host="127.0.0.1", port=0, authkey=None):
+    """
+    InferenceService를 백그라운드 스레드의 매니저 서버로 띄움
+
+    Returns:
+        ("host:port", authkey 16진수 문자열)
+    """
+    authkey = authkey or os.urandom(16).hex()
+    _InferenceManager.register("service", callable=lambda: service)
+    server = _InferenceManager(address=(host, port), authkey=authkey.encode()).get_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    address = f"{server.address[0]}:{server.address[1]}"
+    return address, authkey
+
+
+class RemoteJob:
+    """RemoteJobManager.submit이 반환하는 작업 핸들 (JobManager의 Job과 같은 to_dict)"""
+
+    def __init__(self, info):
+        self.id = info["job_id"]
+        self.info = info
+
+    def to_dict(self, include_result=False):
+        return self.info
+
+
+class RemoteJobManager:
+    """
+    serve.py의 공유 추론 서비스에 작업을 맡기는 JobManager 대체 (API 워커 쪽).
+    프록시 호출은 블로킹이므로 모두 스레드에서 실행한다.
+    """
+
+    def __init__(self, address=INFERENCE_ADDRESS, authkey=INFERENCE_AUTHKEY):
+        host, port = address.rsplit(":", 1)
+        self.address = (host, int(port))
+        self.authkey = authkey.encode()
+        self._service = None
+
+    def start(self, model_path=None):
+        _InferenceManager.register("service")
+        manager = _InferenceManager(address=self.address, authkey=self.authkey)
+        manager.connect()
+        # 프록시는 스레드마다 따로 연결하므로 여러 스레드에서 같이 써도 됨
+        self._service = manager.service()
+
+    def shutdown(self):
+        self._service = None
+
+    async def ready(self):
+        if self._service is None:
+            return False
+        try:
+            return await asyncio.to_thread(self._service.ready)
+        except Exception:
+            return False
+
+    async def submit(self, forecast_model=con.fire_forecast.DEFAULT_MODEL, horizon_minutes=None):
+        if self._service is None:
+            raise RuntimeError("작업 관리자가 시작되지 않았습니다.")
+        return RemoteJob(await asyncio.to_thread(self._service.submit, forecast_model, horizon_minutes))
+
+    async def wait(self, job):
+        rows, trace = await asyncio.to_thread(self._service.result, job.id)
+        stage_metrics.merge_trace(trace)
+        return rows
+
+    def iter_rows(self, job):
+        """JobManager.iter_rows와 같음 (완료 여부는 추론 서비스에 물어봄)"""
+        def finished():
+            info = self._service.info(job.id)
+            if info is None:
+                raise KeyError(job.id)
+            if info["status"] == "failed":
+                raise RuntimeError(info["error"])
+            if info["status"] == "cancelled":
+                raise RuntimeError("작업이 취소되었습니다.")
+            return info["status"] == "done"
+
+        return tail_rows(stream_path(job.id), finished)
+
+    async def info(self, job_id, include_result=False, wait=False):
+        return await asyncio.to_thread(self._service.info, job_id, include_result, wait)
+
+    def active_model_path(self):
+        return self._service.active_model_path()
+
+    async def swap_model(self, model_path):
+        return await asyncio.to_thread(self._service.swap_model, model_path)
+
+
+def create_job_manager():
+    """FIRE_INFERENCE_ADDRESS가 있으면 공유 추론 서비스, 없으면 프로세스 안의 작업 풀"""
+    if INFERENCE_ADDRESS:
+        return RemoteJobManager()
+    return JobManager()
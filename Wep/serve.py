@@ -0,0 +1,65 @@
+# serve.py
+"""
+운영용 실행기: API 워커 N개 + 공유 추론 워커 풀 하나
+
+- 추론 워커 풀(JobManager)은 이 런처 프로세스에 하나만 두고, 매니저 서버로 API 워커들에게 공유
+  (워커마다 모델을 따로 들고 있지 않고, 작업 목록/중복 제거도 하나로 합쳐짐)
+- .onnx 모델이면 가중치를 /dev/shm에 한 번 게시하고 모든 추론 워커가 같은 페이지를 매핑
+- API 워커는 /readyz가 200이 될 때(추론 워커 워밍업 완료)부터 트래픽을 받으면 됨
+
+사용 예:
+    python serve.py --workers 4 --inference-workers 2 --model /path/best.onnx
+"""
+import os
+import sys
+import shutil
+import argparse
+import uvicorn
+
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+from CSV_Converter import csv_convert as con
+# CSV_Converter 모듈들이 쓰는 것과 같은 모듈 객체가 되도록 최상위 이름으로 임포트
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(os.path.dirname(__file__))), "CSV_Converter"))
+import shared_weights
+import stage_metrics
+import jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="화재 탐지/RAG API 서버 (다중 워커)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="API 워커 프로세스 수")
+    parser.add_argument("--inference-workers", type=int, default=jobs.JOB_WORKERS, help="추론 워커 프로세스 수")
+    parser.add_argument("--model", default=None, help="탐지 모델 경로 (기본: FIRE_MODEL_PATH)")
+    parser.add_argument("--no-shared-weights", action="store_true", help=".onnx 가중치를 공유 메모리에 올리지 않음")
+    args = parser.parse_args()
+
+    model_path = args.model or con.model_registry.active_model_path()
+    # 자식 프로세스(추론 워커, API 워커)는 spawn되면서 이 환경 변수를 물려받음
+    os.environ["FIRE_MODEL_PATH"] = model_path
+    if model_path.endswith(".onnx") and not args.no_shared_weights:
+        shared_weights.publish(model_path)
+        shared_weights.ENABLED = True
+        os.environ["FIRE_SHARED_WEIGHTS"] = "1"
+
+    # 모든 워커가 같은 디렉터리에 단계별 지표를 써서 어느 API 워커의 /metrics든 전체 합계를 보여줌
+    metrics_dir = stage_metrics.share_across_processes()
+
+    manager = jobs.JobManager(max_workers=args.inference_workers)
+    manager.start(model_path)
+    address, authkey = jobs.serve_inference(jobs.InferenceService(manager, model_path))
+    os.environ["FIRE_INFERENCE_ADDRESS"] = address
+    os.environ["FIRE_INFERENCE_AUTHKEY"] = authkey
+    print(f"[INFO] 추론 서비스 {address} (워커 {args.inference_workers}개), API 워커 {args.workers}개")
+
+    try:
+        uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers,
+                    app_dir=os.path.dirname(os.path.abspath(__file__)))
+    finally:
+        manager.shutdown()
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
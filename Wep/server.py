@@ -1,33 +1,66 @@
 # server.py
 from LLM import llmrag
-from fastapi import FastAPI, HTTPException
+from LLM.answer_cache import AnswerCache, location_scope, normalize
+from LLM.batching import Coalescer
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware  # 추가
 from pydantic import BaseModel
 import uvicorn
-import sys, os
-from typing import List, Dict
+import sys, os, json, time, shutil
+from typing import List, Dict, Optional
 from contextlib import asynccontextmanager
 
 sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
 from CSV_Converter import csv_convert as con
+from jobs import create_job_manager, JobQueueFull, INFERENCE_ADDRESS
+# CSV_Converter 모듈들이 쓰는 것과 같은 모듈 객체가 되도록 최상위 이름으로 임포트
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(os.path.dirname(__file__))), "CSV_Converter"))
+import stage_metrics
 
 # 1단계에서 수정한 llmrag 모듈에서 RAG 체인 생성 함수를 임포트
 
 # RAG 체인을 저장할 전역 변수
 rag_chain = None
-# # 서버 시작 시 모델을 로드하기 위한 lifespan 관리자
-# @asynccontextmanager
-# async def lifespan(app: FastAPI):
-#     global rag_chain
-#     print("서버 시작: RAG 모델을 로드합니다...")
-#     # 서버가 시작될 때 단 한번만 RAG 체인을 생성
-#     rag_chain = llmrag.create_rag_chain()
-#     print("RAG 모델 로드 완료.")
-#     yield
-#     print("서버 종료.")
+# /process 스캔 작업 관리자 (같은 입력의 동시 요청은 스캔 한 번을 공유)
+# serve.py로 띄우면 모든 API 워커가 런처의 추론 워커 풀 하나를 같이 씀
+job_manager = create_job_manager()
+# /llm 답변 캐시 (비슷한 질문이 몰릴 때 검색/LLM 호출을 건너뜀)
+answer_cache = AnswerCache()
+# 같은 질문(같은 위치 범위)이 동시에 들어오면 RAG 호출 한 번을 공유
+rag_coalescer = Coalescer()
+# 이 헤더가 "1"인 요청은 단계별 소요 시간을 Server-Timing 응답 헤더로 돌려줌
+TRACE_HEADER = "X-Trace"
+
+
+# 서버 시작 시 모델을 로드하기 위한 lifespan 관리자
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global rag_chain
+    # 작업 워커에서 잰 단계별 시간도 /metrics에 합쳐지도록 워커를 띄우기 전에 설정 (serve.py는 런처가 설정)
+    owned_metrics_dir = None if stage_metrics.METRICS_DIR else stage_metrics.share_across_processes()
+    # 탐지는 모두 작업 워커(또는 공유 추론 서비스)에서 하므로 API 프로세스는 모델을 로드하지 않음
+    if INFERENCE_ADDRESS:
+        print(f"서버 시작: 공유 추론 서비스 사용 ({INFERENCE_ADDRESS})")
+    else:
+        print("서버 시작: 작업 워커에서 화재 탐지 모델을 로드합니다...")
+    job_manager.start()
+    print("서버 시작: RAG 모델을 로드합니다...")
+    # 서버가 시작될 때 단 한번만 RAG 체인을 생성 (임베딩/인덱스는 디스크 캐시에서 읽음)
+    try:
+        rag_chain = llmrag.create_rag_chain()
+        print("RAG 모델 로드 완료.")
+    except Exception as e:
+        # RAG 없이도 탐지 API는 동작하도록 함 (/llm은 503)
+        print(f"RAG 모델 로드 실패: {e}")
+    yield
+    job_manager.shutdown()
+    if owned_metrics_dir:
+        shutil.rmtree(owned_metrics_dir, ignore_errors=True)
+    print("서버 종료.")
 
 # FastAPI 앱 생성
-app = FastAPI(title="Azure VM FastAPI Server")
+app = FastAPI(title="Azure VM FastAPI Server", lifespan=lifespan)
 
 # --------------------------
 # CORS 설정
@@ -43,26 +76,210 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],    # GET, POST 등 모든 메서드 허용
     allow_headers=["*"],    # 모든 헤더 허용
+    expose_headers=["Server-Timing"],  # 브라우저에서 단계별 시간 확인용
 )
 
+
+@app.middleware("http")
+async def trace_stages(request: Request, call_next):
+    """
+    X-Trace: 1 요청만 단계별(decode, predict, geo, retrieval, llm 등) 소요 시간을 모아
+    Server-Timing 헤더로 반환 (작업 워커에서 실행된 단계는 job_manager.wait가 작업 결과와 함께 받아 합침.
+    같은 입력의 스캔을 공유했으면 그 스캔의 시간, 헤더를 먼저 보내는 /process/stream은 포함되지 않음)
+    """
+    if request.headers.get(TRACE_HEADER) != "1":
+        return await call_next(request)
+    trace = stage_metrics.start_trace()
+    start = time.perf_counter()
+    response = await call_next(request)
+    trace["total"] = time.perf_counter() - start
+    response.headers["Server-Timing"] = stage_metrics.server_timing(trace)
+    return response
+
 # --------------------------
 # POST 엔드포인트 정의
 # --------------------------
 
 
+async def _submit_scan(forecast_model=con.fire_forecast.DEFAULT_MODEL):
+    if forecast_model not in con.fire_forecast.MODELS:
+        raise HTTPException(status_code=400, detail=f"forecast_model은 {sorted(con.fire_forecast.MODELS)} 중 하나여야 합니다.")
+    try:
+        return await job_manager.submit(forecast_model)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
 @app.post("/process")
 @app.get("/process") 
-def process_request():
+async def process_request():
     """
     요청을 기반으로 run_script 실행 후, 관측 + 예측 데이터를 반환
+    (진행 중인 같은 입력의 스캔이 있으면 새로 돌리지 않고 그 결과를 기다림)
+    """
+    job = await _submit_scan()
+    try:
+        result: List[Dict] = await job_manager.wait(job)  # run_script() 결과 리스트
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"스캔 작업 실패: {e}")
+    with stage_metrics.stage_timer("serialization", len(result)):
+        return JSONResponse({"status": "success", "data": result})
+
+
+@app.post("/jobs/process", status_code=202)
+async def submit_process_job(forecast_model: str = con.fire_forecast.DEFAULT_MODEL):
+    """
+    스캔 작업을 등록하고 바로 job_id를 반환 (결과는 GET /jobs/{job_id}로 조회)
+    """
+    job = await _submit_scan(forecast_model)
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: bool = False):
+    """
+    작업 상태 조회. 완료되면 data에 run_script 결과가 들어감
+    - wait=true: 끝날 때까지 기다렸다가 응답
     """
-    result: List[Dict] = con.run_script()  # run_script() 호출, 리스트 반환
-    return {"status": "success", "data": result}
+    info = await job_manager.info(job_id, include_result=True, wait=wait)
+    if info is None:
+        raise HTTPException(status_code=404, detail="작업을 찾을 수 없습니다.")
+    with stage_metrics.stage_timer("serialization", len(info.get("data") or [])):
+        return JSONResponse(info)
+
+
+@app.get("/process/stream")
+async def process_stream(format: str = "ndjson", forecast_model: str = con.fire_forecast.DEFAULT_MODEL):
+    """
+    run_script 결과를 fire_id 그룹이 끝날 때마다 바로 전송 (관측 행 다음에 예측 행)
+    스캔은 /process와 같은 작업으로 돌고 (같은 입력이면 공유), 작업 워커가 쓰는 행을 따라 읽어 보냄
+    - format=ndjson: 한 줄에 JSON 행 하나 (application/x-ndjson)
+    - format=sse: Server-Sent Events, 행마다 data 이벤트를 보내고 마지막에 end 이벤트
+    - forecast_model: linear / acceleration / kalman
+    """
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format은 ndjson 또는 sse만 가능합니다.")
+    job = await _submit_scan(forecast_model)
+    rows = job_manager.iter_rows(job)
+
+    def ndjson_lines():
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+
+    def sse_events():
+        for row in rows:
+            yield f"data: {json.dumps(row, ensure_ascii=False)}\n\n"
+        yield "event: end\ndata: {}\n\n"
+
+    # 동기 제너레이터는 스레드 풀에서 돌기 때문에 작업을 기다리는 동안에도 이벤트 루프가 막히지 않음
+    if format == "sse":
+        return StreamingResponse(sse_events(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
+@app.get("/tracks")
+def query_tracks(
+    t0: Optional[str] = None,
+    t1: Optional[str] = None,
+    lon_min: Optional[float] = None,
+    lat_min: Optional[float] = None,
+    lon_max: Optional[float] = None,
+    lat_max: Optional[float] = None,
+    data_type: Optional[str] = None,
+    fire_id: Optional[str] = None,
+):
+    """
+    저장된 화재 궤적 중 [t0, t1] 구간에 지도 뷰포트와 겹치는 행을 반환 (추론/재계산 없음)
+    - t0, t1: "YYYY-mm-dd HH:MM:SS"
+    - 뷰포트는 lon_min, lat_min, lon_max, lat_max 네 값을 모두 줘야 적용됨
+    """
+    viewport = (lon_min, lat_min, lon_max, lat_max)
+    if any(v is None for v in viewport):
+        if any(v is not None for v in viewport):
+            raise HTTPException(status_code=400, detail="뷰포트는 lon_min, lat_min, lon_max, lat_max를 모두 지정해야 합니다.")
+        viewport = None
+    if data_type is not None and data_type not in con.fire_track_store.DATA_TYPES:
+        raise HTTPException(status_code=400, detail="data_type은 observed 또는 predicted만 가능합니다.")
+
+    try:
+        rows = con.fire_track_store.get_store().query(t0, t1, viewport, data_type, fire_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"잘못된 시각 형식입니다: {e}")
+    return {"status": "success", "data": rows}
+
+
+# 모델 교체 요청 본문
+class ModelSwap(BaseModel):
+    model_path: str
+
+@app.post("/model")
+async def swap_model(body: ModelSwap):
+    """
+    서버 재시작 없이 탐지 모델(best.pt) 경로를 교체
+    """
+    try:
+        swapped = await job_manager.swap_model(body.model_path)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        # 로드/워밍업에 실패하면 기존 모델을 그대로 씀
+        raise HTTPException(status_code=400, detail=f"모델 로드 실패: {e}")
+    return {"status": "success", **swapped}
+
+
+# --------------------------
+# 헬스 체크 / 지표
+# --------------------------
+@app.get("/healthz")
+def healthz():
+    """프로세스가 살아 있으면 200 (liveness)"""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """
+    탐지 워커가 모델 워밍업을 마쳐야 200, 그 전에는 503 (로드 밸런서가 트래픽을 보내지 않도록)
+    RAG는 없어도 탐지 API는 동작하므로 상태만 알려줌
+    """
+    detection = await job_manager.ready()
+    body = {"status": "ready" if detection else "starting", "detection": detection, "rag": rag_chain is not None}
+    if not detection:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus 형식 지표
+    - fire_stage_seconds: 단계별 소요 시간 히스토그램 (API 워커 + 추론 워커 합산)
+    - fire_stage_items_total: 단계별 처리 건수 (이미지/행/질문)
+    - fire_model_info: 현재 탐지 모델 (모델 교체 전후 비교용)
+    """
+    extra = []
+    model_path = job_manager.active_model_path()
+    try:
+        model_hash = con.weights_hash(model_path)
+        extra = [
+            "# HELP fire_model_info 현재 활성 탐지 모델",
+            "# TYPE fire_model_info gauge",
+            f'fire_model_info{{model_path="{model_path}",weights_hash="{model_hash}"}} 1',
+        ]
+    except OSError:
+        pass
+    return PlainTextResponse(stage_metrics.render_prometheus(extra), media_type="text/plain; version=0.0.4")
 
 
 # 요청 본문을 위한 Pydantic 모델 정의
 class Query(BaseModel):
     question: str
+    # 사용자 위치 (있으면 가까운 대피소만 컨텍스트로 사용)
+    lat: Optional[float] = None
+    lon: Optional[float] = None
 	
 @app.post("/llm")
 async def process_request(query: Query):
@@ -72,19 +289,39 @@ async def process_request(query: Query):
     if not rag_chain:
         raise HTTPException(status_code=503, detail="모델이 아직 준비되지 않았습니다.")
 
-    # 2. RAG 모델 호출하여 답변 생성
+    # 1. 캐시 확인 (인덱스가 다시 만들어졌으면 비워짐)
+    answer_cache.set_version(llmrag.index_version)
+    scope = location_scope(query.lat, query.lon)
+    cached = answer_cache.get(query.question, scope=scope)
+    vector = None
+    if cached is None and llmrag.embeddings is not None:
+        try:
+            vector = await llmrag.embeddings.aembed_query(query.question)
+            cached = answer_cache.get(query.question, vector, scope)
+        except Exception as e:
+            print(f"질문 임베딩 실패, 유사 질문 캐시를 건너뜀: {e}")
+    if cached is not None:
+        return {"status": "success", "rag_answer": cached, "cached": True}
+
+    # 2. RAG 모델 호출하여 답변 생성 (캐시 조회에 쓴 질문 임베딩을 검색에 그대로 넘겨 다시 임베딩하지 않음)
     try:
-        rag_answer = await rag_chain.ainvoke(query.question)
+        rag_answer = await rag_coalescer.run(
+            (scope, normalize(query.question)),
+            lambda: rag_chain.ainvoke({"question": query.question, "lat": query.lat, "lon": query.lon,
+                                       "vector": vector}),
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"RAG 모델 호출 중 오류: {e}")
+    answer_cache.put(query.question, rag_answer, vector, scope)
 
     # 3. 두 결과를 통합하여 반환
     return {
         "status": "success",
         "rag_answer": rag_answer,
+        "cached": False,
     }
 
 
-# 서버 실행
+# 서버 실행 (개발용 단일 프로세스, 운영은 serve.py)
 if __name__ == "__main__":
-    uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("server:app", host="0.0.0.0", port=8000)
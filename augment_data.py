@@ -2,85 +2,223 @@ import cv2
 import numpy as np
 import os
 import glob
-import random
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 
 
-def apply_domain_adaptation(image_dir, label_dir, bg_dir, output_image_dir, output_label_dir):
+class BackgroundPool:
     """
-    Randomized된 이미지의 객체를 추출하여 새로운 배경에 합성
+    배경 이미지를 한 번만 디코딩해서 shared memory 하나에 이어 붙여 둔 캐시.
+    워커 프로세스는 이름으로 붙기만 하므로 배경을 다시 읽거나 복사하지 않는다.
     """
-    print(f"'{image_dir}'에 대한 Domain Adaptation(배경 교체)을 시작합니다.")
-
-    os.makedirs(output_image_dir, exist_ok=True)
-    os.makedirs(output_label_dir, exist_ok=True)
-
-    bg_images = glob.glob(os.path.join(bg_dir, '*.*'))
-    if not bg_images:
-        print(f"경고: '{bg_dir}'에 배경 이미지가 없습니다. 이 단계를 건너뜁니다.")
-        return
 
-    label_files = glob.glob(os.path.join(label_dir, '*.txt'))
-
-    for label_path in label_files:
+    def __init__(self, shm, layout, owner=False):
+        self.shm = shm
+        self.layout = layout  # [(offset, shape), ...]
+        self.owner = owner
+        self.images = [
+            np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+            for offset, shape in layout
+        ]
+
+    @classmethod
+    def load(cls, bg_paths):
+        decoded = [img for img in (cv2.imread(p) for p in bg_paths) if img is not None]
+        if not decoded:
+            return None
+
+        layout, offset = [], 0
+        for img in decoded:
+            layout.append((offset, img.shape))
+            offset += img.nbytes
+        shm = shared_memory.SharedMemory(create=True, size=offset)
+        pool = cls(shm, layout, owner=True)
+        for dst, img in zip(pool.images, decoded):
+            dst[:] = img
+        return pool
+
+    @classmethod
+    def attach(cls, name, layout):
+        return cls(shared_memory.SharedMemory(name=name), layout)
+
+    def __len__(self):
+        return len(self.images)
+
+    def close(self):
+        self.images = []
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# 워커 프로세스 전역 상태
+_backgrounds = None
+_rng = None
+
+
+def _init_worker(shm_name, layout):
+    global _backgrounds, _rng
+    _backgrounds = BackgroundPool.attach(shm_name, layout)
+    _rng = np.random.default_rng()
+    cv2.setNumThreads(0)
+
+
+def feather_mask(h, w, border=0.15):
+    """가장자리로 갈수록 0에 가까워지는 alpha 마스크 (h, w, 1)"""
+    ky = max(1, int(h * border)) | 1
+    kx = max(1, int(w * border)) | 1
+    mask = np.zeros((h, w), dtype=np.float32)
+    mask[ky // 2:h - ky // 2, kx // 2:w - kx // 2] = 1.0
+    return cv2.GaussianBlur(mask, (kx, ky), 0)[..., None]
+
+
+def paste_object(canvas, obj, x, y, blend='paste'):
+    """
+    canvas의 (x, y) 위치에 obj를 합성
+    - paste: 그대로 덮어쓰기 (기존 방식)
+    - alpha: 가장자리를 부드럽게 섞음
+    - poisson: cv2.seamlessClone (실패하면 alpha로 대체)
+    """
+    h, w = obj.shape[:2]
+    if blend == 'poisson':
+        try:
+            mask = np.full((h, w), 255, dtype=np.uint8)
+            center = (x + w // 2, y + h // 2)
+            canvas[:] = cv2.seamlessClone(obj, canvas, mask, center, cv2.NORMAL_CLONE)
+            return
+        except cv2.error:
+            blend = 'alpha'
+
+    if blend == 'alpha':
+        region = canvas[y:y + h, x:x + w].astype(np.float32)
+        alpha = feather_mask(h, w)
+        canvas[y:y + h, x:x + w] = (obj * alpha + region * (1 - alpha)).astype(np.uint8)
+    else:
+        canvas[y:y + h, x:x + w] = obj
+
+
+def read_yolo_labels(label_path):
+    """YOLO 라벨을 (N, 5) 배열로 읽음 (class, x_center, y_center, width, height)"""
+    rows = np.loadtxt(label_path, ndmin=2)
+    return rows.reshape(-1, 5)
+
+
+def _composite_files(pairs, output_image_dir, output_label_dir, composites, blend):
+    """(라벨, 이미지) 묶음에서 각 원본당 composites장의 합성 이미지를 만들고 저장 수를 반환"""
+    written = 0
+    for label_path, image_path in pairs:
         base_filename = os.path.splitext(os.path.basename(label_path))[0]
-        image_path = os.path.join(image_dir, base_filename + '.jpg')
-
-        if not os.path.exists(image_path):
-            continue
-
         randomized_image = cv2.imread(image_path)
+        if randomized_image is None:
+            continue
         rand_h, rand_w = randomized_image.shape[:2]
 
-        background_image = cv2.imread(random.choice(bg_images))
-        bg_h, bg_w = background_image.shape[:2]
-
-        final_label_content = []
-
-        with open(label_path, 'r') as f:
-            lines = f.readlines()
-
-        for line in lines:
-            class_id, x_center, y_center, width, height = map(
-                float, line.strip().split())
-
-            w_abs = int(width * rand_w)
-            h_abs = int(height * rand_h)
-            x_min_abs = max(0, int((x_center * rand_w) - w_abs / 2))
-            y_min_abs = max(0, int((y_center * rand_h) - h_abs / 2))
-
-            obj_image = randomized_image[y_min_abs:y_min_abs +
-                                         h_abs, x_min_abs:x_min_abs+w_abs]
-
-            if obj_image.size == 0:
-                continue
+        labels = read_yolo_labels(label_path)
+        if len(labels) == 0:
+            continue
 
-            max_x = bg_w - w_abs
-            max_y = bg_h - h_abs
-            if max_x <= 0 or max_y <= 0:
+        # 객체 영역을 한 번에 계산 (픽셀 좌표)
+        class_ids = labels[:, 0].astype(int)
+        w_abs = (labels[:, 3] * rand_w).astype(int)
+        h_abs = (labels[:, 4] * rand_h).astype(int)
+        x_min_abs = np.maximum(0, (labels[:, 1] * rand_w - w_abs / 2).astype(int))
+        y_min_abs = np.maximum(0, (labels[:, 2] * rand_h - h_abs / 2).astype(int))
+        objects = [
+            randomized_image[y:y + h, x:x + w]
+            for x, y, w, h in zip(x_min_abs, y_min_abs, w_abs, h_abs)
+        ]
+        obj_h = np.array([obj.shape[0] for obj in objects])
+        obj_w = np.array([obj.shape[1] for obj in objects])
+
+        for k in range(composites):
+            background_image = _backgrounds.images[_rng.integers(len(_backgrounds))].copy()
+            bg_h, bg_w = background_image.shape[:2]
+
+            max_x = bg_w - obj_w
+            max_y = bg_h - obj_h
+            valid = (obj_h > 0) & (obj_w > 0) & (max_x > 0) & (max_y > 0)
+            if not valid.any():
                 continue
 
-            paste_x = random.randint(0, max_x)
-            paste_y = random.randint(0, max_y)
-
-            background_image[paste_y:paste_y+h_abs,
-                             paste_x:paste_x+w_abs] = obj_image
-
-            new_x_center = (paste_x + w_abs / 2) / bg_w
-            new_y_center = (paste_y + h_abs / 2) / bg_h
-            new_width = w_abs / bg_w
-            new_height = h_abs / bg_h
-
-            final_label_content.append(
-                f"{int(class_id)} {new_x_center} {new_y_center} {new_width} {new_height}")
-
-        if final_label_content:
+            paste_x = (_rng.random(len(objects)) * (np.maximum(max_x, 0) + 1)).astype(int)
+            paste_y = (_rng.random(len(objects)) * (np.maximum(max_y, 0) + 1)).astype(int)
+            for i in np.flatnonzero(valid):
+                paste_object(background_image, objects[i], paste_x[i], paste_y[i], blend)
+
+            new_labels = np.column_stack([
+                (paste_x + obj_w / 2) / bg_w,
+                (paste_y + obj_h / 2) / bg_h,
+                obj_w / bg_w,
+                obj_h / bg_h,
+            ])[valid]
+            final_label_content = [
+                f"{cls} {xc} {yc} {w} {h}"
+                for cls, (xc, yc, w, h) in zip(class_ids[valid], new_labels.tolist())
+            ]
+
+            suffix = '_final' if k == 0 else f'_final{k}'
             output_img_path = os.path.join(
-                output_image_dir, base_filename + '_final.jpg')
+                output_image_dir, base_filename + suffix + '.jpg')
             output_lbl_path = os.path.join(
-                output_label_dir, base_filename + '_final.txt')
+                output_label_dir, base_filename + suffix + '.txt')
 
             cv2.imwrite(output_img_path, background_image)
             with open(output_lbl_path, 'w') as f:
                 f.write("\n".join(final_label_content))
+            written += 1
+    return written
+
+
+def apply_domain_adaptation(image_dir, label_dir, bg_dir, output_image_dir, output_label_dir,
+                            composites=1, blend='paste', workers=None, chunk_size=16):
+    """
+    Randomized된 이미지의 객체를 추출하여 새로운 배경에 합성
+
+    Args:
+        composites (int): 원본 한 장당 서로 다른 배경으로 만들 합성 이미지 수
+        blend (str): 'paste' | 'alpha' | 'poisson'
+        workers (int): 프로세스 수 (기본: CPU 코어 수)
+        chunk_size (int): 워커에 한 번에 넘기는 파일 수
+    """
+    print(f"'{image_dir}'에 대한 Domain Adaptation(배경 교체)을 시작합니다.")
+
+    os.makedirs(output_image_dir, exist_ok=True)
+    os.makedirs(output_label_dir, exist_ok=True)
 
-    print(f"'{output_image_dir}'에 최종 증강 데이터 저장을 완료했습니다.")
+    bg_images = glob.glob(os.path.join(bg_dir, '*.*'))
+    backgrounds = BackgroundPool.load(bg_images)
+    if backgrounds is None:
+        print(f"경고: '{bg_dir}'에 배경 이미지가 없습니다. 이 단계를 건너뜁니다.")
+        return
+
+    pairs = []
+    for label_path in glob.glob(os.path.join(label_dir, '*.txt')):
+        base_filename = os.path.splitext(os.path.basename(label_path))[0]
+        image_path = os.path.join(image_dir, base_filename + '.jpg')
+        if os.path.exists(image_path):
+            pairs.append((label_path, image_path))
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+    args = (output_image_dir, output_label_dir, composites, blend)
+    workers = workers or os.cpu_count() or 1
+
+    written = 0
+    try:
+        # 작업 중인 묶음을 워커 수의 2배까지만 유지 (bounded queue)
+        # pipeline은 단계를 스레드에서 돌리므로 스레드가 있는 프로세스를 fork하지 않도록 spawn 사용
+        # (배경은 spawn된 워커도 shared memory 이름으로 붙으므로 다시 읽지 않음)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker,
+                                 initargs=(backgrounds.shm.name, backgrounds.layout)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(_composite_files, chunk, *args))
+                if len(pending) >= workers * 2:
+                    written += pending.popleft().result()
+            while pending:
+                written += pending.popleft().result()
+    finally:
+        backgrounds.close()
+
+    print(f"'{output_image_dir}'에 최종 증강 데이터 {written}장 저장을 완료했습니다.")
@@ -0,0 +1,204 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import resource
+import multiprocessing as mp
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "CSV_Converter"))
+
+
+IMG_DIR = "./dataset/images/val"
+LABEL_DIR = "./dataset/labels/val"
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+# mAP는 PR 곡선 전체가 필요하므로 서빙 임계값(0.25)이 아니라 낮은 임계값으로 탐지 (ultralytics val과 같음)
+MAP_CONF = 0.001
+
+
+# --------------------------
+# 정답 라벨
+# --------------------------
+def load_ground_truth(label_dir, base_name, img_width, img_height):
+    """
+    YOLO 라벨(.txt)을 픽셀 xyxy + class로 읽음.
+    .txt가 없으면(convert.py 실행 전) 원본 COCO .json의 segmentation에서 계산
+    """
+    txt_path = os.path.join(label_dir, f"{base_name}.txt")
+    if os.path.exists(txt_path):
+        rows = np.loadtxt(txt_path, ndmin=2)
+        if rows.size == 0:
+            return np.zeros((0, 4)), np.zeros((0,))
+        cls, xywh = rows[:, 0], rows[:, 1:5] * [img_width, img_height, img_width, img_height]
+        xyxy = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1)
+        return xyxy, cls
+
+    json_path = os.path.join(label_dir, f"{base_name}.json")
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    boxes, cls = [], []
+    for ann in data["annotations"]:
+        seg = np.asarray(ann["segmentation"][0]).reshape(-1, 2)
+        boxes.append([*seg.min(axis=0), *seg.max(axis=0)])
+        cls.append(ann["category_id"] - 1)
+    return np.asarray(boxes, dtype=np.float64).reshape(-1, 4), np.asarray(cls, dtype=np.float64)
+
+
+# --------------------------
+# mAP
+# --------------------------
+def iou_matrix(a, b):
+    """a(N, 4), b(M, 4) -> (N, M) IoU"""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def match_detections(det_xyxy, det_conf, det_cls, gt_xyxy, gt_cls):
+    """
+    한 이미지의 탐지 결과를 IoU 임계값(0.5:0.95)별로 정답과 매칭
+
+    Returns:
+        tp (N, 10) bool: 각 탐지가 임계값별로 true positive인지
+    """
+    tp = np.zeros((len(det_conf), len(IOU_THRESHOLDS)), dtype=bool)
+    if len(det_conf) == 0 or len(gt_cls) == 0:
+        return tp
+    ious = iou_matrix(det_xyxy, gt_xyxy)
+    ious[det_cls[:, None] != gt_cls[None, :]] = 0
+    order = det_conf.argsort()[::-1]
+    for t, thres in enumerate(IOU_THRESHOLDS):
+        matched = np.zeros(len(gt_cls), dtype=bool)
+        for i in order:
+            candidates = np.where((ious[i] >= thres) & ~matched)[0]
+            if len(candidates):
+                j = candidates[ious[i, candidates].argmax()]
+                matched[j] = True
+                tp[i, t] = True
+    return tp
+
+
+def average_precision(recall, precision):
+    """101점 보간 AP (COCO / ultralytics 방식)"""
+    mrec = np.concatenate(([0.0], recall, [1.0]))
+    mpre = np.concatenate(([1.0], precision, [0.0]))
+    mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+    x = np.linspace(0, 1, 101)
+    trapezoid = getattr(np, "trapezoid", None) or np.trapz  # numpy 2.x에서 trapz 제거됨
+    return trapezoid(np.interp(x, mrec, mpre), x)
+
+
+def mean_average_precision(tp, conf, pred_cls, gt_cls):
+    """클래스별 AP 평균 -> (mAP50, mAP50-95)"""
+    order = conf.argsort()[::-1]
+    tp, pred_cls = tp[order], pred_cls[order]
+    ap = []
+    for c in np.unique(gt_cls):
+        is_c = pred_cls == c
+        n_gt = (gt_cls == c).sum()
+        if is_c.sum() == 0:
+            ap.append(np.zeros(len(IOU_THRESHOLDS)))
+            continue
+        tpc = tp[is_c].cumsum(axis=0)
+        fpc = (~tp[is_c]).cumsum(axis=0)
+        recall = tpc / n_gt
+        precision = tpc / (tpc + fpc)
+        ap.append([average_precision(recall[:, t], precision[:, t]) for t in range(len(IOU_THRESHOLDS))])
+    if not ap:
+        return 0.0, 0.0
+    ap = np.asarray(ap)
+    return float(ap[:, 0].mean()), float(ap.mean())
+
+
+# --------------------------
+# 벤치마크 (모델별 별도 프로세스)
+# --------------------------
+def benchmark_variant(model_path, img_dir, label_dir, warmup, num_threads, map_conf=MAP_CONF):
+    """
+    새 프로세스에서 실행되어 지연시간/처리량/최대 RSS/mAP를 측정
+    지연시간은 서빙 임계값으로, mAP는 map_conf로 따로 탐지한 결과로 계산 (같은 세션 사용)
+    """
+    from onnx_backend import OnnxDetector
+
+    detector = OnnxDetector(model_path, num_threads=num_threads)
+    img_paths = sorted(glob.glob(os.path.join(img_dir, "*.jpg")) + glob.glob(os.path.join(img_dir, "*.png")))
+
+    def read_rgb(img_path):
+        return cv2.cvtColor(cv2.imread(img_path), cv2.COLOR_BGR2RGB)
+
+    for img_path in img_paths[:warmup]:
+        detector.detect(read_rgb(img_path))
+
+    # 디코딩 시간은 제외하고 detect()만 측정, 이미지는 한 장씩만 메모리에 둠 (RSS 왜곡 방지)
+    latencies, all_tp, all_conf, all_cls, all_gt_cls = [], [], [], [], []
+    for img_path in img_paths:
+        img = read_rgb(img_path)
+        start = time.perf_counter()
+        detector.detect(img)
+        latencies.append(time.perf_counter() - start)
+        det = detector.detect(img, conf=map_conf)[0]
+
+        base_name = os.path.splitext(os.path.basename(img_path))[0]
+        gt_xyxy, gt_cls = load_ground_truth(label_dir, base_name, img.shape[1], img.shape[0])
+        all_tp.append(match_detections(det.xyxy, det.conf, det.cls, gt_xyxy, gt_cls))
+        all_conf.append(det.conf)
+        all_cls.append(det.cls)
+        all_gt_cls.append(gt_cls)
+
+    map50, map50_95 = mean_average_precision(
+        np.concatenate(all_tp), np.concatenate(all_conf),
+        np.concatenate(all_cls), np.concatenate(all_gt_cls),
+    )
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "model": os.path.basename(model_path),
+        "size_mb": os.path.getsize(model_path) / 1e6,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "img_per_s": len(latencies) / float(np.sum(latencies)),
+        # Linux에서 ru_maxrss 단위는 KB
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "map50": map50,
+        "map50_95": map50_95,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX 모델 변형(FP32/INT8) 정확도·속도 비교")
+    parser.add_argument("models", nargs="+", help="비교할 .onnx 파일들")
+    parser.add_argument("--images", default=IMG_DIR)
+    parser.add_argument("--labels", default=LABEL_DIR)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None, help="onnxruntime intra-op 스레드 수")
+    parser.add_argument("--conf", type=float, default=MAP_CONF, help="mAP 계산용 신뢰도 임계값 (지연시간은 서빙 임계값으로 측정)")
+    parser.add_argument("--json", help="결과를 저장할 JSON 경로")
+    args = parser.parse_args()
+
+    # 최대 RSS를 모델별로 분리하기 위해 각 변형을 새 프로세스에서 측정
+    ctx = mp.get_context("spawn")
+    rows = []
+    for model_path in args.models:
+        with ctx.Pool(1) as pool:
+            rows.append(pool.apply(benchmark_variant,
+                                   (model_path, args.images, args.labels, args.warmup, args.threads, args.conf)))
+
+    header = f"{'model':<40}{'MB':>8}{'p50 ms':>10}{'p95 ms':>10}{'img/s':>9}{'RSS MB':>9}{'mAP50':>8}{'mAP50-95':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['model']:<40}{r['size_mb']:>8.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['img_per_s']:>9.1f}{r['peak_rss_mb']:>9.0f}{r['map50']:>8.3f}{r['map50_95']:>10.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,149 @@
 import json
 import os
+import multiprocessing
 from glob import glob
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
+try:
+    import orjson
 
-def convert_coco_to_yolo(coco_json_path, save_dir):
+    def load_json(path):
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+except ImportError:
+    def load_json(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+LABEL_INDEX_NAME = 'labels_index'
+
+
+def coco_to_yolo_rows(data):
+    """
+    COCO 데이터 한 장 분량을 YOLO 라벨 배열로 변환
+
+    Returns:
+        np.ndarray (N, 5): class_id, x_center, y_center, width, height (정규화 좌표)
+    """
+    image_info = data['images'][0]
+    img_width = image_info['width']
+    img_height = image_info['height']
+
+    # 세그멘테이션이 비어 있는 객체는 bbox([x, y, w, h])로 대신하고, 둘 다 없으면 건너뜀
+    segs, kept = [], []
+    for ann in data['annotations']:
+        seg = ann.get('segmentation') or [[]]
+        points = np.asarray(seg[0], dtype=np.float64).reshape(-1, 2)
+        if len(points) == 0 and ann.get('bbox'):
+            x, y, w, h = ann['bbox']
+            points = np.array([[x, y], [x + w, y + h]], dtype=np.float64)
+        if len(points):
+            segs.append(points)
+            kept.append(ann)
+    annotations = kept
+    if not annotations:
+        return np.zeros((0, 5))
+
+    # 모든 세그멘테이션 좌표를 한 배열로 이어 붙이고 객체별 min/max를 한 번에 계산
+    offsets = np.cumsum([0] + [len(seg) for seg in segs[:-1]])
+    points = np.concatenate(segs)
+    mins = np.minimum.reduceat(points, offsets, axis=0)
+    maxs = np.maximum.reduceat(points, offsets, axis=0)
+
+    # YOLO 클래스 ID는 0부터 시작하므로 1을 빼줍니다.
+    category_ids = np.array([ann['category_id'] - 1 for ann in annotations], dtype=np.float64)
+
+    # YOLO 형식으로 정규화 (x_center, y_center, width, height)
+    size = np.array([img_width, img_height], dtype=np.float64)
+    centers = ((mins + maxs) / 2) / size
+    wh = (maxs - mins) / size
+    return np.column_stack([category_ids, centers, wh])
+
+
+def _convert_file(json_file, save_dir, write_txt):
+    data = load_json(json_file)
+    rows = coco_to_yolo_rows(data)
+    stem = os.path.splitext(os.path.basename(json_file))[0]
+
+    if write_txt:
+        txt_file_path = os.path.join(save_dir, stem + '.txt')
+        with open(txt_file_path, 'w', encoding='utf-8') as f:
+            for category_id, x_center, y_center, width, height in rows.tolist():
+                f.write(
+                    f"{int(category_id)} {x_center} {y_center} {width} {height}\n")
+    return stem, rows
+
+
+def label_index_paths(label_dir):
+    """(라벨 배열 .npy, 파일명/시작/개수 .npy) 경로. COCO *.json 입력과 섞이지 않게 둘 다 .npy"""
+    base = os.path.join(label_dir, LABEL_INDEX_NAME)
+    return base + '.npy', base + '_stems.npy'
+
+
+def has_label_index(label_dir):
+    return all(os.path.exists(p) for p in label_index_paths(label_dir))
+
+
+def write_label_index(save_dir, items):
+    """
+    모든 라벨을 하나의 (N, 5) float32 배열과 파일명별 (시작, 개수) 구조체 배열로 저장 (둘 다 .npy)
+    """
+    items = sorted(items)
+    arrays = [rows.astype(np.float32) for _, rows in items]
+    counts = np.array([len(rows) for rows in arrays], dtype=np.int64)
+    labels = np.concatenate(arrays) if arrays else np.zeros((0, 5), dtype=np.float32)
+
+    width = max([len(stem) for stem, _ in items] + [1])
+    stems = np.zeros(len(items), dtype=[('stem', f'U{width}'), ('start', 'i8'), ('count', 'i8')])
+    stems['stem'] = [stem for stem, _ in items]
+    stems['start'] = np.cumsum(counts) - counts
+    stems['count'] = counts
+
+    labels_path, stems_path = label_index_paths(save_dir)
+    np.save(labels_path, labels)
+    np.save(stems_path, stems)
+
+
+class LabelIndex:
+    """
+    write_label_index로 만든 라벨 파일을 메모리 맵으로 읽는 리더.
+    작은 .txt 파일 수만 개를 여는 대신 배열 하나에서 잘라서 반환한다.
+    """
+
+    def __init__(self, label_dir):
+        labels_path, stems_path = label_index_paths(label_dir)
+        self.labels = np.load(labels_path, mmap_mode='r')
+        stems = np.load(stems_path)
+        self.index = dict(zip(stems['stem'].tolist(), zip(stems['start'].tolist(), stems['count'].tolist())))
+
+    def __contains__(self, stem):
+        return stem in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def get(self, stem):
+        """파일명(확장자 제외)에 해당하는 (N, 5) 라벨 배열"""
+        start, count = self.index[stem]
+        return self.labels[start:start + count]
+
+
+def convert_coco_to_yolo(coco_json_path, save_dir, workers=None, write_txt=True, write_index=False):
     """
     COCO 형식의 JSON 파일을 YOLO 형식의 TXT 파일로 변환합니다.
 
     Args:
         coco_json_path (str): COCO JSON 파일들이 있는 디렉토리 경로
         save_dir (str): 변환된 TXT 파일을 저장할 디렉토리 경로
+        workers (int): 프로세스 수 (기본: CPU 코어 수)
+        write_txt (bool): 이미지별 .txt 파일 저장 여부
+        write_index (bool): 전체 라벨을 labels_index.npy / labels_index_stems.npy 한 쌍으로도 저장
+            (domain_randomization이 있으면 .txt 대신 읽음)
     """
     json_files = glob(os.path.join(coco_json_path, '*.json'))
 
@@ -17,42 +151,21 @@ def convert_coco_to_yolo(coco_json_path, save_dir):
         os.makedirs(save_dir)
         print(f"'{save_dir}' 디렉토리를 생성했습니다.")
 
-    for json_file in json_files:
-        with open(json_file, 'r', encoding='utf-8') as f:
-            # 수정된 부분: json.load() 함수에 파일 객체 'f'를 전달합니다.
-            data = json.load(f)
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(json_files) // (workers * 8))
+    # pipeline은 단계를 스레드에서 돌리므로 스레드가 있는 프로세스를 fork하지 않도록 spawn 사용
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        items = list(pool.map(_convert_file, json_files,
+                              [save_dir] * len(json_files), [write_txt] * len(json_files),
+                              chunksize=chunksize))
 
-        image_info = data['images'][0]
-        img_width = image_info['width']
-        img_height = image_info['height']
-
-        txt_file_name = os.path.splitext(
-            os.path.basename(json_file))[0] + '.txt'
-        txt_file_path = os.path.join(save_dir, txt_file_name)
-
-        with open(txt_file_path, 'w', encoding='utf-8') as f:
-            for ann in data['annotations']:
-                # YOLO 클래스 ID는 0부터 시작하므로 1을 빼줍니다.
-                category_id = ann['category_id'] - 1
-
-                # 세그멘테이션 좌표에서 바운딩 박스 계산
-                seg = ann['segmentation'][0]
-                x_coords = [seg[i] for i in range(0, len(seg), 2)]
-                y_coords = [seg[i] for i in range(1, len(seg), 2)]
-
-                x_min = min(x_coords)
-                y_min = min(y_coords)
-                x_max = max(x_coords)
-                y_max = max(y_coords)
-
-                # YOLO 형식으로 정규화 (x_center, y_center, width, height)
-                x_center = ((x_min + x_max) / 2) / img_width
-                y_center = ((y_min + y_max) / 2) / img_height
-                width = (x_max - x_min) / img_width
-                height = (y_max - y_min) / img_height
-
-                f.write(
-                    f"{category_id} {x_center} {y_center} {width} {height}\n")
+    if write_index:
+        write_label_index(save_dir, items)
+    else:
+        # 예전 인덱스가 남아 있으면 다음 단계가 바뀐 .txt 대신 읽으므로 지움
+        for path in label_index_paths(save_dir):
+            if os.path.exists(path):
+                os.remove(path)
 
     print(f"'{coco_json_path}'의 모든 JSON 파일 변환 완료!")
 
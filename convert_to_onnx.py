@@ -1,4 +1,126 @@
+import os
+import re
+import sys
+import glob
+import argparse
+import cv2
+import numpy as np
 from ultralytics import YOLO
 
-model = YOLO("./runs/detect/yolov8n_full_augmentation5/weights/best.pt")
-model.export(format="onnx")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "CSV_Converter"))
+from onnx_backend import letterbox
+
+
+MODEL_PATH = "./runs/detect/yolov8n_full_augmentation5/weights/best.pt"
+CALIB_DIR = "./dataset/images/val"
+
+
+def export_fp32(model_path, imgsz=640, dynamic=False):
+    """FP32 ONNX로 내보내고 .onnx 경로를 반환"""
+    model = YOLO(model_path)
+    return model.export(format="onnx", imgsz=imgsz, dynamic=dynamic)
+
+
+def quantize_dynamic_int8(fp32_path):
+    """가중치만 INT8로 양자화 (캘리브레이션 불필요)"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    out_path = fp32_path.replace(".onnx", "_int8_dynamic.onnx")
+    quantize_dynamic(fp32_path, out_path, weight_type=QuantType.QUInt8)
+    print(f"[INFO] dynamic INT8 저장: {out_path}")
+    return out_path
+
+
+class ValCalibrationReader:
+    """
+    검증 이미지로 static 양자화의 activation 범위를 측정하기 위한 데이터 리더
+    (onnxruntime.quantization.CalibrationDataReader 인터페이스)
+    """
+
+    def __init__(self, calib_dir, input_name, imgsz=640, num_images=200):
+        img_paths = sorted(glob.glob(os.path.join(calib_dir, "*.jpg")))
+        img_paths += sorted(glob.glob(os.path.join(calib_dir, "*.png")))
+        if not img_paths:
+            raise FileNotFoundError(f"캘리브레이션 이미지가 없습니다: {calib_dir}")
+        self.img_paths = iter(img_paths[:num_images])
+        self.input_name = input_name
+        self.imgsz = imgsz
+
+    def get_next(self):
+        img_path = next(self.img_paths, None)
+        if img_path is None:
+            return None
+        img = cv2.cvtColor(cv2.imread(img_path), cv2.COLOR_BGR2RGB)
+        padded, _, _ = letterbox(img, self.imgsz)
+        tensor = padded.transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+        return {self.input_name: tensor}
+
+
+def detect_head_nodes(onnx_model):
+    """
+    YOLOv8 마지막 모듈(Detect head) 노드 이름 목록.
+    박스 좌표/점수가 섞인 출력부는 INT8로 바꾸면 정확도 손실이 커서 FP32로 둔다.
+    """
+    indices = {}
+    for node in onnx_model.graph.node:
+        match = re.match(r"/model\.(\d+)/", node.name)
+        if match:
+            indices.setdefault(int(match.group(1)), []).append(node.name)
+    return indices[max(indices)] if indices else []
+
+
+def quantize_static_int8(fp32_path, calib_dir=CALIB_DIR, imgsz=640, num_images=200, exclude_head=True):
+    """가중치 + activation을 INT8(QDQ)로 양자화, 캘리브레이션은 dataset/images/val 사용"""
+    import onnx
+    import onnxruntime as ort
+    from onnxruntime.quantization import quantize_static, QuantFormat, QuantType
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    prep_path = fp32_path.replace(".onnx", "_prep.onnx")
+    out_path = fp32_path.replace(".onnx", "_int8_static.onnx")
+    quant_pre_process(fp32_path, prep_path)
+
+    input_name = ort.InferenceSession(prep_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    reader = ValCalibrationReader(calib_dir, input_name, imgsz, num_images)
+    nodes_to_exclude = detect_head_nodes(onnx.load(prep_path)) if exclude_head else []
+
+    quantize_static(
+        prep_path,
+        out_path,
+        reader,
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        nodes_to_exclude=nodes_to_exclude,
+    )
+    os.remove(prep_path)
+    print(f"[INFO] static INT8 저장: {out_path} (FP32 유지 노드 {len(nodes_to_exclude)}개)")
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YOLO 모델을 ONNX(FP32/INT8)로 내보내기")
+    parser.add_argument("--weights", default=MODEL_PATH)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--dynamic", action="store_true", help="가변 batch 크기로 내보내기")
+    parser.add_argument("--int8", nargs="*", choices=["dynamic", "static"], default=[],
+                        help="추가로 만들 INT8 변형")
+    parser.add_argument("--calib-dir", default=CALIB_DIR)
+    parser.add_argument("--calib-images", type=int, default=200)
+    args = parser.parse_args()
+
+    variants = [export_fp32(args.weights, args.imgsz, args.dynamic)]
+    if "dynamic" in args.int8:
+        variants.append(quantize_dynamic_int8(variants[0]))
+    if "static" in args.int8:
+        variants.append(quantize_static_int8(variants[0], args.calib_dir, args.imgsz, args.calib_images))
+
+    print("[INFO] 생성된 모델:")
+    for path in variants:
+        print(f"  {path}")
+    print("성능 비교: python benchmark_onnx.py " + " ".join(variants))
+
+
+if __name__ == "__main__":
+    main()
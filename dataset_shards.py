@@ -0,0 +1,214 @@
+import os
+import io
+import glob
+import json
+import math
+import mmap
+import cv2
+import numpy as np
+
+
+INDEX_NAME = 'index.json'
+LABELS_NAME = 'labels.npy'
+SHARD_BYTES = 1 << 30  # 샤드 파일 하나의 최대 크기 (1GB)
+
+
+def image_size(data):
+    """인코딩된 이미지의 (width, height) (헤더만 읽음)"""
+    try:
+        from PIL import Image
+
+        return Image.open(io.BytesIO(data)).size
+    except ImportError:
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        return img.shape[1], img.shape[0]
+
+
+def write_shards(image_dir, label_dir, out_dir, shard_bytes=SHARD_BYTES):
+    """
+    이미지(JPG 원본 바이트 그대로)와 YOLO 라벨을 큰 샤드 파일 몇 개로 묶음
+
+    출력:
+        shard-00000.bin ... : 이미지 바이트를 순서대로 이어 붙인 파일
+        labels.npy          : 전체 라벨 (N, 5) float32
+        index.json          : 이미지별 [이름, 샤드 번호, offset, 크기, 너비, 높이, 라벨 시작, 라벨 개수]
+    """
+    print(f"'{image_dir}' -> '{out_dir}' 샤드 생성을 시작합니다.")
+    os.makedirs(out_dir, exist_ok=True)
+    for old in glob.glob(os.path.join(out_dir, 'shard-*.bin')):
+        os.remove(old)
+
+    records, label_arrays, label_start = [], [], 0
+    shard_id, shard_file, offset = -1, None, shard_bytes
+    for image_path in sorted(glob.glob(os.path.join(image_dir, '*.jpg'))):
+        stem = os.path.splitext(os.path.basename(image_path))[0]
+        label_path = os.path.join(label_dir, stem + '.txt')
+        if not os.path.exists(label_path):
+            continue
+        labels = np.loadtxt(label_path, ndmin=2, dtype=np.float32).reshape(-1, 5)
+
+        with open(image_path, 'rb') as f:
+            data = f.read()
+        if offset + len(data) > shard_bytes:
+            if shard_file is not None:
+                shard_file.close()
+            shard_id += 1
+            shard_file = open(os.path.join(out_dir, f'shard-{shard_id:05d}.bin'), 'wb')
+            offset = 0
+
+        shard_file.write(data)
+        width, height = image_size(data)
+        records.append([stem, shard_id, offset, len(data), width, height, label_start, len(labels)])
+        label_arrays.append(labels)
+        offset += len(data)
+        label_start += len(labels)
+
+    if shard_file is not None:
+        shard_file.close()
+
+    labels = np.concatenate(label_arrays) if label_arrays else np.zeros((0, 5), dtype=np.float32)
+    np.save(os.path.join(out_dir, LABELS_NAME), labels)
+    with open(os.path.join(out_dir, INDEX_NAME), 'w', encoding='utf-8') as f:
+        json.dump({"num_shards": shard_id + 1, "records": records}, f, ensure_ascii=False)
+    print(f"'{out_dir}'에 이미지 {len(records)}장, 샤드 {shard_id + 1}개 저장을 완료했습니다.")
+
+
+def is_shard_dir(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, INDEX_NAME))
+
+
+class ShardReader:
+    """샤드를 메모리 맵으로 열어 이미지/라벨을 복사 없이 읽는 리더"""
+
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        with open(os.path.join(shard_dir, INDEX_NAME), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.records = index["records"]
+        self.num_shards = index["num_shards"]
+        self.labels = np.load(os.path.join(shard_dir, LABELS_NAME), mmap_mode='r')
+        self._maps = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getstate__(self):
+        # mmap은 pickle할 수 없으므로 넘겨받은 프로세스에서 다시 연다
+        state = self.__dict__.copy()
+        state["_maps"] = {}
+        return state
+
+    def _shard(self, shard_id):
+        # DataLoader 워커가 fork된 뒤에 처음 접근할 때 각자 연다
+        key = (os.getpid(), shard_id)
+        if key not in self._maps:
+            with open(os.path.join(self.shard_dir, f'shard-{shard_id:05d}.bin'), 'rb') as f:
+                self._maps[key] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[key]
+
+    def name(self, i):
+        return self.records[i][0]
+
+    def shape(self, i):
+        """(height, width)"""
+        return self.records[i][5], self.records[i][4]
+
+    def image_bytes(self, i):
+        _, shard_id, offset, size = self.records[i][:4]
+        return np.frombuffer(self._shard(shard_id), dtype=np.uint8, count=size, offset=offset)
+
+    def load_image(self, i, flags=cv2.IMREAD_COLOR):
+        """BGR 이미지 디코딩"""
+        return cv2.imdecode(self.image_bytes(i), flags)
+
+    def get_labels(self, i):
+        """(N, 5) YOLO 라벨"""
+        start, count = self.records[i][6:8]
+        return self.labels[start:start + count]
+
+
+def shard_trainer():
+    """
+    샤드 디렉토리를 학습 데이터로 쓸 수 있는 ultralytics DetectionTrainer를 반환.
+    data yaml의 train/val 경로가 샤드 디렉토리면 샤드에서, 아니면 기존 방식대로 읽는다.
+
+    사용 예: YOLO('yolov8n.pt').train(trainer=shard_trainer(), data=...)
+    """
+    from ultralytics.data.dataset import YOLODataset
+    from ultralytics.models.yolo.detect import DetectionTrainer
+    from ultralytics.utils import colorstr
+    from ultralytics.utils.torch_utils import de_parallel
+
+    class ShardYOLODataset(YOLODataset):
+        def get_img_files(self, img_path):
+            self.reader = ShardReader(img_path)
+            # 파일은 없지만 플롯/로그에서 쓰이는 이름
+            return [os.path.join(img_path, self.reader.name(i) + '.jpg') for i in range(len(self.reader))]
+
+        def get_labels(self):
+            labels = []
+            for i, im_file in enumerate(self.im_files):
+                rows = np.asarray(self.reader.get_labels(i), dtype=np.float32)
+                labels.append({
+                    "im_file": im_file,
+                    "shape": self.reader.shape(i),
+                    "cls": rows[:, 0:1],
+                    "bboxes": rows[:, 1:5],
+                    "segments": [],
+                    "keypoints": None,
+                    "normalized": True,
+                    "bbox_format": "xywh",
+                })
+            return labels
+
+        def load_image(self, i, rect_mode=True):
+            """BaseDataset.load_image와 같지만 파일 대신 샤드에서 디코딩"""
+            if self.ims[i] is not None:
+                return self.ims[i], self.im_hw0[i], self.im_hw[i]
+
+            im = self.reader.load_image(i)
+            if im is None:
+                raise FileNotFoundError(f"샤드 이미지 디코딩 실패: {self.im_files[i]}")
+            h0, w0 = im.shape[:2]
+            if rect_mode:
+                r = self.imgsz / max(h0, w0)
+                if r != 1:
+                    w, h = (min(math.ceil(w0 * r), self.imgsz), min(math.ceil(h0 * r), self.imgsz))
+                    im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+            elif not (h0 == w0 == self.imgsz):
+                im = cv2.resize(im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+
+            if self.augment:
+                self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]
+                self.buffer.append(i)
+                if 1 < len(self.buffer) >= self.max_buffer_length:
+                    j = self.buffer.pop(0)
+                    if self.cache != "ram":
+                        self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+            return im, (h0, w0), im.shape[:2]
+
+    class ShardDetectionTrainer(DetectionTrainer):
+        def build_dataset(self, img_path, mode="train", batch=None):
+            if not is_shard_dir(img_path):
+                return super().build_dataset(img_path, mode, batch)
+            gs = max(int(de_parallel(self.model).stride.max() if self.model else 0), 32)
+            cfg = self.args
+            return ShardYOLODataset(
+                img_path=img_path,
+                imgsz=cfg.imgsz,
+                batch_size=batch,
+                augment=mode == "train",
+                hyp=cfg,
+                rect=cfg.rect or mode == "val",
+                cache=cfg.cache or None,
+                single_cls=cfg.single_cls or False,
+                stride=gs,
+                pad=0.0 if mode == "train" else 0.5,
+                prefix=colorstr(f"{mode}: "),
+                task=cfg.task,
+                classes=cfg.classes,
+                data=self.data,
+                fraction=cfg.fraction if mode == "train" else 1.0,
+            )
+
+    return ShardDetectionTrainer
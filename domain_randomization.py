@@ -1,14 +1,23 @@
 import cv2
 import os
 import glob
+import random
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import albumentations as A
 
+from convert import LabelIndex, has_label_index
 
-def apply_domain_randomization(image, bboxes, class_labels):
-    """
-    Albumentations를 사용하여 이미지와 Bbox에 Domain Randomization을 적용합니다.
-    """
-    transform = A.Compose([
+
+# 워커 프로세스마다 이미지 크기별로 한 번만 만든 변환 파이프라인
+_transforms = {}
+
+
+def build_transform(width, height):
+    """Domain Randomization 변환 파이프라인 (이미지 크기별로 한 번만 생성)"""
+    return A.Compose([
         A.ShiftScaleRotate(shift_limit=0.1, scale_limit=0.2, rotate_limit=30, p=0.8,
                            border_mode=cv2.BORDER_CONSTANT, value=0),
         A.RandomBrightnessContrast(
@@ -17,54 +26,115 @@ def apply_domain_randomization(image, bboxes, class_labels):
                       saturation=0.2, hue=0.1, p=0.7),
         A.GaussNoise(var_limit=(10.0, 50.0), p=0.5),
         A.RandomSizedBBoxSafeCrop(
-            width=image.shape[1], height=image.shape[0], erosion_rate=0.2, p=0.3)
+            width=width, height=height, erosion_rate=0.2, p=0.3)
     ], bbox_params=A.BboxParams(format='yolo', label_fields=['class_labels'], min_visibility=0.1))
 
-    randomized = transform(image=image, bboxes=bboxes,
-                           class_labels=class_labels)
+
+def apply_domain_randomization(image, bboxes, class_labels):
+    """
+    Albumentations를 사용하여 이미지와 Bbox에 Domain Randomization을 적용합니다.
+    """
+    size = (image.shape[1], image.shape[0])
+    if size not in _transforms:
+        _transforms[size] = build_transform(*size)
+
+    randomized = _transforms[size](image=image, bboxes=bboxes,
+                                   class_labels=class_labels)
     return randomized['image'], randomized['bboxes'], randomized['class_labels']
 
 
-def process_directory(image_dir, label_dir, output_image_dir, output_label_dir):
-    """지정된 디렉토리의 모든 이미지에 Domain Randomization을 적용합니다."""
-    print(f"'{image_dir}'에 대한 Domain Randomization을 시작합니다.")
+def _init_worker():
+    """워커 초기화: 워커마다 다른 난수 시드를 쓰고 OpenCV 내부 스레드는 끔 (프로세스 수만큼 이미 병렬)"""
+    seed = (os.getpid() * 1000003 + int.from_bytes(os.urandom(4), "little")) % (2 ** 32)
+    random.seed(seed)
+    np.random.seed(seed)
+    cv2.setNumThreads(0)
 
-    os.makedirs(output_image_dir, exist_ok=True)
-    os.makedirs(output_label_dir, exist_ok=True)
 
-    label_files = glob.glob(os.path.join(label_dir, '*.txt'))
+def _read_labels(label):
+    """라벨 .txt 경로 또는 (N, 5) 배열 → (bbox 목록, 클래스 목록)"""
+    if isinstance(label, str):
+        with open(label, 'r') as f:
+            label = [list(map(float, line.split())) for line in f if line.strip()]
+    rows = np.asarray(label, dtype=np.float64).reshape(-1, 5)
+    return rows[:, 1:].tolist(), rows[:, 0].astype(int).tolist()
+
 
-    for label_path in label_files:
-        base_filename = os.path.splitext(os.path.basename(label_path))[0]
+def _randomize_files(items, image_dir, output_image_dir, output_label_dir, variants):
+    """
+    (파일명, 라벨 .txt 경로 또는 라벨 배열) 묶음을 처리하고 저장한 이미지 수를 반환 (워커 프로세스에서 실행)
+    """
+    written = 0
+    for base_filename, label in items:
         image_path = os.path.join(image_dir, base_filename + '.jpg')
 
         if not os.path.exists(image_path):
             continue
 
         image = cv2.imread(image_path)
+        bboxes, class_labels = _read_labels(label)
+
+        # 원본 한 장을 읽어서 variants개의 Randomized 이미지를 생성
+        for v in range(variants):
+            randomized_image, randomized_bboxes, randomized_labels = apply_domain_randomization(
+                image, bboxes, class_labels)
+
+            suffix = '_rand' if v == 0 else f'_rand{v}'
+            output_img_path = os.path.join(
+                output_image_dir, base_filename + suffix + '.jpg')
+            output_lbl_path = os.path.join(
+                output_label_dir, base_filename + suffix + '.txt')
+
+            cv2.imwrite(output_img_path, randomized_image)
+            with open(output_lbl_path, 'w') as f:
+                for i, bbox in enumerate(randomized_bboxes):
+                    class_id = randomized_labels[i]
+                    f.write(f"{class_id} {' '.join(map(str, bbox))}\n")
+            written += 1
+    return written
+
+
+def process_directory(image_dir, label_dir, output_image_dir, output_label_dir,
+                      variants=1, workers=None, chunk_size=16):
+    """
+    지정된 디렉토리의 모든 이미지에 Domain Randomization을 적용합니다.
+
+    Args:
+        variants (int): 원본 한 장당 만들 Randomized 이미지 수
+        workers (int): 프로세스 수 (기본: CPU 코어 수, 1이면 현재 프로세스에서 실행)
+        chunk_size (int): 워커에 한 번에 넘기는 파일 수
+    """
+    print(f"'{image_dir}'에 대한 Domain Randomization을 시작합니다.")
+
+    os.makedirs(output_image_dir, exist_ok=True)
+    os.makedirs(output_label_dir, exist_ok=True)
+
+    if has_label_index(label_dir):
+        # convert.py가 만든 라벨 인덱스가 있으면 작은 .txt 파일 수만 개 대신 배열 하나에서 잘라 씀
+        label_index = LabelIndex(label_dir)
+        items = [(stem, np.array(label_index.get(stem))) for stem in label_index]
+    else:
+        items = [(os.path.splitext(os.path.basename(path))[0], path)
+                 for path in glob.glob(os.path.join(label_dir, '*.txt'))]
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    args = (image_dir, output_image_dir, output_label_dir, variants)
+    workers = workers or os.cpu_count() or 1
+
+    written = 0
+    if workers == 1:
+        for chunk in chunks:
+            written += _randomize_files(chunk, *args)
+    else:
+        # 작업 중인 묶음을 워커 수의 2배까지만 유지 (bounded queue)
+        # pipeline은 단계를 스레드에서 돌리므로 스레드가 있는 프로세스를 fork하지 않도록 spawn 사용
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(_randomize_files, chunk, *args))
+                if len(pending) >= workers * 2:
+                    written += pending.popleft().result()
+            while pending:
+                written += pending.popleft().result()
 
-        bboxes = []
-        class_labels = []
-        with open(label_path, 'r') as f:
-            for line in f:
-                parts = list(map(float, line.strip().split()))
-                class_labels.append(int(parts[0]))
-                bboxes.append(parts[1:])
-
-        # Domain Randomization 적용
-        randomized_image, randomized_bboxes, randomized_labels = apply_domain_randomization(
-            image, bboxes, class_labels)
-
-        # 결과 저장
-        output_img_path = os.path.join(
-            output_image_dir, base_filename + '_rand.jpg')
-        output_lbl_path = os.path.join(
-            output_label_dir, base_filename + '_rand.txt')
-
-        cv2.imwrite(output_img_path, randomized_image)
-        with open(output_lbl_path, 'w') as f:
-            for i, bbox in enumerate(randomized_bboxes):
-                class_id = randomized_labels[i]
-                f.write(f"{class_id} {' '.join(map(str, bbox))}\n")
-
-    print(f"'{output_image_dir}'에 Randomized 데이터 저장을 완료했습니다.")
+    print(f"'{output_image_dir}'에 Randomized 데이터 {written}장 저장을 완료했습니다.")
@@ -1,38 +1,39 @@
-import subprocess
-import sys
 import os
-import shutil
-from ultralytics import YOLO
+import sys
+import argparse
+import yaml
 
+from convert import convert_coco_to_yolo
 from domain_randomization import process_directory as randomize_data
 from augment_data import apply_domain_adaptation as adapt_data
+from pipeline import Pipeline, Stage
+from dataset_shards import write_shards, shard_trainer
 
 
-def run_script(script_name):
-    """단순 실행 스크립트를 위한 헬퍼 함수"""
-    try:
-        print(f"--- {script_name} 실행 시작 ---")
-        subprocess.run([sys.executable, script_name], check=True)
-        print(f"--- {script_name} 실행 완료 ---\n")
-    except (FileNotFoundError, subprocess.CalledProcessError) as e:
-        print(f"오류: '{script_name}' 실행 중 문제가 발생했습니다. ({e})")
-        sys.exit(1)
+def write_data_yaml(base_yaml, out_yaml, train_path, val_path):
+    """
+    학습용 data yaml 생성. 검증 데이터는 복사하지 않고 원본 경로를 그대로 참조한다.
+    (클래스 정보는 base_yaml에서 가져옴)
+    """
+    with open(base_yaml, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f)
+    data['train'] = os.path.abspath(train_path)
+    data['val'] = os.path.abspath(val_path)
+    with open(out_yaml, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(data, f, allow_unicode=True)
 
 
-def copy_validation_files(img_src, lbl_src, img_dest, lbl_dest):
-    """원본 검증 파일들을 최종 학습 폴더로 복사"""
-    print("--- 원본 검증 파일 복사 시작 ---")
-    os.makedirs(img_dest, exist_ok=True)
-    os.makedirs(lbl_dest, exist_ok=True)
+def train_model(weights, **train_args):
+    """YOLOv8 모델 로드 및 학습 (학습 데이터는 샤드에서 읽음)"""
+    from ultralytics import YOLO
 
-    for item in os.listdir(img_src):
-        shutil.copy(os.path.join(img_src, item), img_dest)
-    for item in os.listdir(lbl_src):
-        if item.endswith('.txt'):
-            shutil.copy(os.path.join(lbl_src, item), lbl_dest)
-    print("--- 원본 검증 파일 복사 완료 ---\n")
+    model = YOLO(weights)
 
-# --- 파이프라인 시작 ---
+    print("--- 모델 학습 시작 ---")
+    results = model.train(trainer=shard_trainer(), **train_args)
+    print("--- 모델 학습 완료 ---\n")
+    print(f"학습 결과는 '{results.save_dir}'에 저장되었습니다.")
+    return results
 
 
 # 0단계: 경로 설정
@@ -41,44 +42,101 @@ ORIG_IMG_TRAIN = './dataset/images/train'
 ORIG_LBL_TRAIN = './dataset/labels/train'
 ORIG_IMG_VAL = './dataset/images/val'
 ORIG_LBL_VAL = './dataset/labels/val'
+# convert 단계가 쓰는 단일 파일 라벨 인덱스 (randomize 단계가 .txt 대신 읽음)
+ORIG_LBL_INDEX = ORIG_LBL_TRAIN + '/labels_index*.npy'
 # 중간 단계 (Randomization) 데이터 경로
 RAND_IMG_TRAIN = './dataset_randomized/images/train'
 RAND_LBL_TRAIN = './dataset_randomized/labels/train'
 # 최종 (Adaptation) 데이터 경로
 AUG_IMG_TRAIN = './dataset_augmented/images/train'
 AUG_LBL_TRAIN = './dataset_augmented/labels/train'
-AUG_IMG_VAL = './dataset_augmented/images/val'
-AUG_LBL_VAL = './dataset_augmented/labels/val'
+# 학습용 샤드 경로 (작은 파일 수만 개 대신 큰 파일 몇 개)
+AUG_SHARD_TRAIN = './dataset_augmented/shards/train'
 # 배경 이미지 경로
 BG_IMG_DIR = './background_images'
+BASE_DATA_YAML = './data.yaml'
+DATA_YAML = './data_augmented.yaml'
+
+# 학습 하이퍼파라미터 (바뀌면 학습 단계만 다시 실행됨)
+TRAIN_ARGS = {
+    'data': DATA_YAML,
+    'epochs': 5,
+    'imgsz': 640,
+    'batch': 16,
+    'name': 'yolov8n_full_augmentation',
+}
+
+
+def build_pipeline(train_args=TRAIN_ARGS, state_path='.pipeline_state.json'):
+    """
+    convert → randomize → adapt → shard → train 파이프라인 구성.
+    각 단계는 입력/출력/설정이 바뀌었을 때만 다시 실행된다.
+    """
+    pipeline = Pipeline(state_path)
+
+    # 1단계: COCO(.json) -> YOLO(.txt) 라벨 변환
+    pipeline.add(Stage(
+        'convert', convert_coco_to_yolo,
+        args=(ORIG_LBL_TRAIN, ORIG_LBL_TRAIN),
+        kwargs={'write_index': True},
+        inputs=[ORIG_LBL_TRAIN + '/*.json'],
+        outputs=[ORIG_LBL_TRAIN + '/*.txt', ORIG_LBL_INDEX],
+    ))
+
+    # 2단계: Domain Randomization (학습 데이터만)
+    pipeline.add(Stage(
+        'randomize', randomize_data,
+        args=(ORIG_IMG_TRAIN, ORIG_LBL_TRAIN, RAND_IMG_TRAIN, RAND_LBL_TRAIN),
+        inputs=[ORIG_IMG_TRAIN, ORIG_LBL_TRAIN + '/*.txt', ORIG_LBL_INDEX],
+        outputs=[RAND_IMG_TRAIN, RAND_LBL_TRAIN],
+    ))
+
+    # 3단계: Domain Adaptation (배경 교체, 학습 데이터만)
+    pipeline.add(Stage(
+        'adapt', adapt_data,
+        args=(RAND_IMG_TRAIN, RAND_LBL_TRAIN, BG_IMG_DIR, AUG_IMG_TRAIN, AUG_LBL_TRAIN),
+        inputs=[RAND_IMG_TRAIN, RAND_LBL_TRAIN, BG_IMG_DIR],
+        outputs=[AUG_IMG_TRAIN, AUG_LBL_TRAIN],
+    ))
+
+    # 4단계: 학습 데이터를 샤드로 묶음
+    pipeline.add(Stage(
+        'shard', write_shards,
+        args=(AUG_IMG_TRAIN, AUG_LBL_TRAIN, AUG_SHARD_TRAIN),
+        inputs=[AUG_IMG_TRAIN, AUG_LBL_TRAIN],
+        outputs=[AUG_SHARD_TRAIN],
+    ))
+
+    # 5단계: data yaml 생성 (검증 데이터는 원본 경로 참조, 1~4단계와 독립이라 동시에 실행됨)
+    pipeline.add(Stage(
+        'data_yaml', write_data_yaml,
+        args=(BASE_DATA_YAML, DATA_YAML, AUG_SHARD_TRAIN, ORIG_IMG_VAL),
+        inputs=[BASE_DATA_YAML],
+        outputs=[DATA_YAML],
+    ))
+
+    # 6단계: YOLOv8 모델 로드 및 학습
+    pipeline.add(Stage(
+        'train', train_model,
+        args=('yolov8n.pt',),
+        kwargs=train_args,
+        inputs=[AUG_SHARD_TRAIN, ORIG_IMG_VAL, ORIG_LBL_VAL, DATA_YAML],
+        params=train_args,
+    ))
+    return pipeline
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="데이터 증강 + 학습 파이프라인")
+    parser.add_argument('--force', nargs='*', default=[], help="강제로 다시 실행할 단계 이름")
+    args = parser.parse_args()
 
+    try:
+        build_pipeline().run(force=args.force)
+    except Exception as e:
+        print(f"오류: 파이프라인 실행 중 문제가 발생했습니다. ({e})")
+        print("완료된 단계는 기록되었으므로 다시 실행하면 이어서 진행합니다.")
+        sys.exit(1)
 
-# 1단계: COCO(.json) -> YOLO(.txt) 라벨 변환
-run_script('convert.py')
-
-# 2단계: Domain Randomization (학습 데이터만)
-randomize_data(ORIG_IMG_TRAIN, ORIG_LBL_TRAIN, RAND_IMG_TRAIN, RAND_LBL_TRAIN)
-
-# 3단계: Domain Adaptation (배경 교체, 학습 데이터만)
-adapt_data(RAND_IMG_TRAIN, RAND_LBL_TRAIN,
-           BG_IMG_DIR, AUG_IMG_TRAIN, AUG_LBL_TRAIN)
-
-# 4단계: 원본 검증 데이터 복사
-copy_validation_files(ORIG_IMG_VAL, ORIG_LBL_VAL, AUG_IMG_VAL, AUG_LBL_VAL)
-
-# 5단계: YOLOv8 모델 로드 및 학습
-model = YOLO('yolov8n.pt')
-
-print("--- 모델 학습 시작 ---")
-results = model.train(
-    data='./data_augmented.yaml',
-    epochs=5,
-    imgsz=640,
-    batch=16,
-    name='yolov8n_full_augmentation'
-)
-print("--- 모델 학습 완료 ---\n")
-
-# 6단계: 최종 결과 확인
-print("모든 파이프라인이 성공적으로 완료되었습니다!")
-print(f"학습 결과는 '{results.save_dir}'에 저장되었습니다.")
+    # 7단계: 최종 결과 확인
+    print("모든 파이프라인이 성공적으로 완료되었습니다!")
@@ -0,0 +1,174 @@
+import os
+import glob
+import json
+import hashlib
+import traceback
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+def _expand(path):
+    """경로/글롭 패턴을 실제 파일 목록으로 펼침 (디렉토리는 하위 전체)"""
+    if any(ch in path for ch in "*?["):
+        matches = glob.glob(path, recursive=True)
+    else:
+        matches = [path]
+
+    files = []
+    for match in matches:
+        if os.path.isdir(match):
+            for root, _, names in os.walk(match):
+                files.extend(os.path.join(root, name) for name in names)
+        elif os.path.exists(match):
+            files.append(match)
+    return sorted(files)
+
+
+def fingerprint(paths, params=None):
+    """
+    파일 목록(경로, 크기, mtime)과 파라미터로 만든 지문.
+    수만 장의 이미지를 매번 해시하지 않도록 파일 내용 대신 메타데이터를 사용한다.
+    """
+    h = hashlib.sha1()
+    for path in paths:
+        files = _expand(path)
+        h.update(f"{path}:{len(files)}\n".encode())
+        for f in files:
+            st = os.stat(f)
+            h.update(f"{f}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    h.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+class Stage:
+    """
+    파이프라인의 한 단계
+
+    Args:
+        name (str): 단계 이름 (상태 파일의 키)
+        func (callable): 실행할 함수, func(*args, **kwargs)
+        inputs (list): 입력 파일/디렉토리/글롭 패턴
+        outputs (list): 출력 파일/디렉토리/글롭 패턴
+        params (dict): 지문에 포함할 설정값 (예: 학습 하이퍼파라미터)
+        deps (list): 명시적으로 먼저 끝나야 하는 단계 이름
+    """
+
+    def __init__(self, name, func, args=(), kwargs=None, inputs=(), outputs=(), params=None, deps=()):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+        self.deps = set(deps)
+
+
+class Pipeline:
+    """
+    입력/출력 지문이 바뀐 단계만 다시 실행하는 DAG 실행기
+
+    - 단계가 끝날 때마다 상태 파일을 갱신하므로 중간에 죽어도 끝난 단계는 다시 하지 않음
+    - 서로 의존하지 않는 단계는 동시에 실행
+    - 한 단계의 출력이 다른 단계의 입력과 겹치면 자동으로 의존 관계가 생김
+    """
+
+    def __init__(self, state_path=".pipeline_state.json", max_workers=2):
+        self.state_path = state_path
+        self.max_workers = max_workers
+        self.stages = {}
+        self.state = {}
+        if os.path.exists(state_path):
+            with open(state_path, "r") as f:
+                self.state = json.load(f)
+
+    def add(self, stage):
+        self.stages[stage.name] = stage
+        return stage
+
+    def _save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def _dependencies(self, stage):
+        deps = set(stage.deps)
+        for other in self.stages.values():
+            if other is stage:
+                continue
+            if set(other.outputs) & set(stage.inputs):
+                deps.add(other.name)
+        return deps
+
+    def _is_fresh(self, stage):
+        record = self.state.get(stage.name)
+        if record is None:
+            return False
+        if record["inputs"] != fingerprint(stage.inputs, stage.params):
+            return False
+        return not stage.outputs or record["outputs"] == fingerprint(stage.outputs)
+
+    def _run_stage(self, stage, force):
+        """단계를 실행하고 상태 기록을 반환 (변경이 없어 건너뛰면 None)"""
+        if stage.name not in force and self._is_fresh(stage):
+            print(f"--- {stage.name}: 변경 없음, 건너뜀 ---")
+            return None
+
+        print(f"--- {stage.name} 실행 시작 ---")
+        input_fp = fingerprint(stage.inputs, stage.params)
+        stage.func(*stage.args, **stage.kwargs)
+        print(f"--- {stage.name} 실행 완료 ---\n")
+        return {"inputs": input_fp, "outputs": fingerprint(stage.outputs)}
+
+    def run(self, force=()):
+        """
+        모든 단계를 의존 순서대로 실행
+
+        Args:
+            force (iterable): 지문과 상관없이 다시 실행할 단계 이름
+        Returns:
+            dict: {단계 이름: 실제로 실행했는지 여부}
+        """
+        force = set(force)
+        deps = {name: self._dependencies(stage) for name, stage in self.stages.items()}
+        for name, stage_deps in deps.items():
+            unknown = stage_deps - set(self.stages)
+            if unknown:
+                raise ValueError(f"'{name}' 단계의 의존 단계가 없습니다: {sorted(unknown)}")
+
+        done, ran, running = set(), {}, {}
+        failed = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while running or (failed is None and len(done) < len(self.stages)):
+                for name, stage in self.stages.items():
+                    if failed is not None:
+                        break
+                    if name in done or name in running.values() or not deps[name] <= done:
+                        continue
+                    # 앞 단계가 다시 실행됐다면 이 단계도 강제로 다시 실행
+                    if any(ran.get(dep) for dep in deps[name]):
+                        force.add(name)
+                    running[pool.submit(self._run_stage, stage, force)] = name
+
+                if not running:
+                    raise ValueError(f"순환 의존이 있습니다: {sorted(set(self.stages) - done)}")
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        # 실패해도 이미 돌고 있는 단계는 끝까지 기다려 상태를 남김
+                        traceback.print_exc()
+                        failed = failed or e
+                        continue
+                    ran[name] = record is not None
+                    if record is not None:
+                        self.state[name] = record
+                    done.add(name)
+                    self._save_state()
+
+        if failed is not None:
+            raise failed
+        return ran